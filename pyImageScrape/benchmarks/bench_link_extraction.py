@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import pathlib
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
+
+from bs4 import BeautifulSoup
+from data_scraper.link_extractor import (
+    BeautifulSoupLinkExtractor,
+    SelectolaxLinkExtractor,
+)
+
+# ================================================================
+#
+# Benchmarks link extraction over a folder of saved html pages, or synthetic ones
+# Ex.  bench_link_extraction.py "F:/saved pages" --repeat 5
+# Ex.  bench_link_extraction.py --synthPages 200
+#
+# ================================================================
+
+
+def legacy_extract(content, pageUrl):
+    """the old URLScraper path: a fresh html.parser soup for <a href> and another for <img src>"""
+    results = []
+    for location, source in (("a", "href"), ("img", "src")):
+        soup = BeautifulSoup(content, features="html.parser")
+        urls = set()
+        for tag in soup.findAll(location):
+            src = tag.get(source)
+            if src:
+                if not (src.lower().startswith("http")):
+                    src = urllib.parse.urljoin(pageUrl, src)
+                urls.add(src)
+        results.append(urls)
+    return results[0], results[1]
+
+
+def build_synthetic_pages(pages, linksPerPage, picsPerPage):
+    """pages shaped like a gallery site: nav links, plain/lazy/srcset imgs, inline & <style> backgrounds"""
+    built = []
+    for page in range(pages):
+        links = "".join(
+            f'<li><a href="/page/{(page + i) % pages}?ref=nav">page {i}</a></li>' for i in range(linksPerPage)
+        )
+        pics = []
+        for i in range(picsPerPage):
+            pic = f"/pics/{page}/{i}"
+            if i % 4 == 0:
+                pics.append(f'<img src="{pic}.jpg" alt="pic {i}">')
+            elif i % 4 == 1:
+                pics.append(f'<img data-src="{pic}.jpg" class="lazy">')
+            elif i % 4 == 2:
+                pics.append(f'<picture><source srcset="{pic}-1x.webp 1x, {pic}-2x.webp 2x" type="image/webp"></picture>')
+            else:
+                pics.append(f'<div class="tile" style="background-image: url(\'{pic}.png\')"></div>')
+        built.append(
+            "<html><head><title>gallery</title>"
+            f"<style>.hero {{ background: url('/pics/{page}/hero.jpg') no-repeat; }}</style></head>"
+            f"<body><ul class=\"nav\">{links}</ul><main>{''.join(pics)}</main>"
+            f"<p>{'filler text ' * 50}</p></body></html>"
+        )
+    return built
+
+
+def build_candidates():
+    candidates = {"legacy bs4 html.parser x2": legacy_extract}
+    for name, features in (("bs4 html.parser", "html.parser"), ("bs4 lxml", "lxml")):
+        extractor = BeautifulSoupLinkExtractor(features)
+        try:
+            extractor.extract("<a href='/'></a>", "http://localhost/")
+        except Exception:
+            continue
+        candidates[name] = _wrap(extractor)
+    try:
+        extractor = SelectolaxLinkExtractor()
+        extractor.extract("<a href='/'></a>", "http://localhost/")
+        candidates["selectolax lexbor"] = _wrap(extractor)
+    except ImportError:
+        pass
+    return candidates
+
+
+def _wrap(extractor):
+    def extract(content, pageUrl):
+        links = extractor.extract(content, pageUrl)
+        return links.contentUrls, links.picUrls
+
+    return extract
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks link extractors on saved pages")
+    parser.add_argument("pagesFolder", nargs="?", help="folder of saved .html pages")
+    parser.add_argument(
+        "--synthPages", type=int, default=200, help="synthetic pages to run without a pagesFolder"
+    )
+    parser.add_argument("--linksPerPage", type=int, default=50, help="links on every synthetic page")
+    parser.add_argument("--picsPerPage", type=int, default=40, help="pics on every synthetic page")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the corpus")
+    parser.add_argument("--pageUrl", default="http://localhost/", help="url relative links resolve against")
+    args = parser.parse_args()
+
+    if args.pagesFolder is None:
+        pages = build_synthetic_pages(args.synthPages, args.linksPerPage, args.picsPerPage)
+    else:
+        pages = [
+            path.read_text(encoding="utf-8", errors="replace")
+            for path in sorted(pathlib.Path(args.pagesFolder).glob("**/*.htm*"))
+        ]
+    if len(pages) == 0:
+        print("no .html pages found")
+        return
+    totalBytes = sum(len(page) for page in pages)
+    print(f"{len(pages)} pages, {totalBytes / 1024 / 1024:.1f} MiB, {args.repeat} passes")
+
+    baseline = None
+    for name, extract in build_candidates().items():
+        linkCount = 0
+        picCount = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for page in pages:
+                contentUrls, picUrls = extract(page, args.pageUrl)
+                linkCount += len(contentUrls)
+                picCount += len(picUrls)
+        elapsed = time.perf_counter() - start
+        pagesPerSec = len(pages) * args.repeat / elapsed
+        baseline = baseline or pagesPerSec
+        print(
+            f"{name:28} {pagesPerSec:9.1f} pages/s  {pagesPerSec / baseline:5.1f}x"
+            f"  links={linkCount // args.repeat} pics={picCount // args.repeat}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import io
+import pathlib
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+
+CLI_PATH = pathlib.Path(__file__).parent.parent.absolute() / "scraper_cli.py"
+
+# ================================================================
+#
+# Benchmarks crawl throughput over a local synthetic site with 1..N worker processes
+# Ex.  bench_workers.py --pages 200 --picsPerPage 10 --latency 0.05 --workers 1 2 4
+#
+# ================================================================
+
+
+def build_site_handler(pages, picsPerPage, latency, picBytes):
+    """every page links to the next few pages and to picsPerPage pics of its own, / is page 0"""
+
+    class SiteHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # stands in for a remote server's response time
+            time.sleep(latency)
+            parts = self.path.strip("/").split("/")
+            if parts == [""]:
+                self._send(self._page(0).encode(), "text/html")
+            elif parts[0] == "page" and len(parts) == 2 and int(parts[1]) < pages:
+                self._send(self._page(int(parts[1])).encode(), "text/html")
+            elif parts[0] == "pic" and len(parts) == 2:
+                self._send(picBytes, "image/png")
+            else:
+                self.send_error(404)
+
+        def _page(self, page):
+            links = "".join(
+                f'<a href="/page/{(page * 3 + i) % pages}">page</a>' for i in range(1, 4)
+            )
+            pics = "".join(
+                f'<img src="/pic/{page * picsPerPage + i}.png">' for i in range(picsPerPage)
+            )
+            return f"<html><body>{links}{pics}</body></html>"
+
+        def _send(self, body, contentType):
+            self.send_response(200)
+            self.send_header("Content-Type", contentType)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SiteHandler
+
+
+def run_crawl(baseUrl, workers, ratePerHost):
+    """runs one crawl from scratch, returns (seconds, pics visited)"""
+    dataFolder = tempfile.mkdtemp(prefix="bench_workers_")
+    try:
+        start = time.perf_counter()
+        subprocess.run(
+            [
+                sys.executable,
+                str(CLI_PATH),
+                baseUrl,
+                "bench",
+                dataFolder,
+                "--workers",
+                str(workers),
+                "--ratePerHost",
+                str(ratePerHost),
+                "--maxRatePerHost",
+                str(ratePerHost),
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        elapsed = time.perf_counter() - start
+        conn = sqlite3.connect(dataFolder + "/sqllite.db")
+        visited = conn.execute("SELECT COUNT(*) FROM picUrls WHERE visited = 1;").fetchone()[0]
+        conn.close()
+        return elapsed, visited
+    finally:
+        shutil.rmtree(dataFolder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks crawl throughput by worker count")
+    parser.add_argument("--pages", type=int, default=200, help="pages on the synthetic site")
+    parser.add_argument("--picsPerPage", type=int, default=10, help="distinct pics on every page")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the site takes per response")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="worker counts to run")
+    parser.add_argument(
+        "--ratePerHost", type=float, default=1000.0, help="per host rate for the whole crawl"
+    )
+    args = parser.parse_args()
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (90, 140, 200)).save(buffer, format="png")
+    handler = build_site_handler(args.pages, args.picsPerPage, args.latency, buffer.getvalue())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    baseUrl = f"http://127.0.0.1:{server.server_address[1]}/"
+    print(f"{args.pages} pages, {args.pages * args.picsPerPage} pics, {args.latency}s latency")
+
+    baseline = None
+    for workers in args.workers:
+        elapsed, visited = run_crawl(baseUrl, workers, args.ratePerHost)
+        picsPerSec = visited / elapsed
+        baseline = baseline or picsPerSec
+        print(
+            f"{workers:3} workers {elapsed:8.1f}s {picsPerSec:9.1f} pics/s"
+            f"  {picsPerSec / baseline:5.1f}x  visited={visited}"
+        )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
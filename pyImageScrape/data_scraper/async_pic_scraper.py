@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import threading
+import time
+
+import aiohttp
+
+from concurrent.futures import ThreadPoolExecutor
+from shared import AsyncUrlScrapeJobConsumer, DataStore, FileStorage
+from data_scraper.pic_scraper import (
+    ImageScraper,
+    ImgNotModified,
+    ImgReqFailed,
+    PROCESSOR_INTERRUPTIONS,
+)
+from data_scraper.page_fetcher import get_response_validators
+
+
+class AsyncImageScraper(ImageScraper, AsyncUrlScrapeJobConsumer):
+    """
+    image scraper that downloads on an asyncio loop instead of one OS thread per image.
+    one aiohttp session (and so one keep-alive pool per host) is shared by every
+    download, maxConcurrency/maxPerHost cap the sockets open at once, and the
+    decode/encode/store work is handed off to a small thread pool (pair it with a
+    pooled ImageProcessor so the decode itself runs on other cores), as is every
+    other datastore call, so a slow datastore never stalls the loop.
+    """
+
+    def __init__(
+        self,
+        dataStore: DataStore,
+        fileStorage: FileStorage,
+        maxConcurrency=256,
+        maxPerHost=16,
+        cpuWorkers=4,
+        timeout=30,
+        **imageScraperArgs,
+    ):
+        super().__init__(dataStore, fileStorage, **imageScraperArgs)
+        self.maxConcurrency = maxConcurrency
+        self.maxPerHost = maxPerHost
+        self.timeout = timeout
+        self._cpuExec = ThreadPoolExecutor(max_workers=cpuWorkers)
+        self._loop = asyncio.new_event_loop()
+        self._loopThread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loopThread.start()
+        self._session = asyncio.run_coroutine_threadsafe(
+            self._build_session(), self._loop
+        ).result()
+
+    def submit_url(self, url):
+        """schedules the scrape on the loop, returns a concurrent future"""
+        return asyncio.run_coroutine_threadsafe(self.scrape_url_async(url), self._loop)
+
+    def scrape_url(self, url):
+        """blocking version, for callers that run their own threads"""
+        self.submit_url(url).result()
+
+    async def scrape_url_async(self, url):
+        """grabes image, checks it, and saves image to output directory"""
+        try:
+            content, validators = await self._get_image_async(url)
+            await self._run_blocking(self._save_image, url, content, validators)
+        except ImgNotModified as e:
+            await self._run_blocking(self._record_not_modified, url, e.validators)
+        except PROCESSOR_INTERRUPTIONS as e:
+            await self._run_blocking(self._record_interrupted, url, e)
+        except Exception as e:
+            await self._run_blocking(self._record_failure, url, e)
+
+    def close(self):
+        """closes the session, then stops the loop, the cpu pool and the image processor"""
+        asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loopThread.join()
+        self._loop.close()
+        self._cpuExec.shutdown(wait=True)
+        super().close()
+
+    def _get_failure_reason(self, e):
+        if isinstance(e, asyncio.TimeoutError):
+            return "TIMEOUT"
+        if isinstance(e, aiohttp.TooManyRedirects):
+            return "TOO_MANY_REDIRECT"
+        if isinstance(e, aiohttp.ClientError):
+            return "UNKNOWN_REQ_FAILURE"
+        return super()._get_failure_reason(e)
+
+    async def _run_blocking(self, fn, *args):
+        """runs a blocking call (datastore, decode, storage) on the thread pool"""
+        return await self._loop.run_in_executor(self._cpuExec, fn, *args)
+
+    async def _build_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.maxConcurrency,
+            limit_per_host=self.maxPerHost,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-agent": """Mozilla/5.0"""},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def _get_image_async(self, image_url):
+        """
+        streams the raw image bytes, bailing out early on small or huge images.
+        returns (bytes, response validators)
+        """
+        headers, validators = await self._run_blocking(self._get_request, image_url)
+        startedAt = time.monotonic()
+        try:
+            response = await self._session.get(image_url, headers=headers, max_redirects=5)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            self._notify_response(image_url, None, startedAt)
+            raise
+        async with response:
+            self._notify_response(
+                image_url, response.status, startedAt, response.headers.get("Retry-After")
+            )
+            if response.status == 304:
+                raise ImgNotModified(get_response_validators(response.headers) or validators)
+            # throw err if failed
+            if not response.status == 200:
+                raise ImgReqFailed(response.status)
+            self._check_content_length(response.headers.get("Content-Length"))
+
+            received = bytearray()
+            sizeChecked = False
+            async for chunk in response.content.iter_chunked(self.downloadChunkSize):
+                received += chunk
+                sizeChecked = self._check_partial_image(received, sizeChecked)
+            newValidators = get_response_validators(response.headers)
+        logging.debug(f"Downloaded pic {image_url=}")
+        return bytes(received), newValidators
@@ -7,108 +7,163 @@ import threading
 
 from shared import DataStore
 from typing import List
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 from shared import DataStore
 from threading import Semaphore
+from data_scraper.page_fetcher import (
+    HttpPageFetcher,
+    PageNotHtml,
+    PageNotModified,
+    PageTooLarge,
+    page_needs_js,
+)
+from data_scraper.driver_pool import DriverPool
+from data_scraper.link_extractor import ExtractedLinks, LinkExtractor, build_link_extractor
 
 # https://pillow.readthedocs.io/en/stable/handbook/image-file-formats.html
 IMG_FILE_TYPES = ["jpg", "jpeg", "jfif", "pjpeg", "pjp", "png", "webp"]
 
+# content fetch modes
+FETCH_HTTP = "http"
+FETCH_BROWSER = "browser"
+FETCH_AUTO = "auto"
+
 class URLScraper:
 
-    def __init__(self, dataStore: DataStore, baseUrl: str, redriectRetries: int = 3):
+    def __init__(
+        self,
+        dataStore: DataStore,
+        baseUrl: str,
+        redriectRetries: int = 3,
+        fetchMode: str = FETCH_AUTO,
+        httpFetcher: HttpPageFetcher = None,
+        driverPool: DriverPool = None,
+        linkExtractor: LinkExtractor = None,
+        conditionalRequests: bool = False,
+    ):
         self.dataStore = dataStore
-        self.driver = self._build_driver()
+        # browsers are only started once a page actually needs one
+        self.driverPool = driverPool if driverPool is not None else DriverPool()
         self.redriectRetries = redriectRetries
         self.baseUrl = baseUrl
-        self.lock = threading.Lock()
+        self.fetchMode = fetchMode
+        self.httpFetcher = httpFetcher if httpFetcher is not None else HttpPageFetcher()
+        self.linkExtractor = (
+            linkExtractor if linkExtractor is not None else build_link_extractor()
+        )
+        # recrawls ask whether a page changed since it was last fetched before re-parsing it
+        self.conditionalRequests = conditionalRequests
+        # in auto mode each domain sticks with whichever fetch mode worked on its first page
+        self._domainModes = {}
     
     def scrape_url(self, url):
         """scrapes urls of all img content & links to other pages"""
-        with self.lock: # Lock here since chrome driver likely won't thake multithreading well..
-            try:
-                # parse all content
-                changedUrl, content = self._get_content_from_url(url)
-                # store content and pics
-                self._store_content_urls(content, changedUrl)
-                self._store_pic_urls(content, changedUrl)
-                # mark current content url as visited
-                self.dataStore.add_visited_content_url(url)
-                logging.info(f"Scraped content {url=}")
-            except Exception as e:
-                # mark current content url as visited & failed
-                self.dataStore.add_visited_content_url(url, "Failed")
+        try:
+            validators = None
+            if self.conditionalRequests:
+                validators = self.dataStore.get_content_url_validators(url)
+            # parse all content, one pass for every link & pic on the page
+            changedUrl, content, newValidators = self._fetch_page(url, validators)
+            links = self.linkExtractor.extract(content, changedUrl)
+            # store content and pics
+            self._store_content_urls(links, url)
+            self._store_pic_urls(links, url)
+            if newValidators is not None:
+                self.dataStore.add_content_url_validators(url, *newValidators)
+            # mark current content url as visited
+            self.dataStore.add_visited_content_url(url)
+            logging.info(f"Scraped content {url=}")
+        except PageNotModified as e:
+            # its links are all in the frontier already, nothing to re-parse
+            self.dataStore.add_content_url_validators(url, *e.validators)
+            self.dataStore.add_visited_content_url(url)
+            logging.info(f"Content unchanged {url=}")
+        except Exception as e:
+            # mark current content url as visited & failed
+            logging.info(f"Failed to scrape content {url=} {e=}")
+            self.dataStore.add_visited_content_url(url, "Failed")
+
+    def close(self):
+        """shuts down the browsers"""
+        self.driverPool.close()
+
+    def _fetch_page(self, url, validators=None):
+        """
+        gets page content over plain http when possible, through the browser when needed.
+        returns (final url, html, response validators), raises PageNotModified when
+        validators were given and the page hasn't changed.
+        """
+        mode = self.fetchMode
+        if mode == FETCH_AUTO:
+            domain = urllib.parse.urlparse(url).netloc.lower()
+            mode = self._domainModes.get(domain, FETCH_AUTO)
+        if mode == FETCH_HTTP:
+            return self.httpFetcher.fetch(url, validators)
+        if mode == FETCH_BROWSER:
+            newValidators = None
+            if validators is not None:
+                # browsers can't send conditional requests, ask over plain http whether it changed
+                _, _, newValidators = self.httpFetcher.fetch(url, validators)
+            return self._get_content_from_browser(url, newValidators)
+
+        # domain not decided yet, try the cheap path first
+        try:
+            changedUrl, content, newValidators = self.httpFetcher.fetch(url, validators)
+            if not page_needs_js(content):
+                self._domainModes[domain] = FETCH_HTTP
+                logging.info(f"Fetching {domain=} over plain http")
+                return changedUrl, content, newValidators
+        except (PageNotModified, PageNotHtml, PageTooLarge):
+            # a download or a huge file, rendering it wouldn't turn it into a page
+            raise
+        except Exception as e:
+            logging.debug(f"Plain http fetch failed, trying the browser {url=} {e=}")
+            return self._get_content_from_browser(url)
+        self._domainModes[domain] = FETCH_BROWSER
+        logging.info(f"Fetching {domain=} through the browser")
+        return self._get_content_from_browser(url, newValidators)
 
-            # TODO HACK: remake driver if too many tabs (need better way to do this, possibly keep track of current tab and close all others)
-            if len(self.driver.window_handles) > 10:
-                self.driver.quit()
-                self.driver = self._build_driver()
+    def _get_content_from_browser(self, url, validators=None):
+        """renders the page in a headless browser checked out of the pool"""
+        with self.driverPool.driver() as driver:
+            changedUrl, content = self._get_content_from_url(url, driver)
+        return changedUrl, content, validators
 
-    def _store_content_urls(self, content, url):
-        """gets content URLs from the page content & stores them in the datasource"""
-        # get + save content URLs
-        content_urls = self._parse_urls(
-            content=content,
-            locations=["a"],
-            sources=["href"],
-            urlLoc=url,
+    def _store_content_urls(self, links: ExtractedLinks, parentUrl):
+        """stores the page's content URLs in the datasource"""
+        newContent = self.dataStore.add_to_visit_content_urls(
+            self._clean_content_urls(links.contentUrls), parentUrl
         )
-        self.dataStore.add_to_visit_content_urls(self._clean_content_urls(content_urls))
         # Slight hack: some content urls are actually pics, add those as pics as well to check them
-        self.dataStore.add_to_visit_pic_urls(self._get_pic_content_urls(content_urls))
-
-    def _store_pic_urls(self, content, url):
-        """gets pic URLs from the page content & stores them in the datasource"""
-        # get + save image URLs
-        image_urls = self._parse_urls(
-            content=content,
-            locations=["img"],
-            sources=["src"],
-            urlLoc=url,
+        newPics = self.dataStore.add_to_visit_pic_urls(
+            self._get_pic_content_urls(links.contentUrls), parentUrl
         )
-        self.dataStore.add_to_visit_pic_urls(image_urls)
+        logging.debug(f"Frontier grew {parentUrl=} {newContent=} {newPics=}")
+
+    def _store_pic_urls(self, links: ExtractedLinks, parentUrl):
+        """stores the page's pic URLs in the datasource"""
+        newPics = self.dataStore.add_to_visit_pic_urls(links.picUrls, parentUrl)
+        logging.debug(f"Frontier grew {parentUrl=} {newPics=}")
 
-    def _get_content_from_url(self, url):
+    def _get_content_from_url(self, url, driver):
         """grabs page content from url. allows retries if the site attempts redirects."""
         tries = 0
         currentUrl = None
         page_content = None
         # get content
         while tries <= self.redriectRetries and not (currentUrl == url):
-            self.driver.get(url)
+            driver.get(url)
             try:
-                self.driver.execute_script(
+                driver.execute_script(
                     "window.scrollTo(0, document.body.scrollHeight);"
                 )
             except Exception:
                 pass
-            page_content = self.driver.page_source
-            currentUrl = self.driver.current_url
+            page_content = driver.page_source
+            currentUrl = driver.current_url
             tries += 1
         return currentUrl, page_content
 
-    def _parse_urls(self, content, locations, sources, urlLoc):
-        """parses urls out of page content"""
-        soup = BeautifulSoup(content, features="html.parser")
-        results = set()
-        for location in locations:
-            allLocations = soup.findAll(location)
-            for a in allLocations:
-                if a not in results:
-                    for source in sources:
-                        src = a.get(source)
-                        if src:
-                            try:
-                                if not (src.lower().startswith("http")):
-                                    src = urllib.parse.urljoin(urlLoc, src)
-                                results.add(src)
-                            except Exception as e:
-                                print(e)
-        return results
-
-    # TODO: remove element id from links (ex. http://localhost/hi#test)
+    # fragments & other url variants are canonicalized by the datastore (see CanonicalizingDataStore)
     def _clean_content_urls(self, urls: List[str]):
         """cleans out all content urls of 'bad' ones"""
         cleanList = []
@@ -128,15 +183,3 @@ class URLScraper:
                         if urlType.lower().endswith(typee):
                             cleanList.append(url)
         return cleanList
-
-    def _build_driver(self):
-        """builds a headless browser with downloads turned off"""
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_experimental_option(
-            "prefs",
-            {
-                "download_restrictions": 3,
-            },
-        )
-        return webdriver.Chrome(options=chrome_options)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+from collections import OrderedDict
+from shared import DataStore
+from datasource.bloom_filter import BloomFilter
+
+
+class ContentDedupIndex:
+    """
+    tells whether an image with the same raw bytes sha has already been stored.
+    a bloom filter over every stored sha sits in memory, only bloom hits are
+    confirmed against the datastore (which is what persists the index), and
+    shas stored by this process are kept exactly so unflushed writes still count.
+    """
+
+    def __init__(
+        self,
+        dataStore: DataStore,
+        capacity=10_000_000,
+        falsePositiveRate=0.001,
+        recentSize=100_000,
+    ):
+        self.dataStore = dataStore
+        self.recentSize = recentSize
+        self._bloom = BloomFilter(capacity, falsePositiveRate)
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def contains(self, shaPicHash: str):
+        """True if a pic with this sha has already been stored"""
+        with self._lock:
+            if shaPicHash in self._recent:
+                return True
+            if shaPicHash not in self._bloom:
+                return False
+        # bloom says maybe, the datastore decides
+        return self.dataStore.get_stored_pic_path(shaPicHash) is not None
+
+    def add(self, shaPicHash: str):
+        with self._lock:
+            self._bloom.add(shaPicHash)
+            self._recent[shaPicHash] = True
+            if len(self._recent) > self.recentSize:
+                self._recent.popitem(last=False)
+
+    def _load(self):
+        """fills the bloom filter from what the datastore already holds"""
+        for shaPicHash in self.dataStore.get_stored_pic_hashes():
+            self._bloom.add(shaPicHash)
+        logging.info(f"Loaded dedup index with {len(self._bloom)} stored pics")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import queue
+import threading
+
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+MEMORY_SCRIPT = "return window.performance && performance.memory ? performance.memory.usedJSHeapSize : 0;"
+
+
+def build_chrome_driver():
+    """builds a headless browser with downloads turned off"""
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_experimental_option(
+        "prefs",
+        {
+            "download_restrictions": 3,
+        },
+    )
+    return webdriver.Chrome(options=chrome_options)
+
+
+class DriverPool:
+    """
+    pool of up to size browser drivers, checked out one per page render.
+    drivers are built lazily, health checked on checkout, and recycled on
+    checkin once they've rendered maxPagesPerDriver pages, grown past
+    maxMemoryMb of js heap or piled up too many windows. crashed drivers
+    are dropped and a fresh one is built in their place.
+    """
+
+    def __init__(
+        self,
+        size=1,
+        maxPagesPerDriver=200,
+        maxMemoryMb=1024,
+        maxWindows=10,
+        driverFactory=build_chrome_driver,
+    ):
+        self.size = size
+        self.maxPagesPerDriver = maxPagesPerDriver
+        self.maxMemoryMb = maxMemoryMb
+        self.maxWindows = maxWindows
+        self.driverFactory = driverFactory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+        self._pagesServed = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextmanager
+    def driver(self):
+        """checks a driver out for the duration of the with block"""
+        driver = self.checkout()
+        try:
+            yield driver
+        finally:
+            self.checkin(driver)
+
+    def checkout(self):
+        """gets a healthy driver, waiting if all of them are busy"""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    driver = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._build()
+                if self._is_healthy(driver):
+                    return driver
+                logging.warning("Replacing crashed browser driver")
+                self._discard(driver)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, driver):
+        """returns a driver to the pool, recycling it if it's worn out or broken"""
+        try:
+            with self._lock:
+                self._pagesServed[id(driver)] = self._pagesServed.get(id(driver), 0) + 1
+                pages = self._pagesServed[id(driver)]
+            if self._closed or self._should_recycle(driver, pages):
+                self._discard(driver)
+            else:
+                self._idle.put(driver)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """quits every idle driver, busy ones are quit when checked back in"""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _build(self):
+        driver = self.driverFactory()
+        with self._lock:
+            self._pagesServed[id(driver)] = 0
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._pagesServed.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def _is_healthy(self, driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _should_recycle(self, driver, pages):
+        if pages >= self.maxPagesPerDriver:
+            return True
+        try:
+            if len(driver.window_handles) > self.maxWindows:
+                return True
+            usedBytes = driver.execute_script(MEMORY_SCRIPT) or 0
+            return usedBytes > self.maxMemoryMb * 1024 * 1024
+        except Exception:
+            # can't even ask, treat it as crashed
+            return True
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+
+# jpeg start-of-frame markers, C4 (DHT), C8 (JPG) and CC (DAC) share the range but aren't frames
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def probe_image_size(head: bytes):
+    """
+    reads (width, height) from the first bytes of a png, jpeg, webp or gif file.
+    returns None when the format isn't known or the dimensions aren't in head yet.
+    """
+    head = bytes(head)
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return _probe_png(head)
+    if head.startswith(b"\xff\xd8"):
+        return _probe_jpeg(head)
+    if head[0:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return _probe_webp(head)
+    if head[0:6] in (b"GIF87a", b"GIF89a"):
+        return _probe_gif(head)
+    return None
+
+
+def _probe_png(head):
+    # IHDR is always the first chunk, width/height are its first two fields
+    if len(head) < 24 or head[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", head[16:24])
+
+
+def _probe_jpeg(head):
+    # walk the marker segments until a start-of-frame shows up
+    pos = 2
+    while pos + 4 <= len(head):
+        if head[pos] != 0xFF:
+            return None
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            # markers without a length
+            pos += 2
+            continue
+        segmentLength = struct.unpack(">H", head[pos + 2:pos + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if pos + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + segmentLength
+    return None
+
+
+def _probe_webp(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 " and len(head) >= 30:
+        # lossy: 14 bit dims after the 3 byte frame tag and 3 byte start code
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        # lossless: 14 bit (dim - 1) fields packed after the 0x2f signature
+        bits = struct.unpack("<I", head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(head) >= 30:
+        # extended: 24 bit (dim - 1) canvas size
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    return None
+
+
+def _probe_gif(head):
+    if len(head) < 10:
+        return None
+    return struct.unpack("<HH", head[6:10])
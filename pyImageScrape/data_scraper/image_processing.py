@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from PIL import Image
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# re-encode every pic to the output type
+OUTPUT_REENCODE = "reencode"
+# keep the original bytes when the pic already is an allowed format, re-encode the rest
+OUTPUT_PASSTHROUGH = "passthrough"
+OUTPUT_POLICIES = (OUTPUT_REENCODE, OUTPUT_PASSTHROUGH)
+PASSTHROUGH_FORMATS = ("jpeg", "png", "webp", "gif")
+# file extension for each pillow format name
+FORMAT_EXTENSIONS = {"jpeg": "jpg", "png": "png", "webp": "webp", "gif": "gif"}
+# file types pics can be re-encoded to
+OUTPUT_TYPES = ("png", "jpg", "jpeg", "webp", "gif")
+
+
+class ImgTooSmall(Exception):
+    def __init__(self, width, height):
+        # pass args up so the exception survives pickling back from a worker process
+        super().__init__(width, height)
+        self.width = width
+        self.height = height
+
+
+class ProcessedImage:
+    """
+    bytes to store with their file type, the size of the source image, its dHash
+    if asked for and how long decode + encode took (just the decode for a pass-through)
+    """
+
+    def __init__(
+        self,
+        imageBytes: bytes,
+        width: int,
+        height: int,
+        perceptualHash=None,
+        fileType: str = None,
+        encodeSeconds: float = 0.0,
+    ):
+        self.imageBytes = imageBytes
+        self.width = width
+        self.height = height
+        self.perceptualHash = perceptualHash
+        self.fileType = fileType
+        self.encodeSeconds = encodeSeconds
+
+
+def dhash(image: Image.Image, hashSize=8):
+    """
+    difference hash: shrink to (hashSize + 1) x hashSize greyscale and record whether
+    each pixel is brighter than its right neighbour. resizes and re-compressions of
+    the same picture land within a few bits of each other.
+    """
+    small = image.convert("L").resize((hashSize + 1, hashSize), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hashSize):
+        rowStart = row * (hashSize + 1)
+        for col in range(hashSize):
+            value = (value << 1) | (pixels[rowStart + col] > pixels[rowStart + col + 1])
+    return value
+
+
+def get_pillow_format(fileType: str):
+    """pillow's name for a file type, jpg -> jpeg"""
+    fileType = fileType.lower()
+    return "jpeg" if fileType == "jpg" else fileType
+
+
+def process_image(
+    image_content: bytes,
+    imageMinWidth,
+    imageMinHeight,
+    outputType,
+    perceptualHash=False,
+    outputPolicy=OUTPUT_REENCODE,
+    outputQuality=None,
+    maxDimension=None,
+    passthroughFormats=PASSTHROUGH_FORMATS,
+):
+    """
+    validates one image and gets the bytes to store: the original bytes when the
+    policy passes its format through, otherwise re-encoded to outputType (at
+    outputQuality for lossy types), downscaled to fit maxDimension. jpegs are
+    decoded straight at a reduced scale through draft(). runs inside pool
+    workers, so it only touches its args
+    """
+    image = Image.open(io.BytesIO(image_content))
+
+    # throw err if img is too small to care about, the header has the size
+    width, height = image.size
+    if width <= imageMinWidth or height <= imageMinHeight:
+        raise ImgTooSmall(width, height)
+
+    sourceFormat = (image.format or "").lower()
+    tooLarge = maxDimension is not None and max(width, height) > maxDimension
+    startedAt = time.perf_counter()
+    if outputPolicy == OUTPUT_PASSTHROUGH and sourceFormat in passthroughFormats and not tooLarge:
+        # the header alone passes truncated or corrupt files, decode them fully before keeping them
+        image.load()
+        return ProcessedImage(
+            image_content,
+            width,
+            height,
+            dhash(image) if perceptualHash else None,
+            FORMAT_EXTENSIONS.get(sourceFormat, sourceFormat),
+            time.perf_counter() - startedAt,
+        )
+
+    if tooLarge:
+        # jpeg decodes at 1/2, 1/4 or 1/8 scale, the rest is a no-op
+        image.draft("RGB", (maxDimension, maxDimension))
+    image = image.convert("RGB")
+    if tooLarge:
+        image.thumbnail((maxDimension, maxDimension), Image.LANCZOS, reducing_gap=2.0)
+
+    # save img to buffer
+    pillowFormat = get_pillow_format(outputType)
+    saveArgs = {}
+    if outputQuality is not None and pillowFormat in ("jpeg", "webp"):
+        saveArgs["quality"] = outputQuality
+    buffer = io.BytesIO()
+    image.save(buffer, format=pillowFormat, **saveArgs)
+    return ProcessedImage(
+        buffer.getvalue(),
+        width,
+        height,
+        dhash(image) if perceptualHash else None,
+        outputType,
+        time.perf_counter() - startedAt,
+    )
+
+
+def ignore_sigint():
+    """pool worker initializer. ctrl+c reaches the whole process group, only the parent should act on it"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class ImageProcessor:
+    """
+    runs the decode/validate/encode stage of the pic pipeline.
+    with processes > 0 the work goes to a ProcessPoolExecutor sized apart from
+    the download threads, so image work scales with cores instead of fighting
+    the downloads for the GIL. the raw bytes are handed to the worker as-is,
+    so they're pickled once on the way in and the encoded bytes once on the way out.
+    with processes = 0 everything runs inline on the calling thread.
+    the workers ignore SIGINT so a ctrl+c drain can still finish the images in
+    flight, and a pool broken by a killed worker is replaced on the next submit.
+    """
+
+    def __init__(self, processes=None, mpContext="spawn"):
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.mpContext = mpContext
+        self._pool = None
+        self._poolLock = threading.Lock()
+        if self.processes > 0:
+            self._pool = self._build_pool()
+
+    def submit(self, image_content: bytes, *processArgs):
+        """starts processing an image, returns a future of ProcessedImage. takes process_image's args"""
+        if self._pool is not None:
+            pool = self._pool
+            try:
+                return pool.submit(process_image, image_content, *processArgs)
+            except BrokenProcessPool:
+                return self._replace_pool(pool).submit(process_image, image_content, *processArgs)
+        future = Future()
+        try:
+            future.set_result(process_image(image_content, *processArgs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def process(self, image_content: bytes, *processArgs):
+        """processes an image, blocking until it's done"""
+        return self.submit(image_content, *processArgs).result()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def _build_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context(self.mpContext),
+            initializer=ignore_sigint,
+        )
+
+    def _replace_pool(self, brokenPool):
+        """swaps a broken pool for a fresh one, once no matter how many threads notice"""
+        with self._poolLock:
+            if self._pool is brokenPool:
+                logging.warning("Image process pool broke, starting a new one")
+                self._pool = self._build_pool()
+                brokenPool.shutdown(wait=False)
+            return self._pool
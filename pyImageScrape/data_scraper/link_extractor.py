@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import urllib.parse
+
+from abc import ABC, abstractmethod
+from bs4 import BeautifulSoup
+
+# attributes that lazy loading scripts park the real image url in
+LAZY_SRC_ATTRS = ["data-src", "data-lazy-src", "data-original", "data-lazy", "data-bg"]
+LAZY_SRCSET_ATTRS = ["data-srcset", "data-lazy-srcset"]
+CSS_URL = re.compile(r"""url\(\s*['"]?([^'")]+?)['"]?\s*\)""", re.IGNORECASE)
+SKIPPED_SCHEMES = ("data:", "javascript:", "mailto:", "tel:", "about:", "blob:")
+# a srcset candidate's url, after the commas & whitespace separating it from the last one
+SRCSET_URL = re.compile(r"[\s,]*(\S+)")
+
+
+class ExtractedLinks:
+    """every link and image reference found on one page"""
+
+    def __init__(self):
+        self.contentUrls = set()
+        self.picUrls = set()
+
+
+def parse_srcset(srcset: str):
+    """
+    urls out of a srcset, dropping the width/density descriptors. parsed the way
+    browsers do: a url runs to the next whitespace, commas inside it are kept,
+    and only trailing commas or the comma after its descriptors end a candidate.
+    """
+    urls = []
+    pos = 0
+    while True:
+        match = SRCSET_URL.match(srcset, pos)
+        if match is None:
+            return urls
+        url = match.group(1)
+        pos = match.end()
+        if url.endswith(","):
+            url = url.rstrip(",")
+        else:
+            comma = srcset.find(",", pos)
+            pos = len(srcset) if comma == -1 else comma + 1
+        if url:
+            urls.append(url)
+
+
+def collect_tag_links(tagName: str, attrs, pageUrl: str, links: ExtractedLinks):
+    """
+    files the references held by one tag into links. attrs is the tag's
+    attribute mapping, so every parser backend shares the same rules.
+    """
+    getAttr = attrs.get
+    if tagName == "a":
+        _add(links.contentUrls, getAttr("href"), pageUrl)
+    if tagName == "img":
+        _add(links.picUrls, getAttr("src"), pageUrl)
+    if tagName in ("img", "source"):
+        srcset = getAttr("srcset")
+        if srcset:
+            for src in parse_srcset(srcset):
+                _add(links.picUrls, src, pageUrl)
+    if tagName == "source" and (getAttr("type") or "").startswith("image/"):
+        _add(links.picUrls, getAttr("src"), pageUrl)
+    for attr in LAZY_SRC_ATTRS:
+        _add(links.picUrls, getAttr(attr), pageUrl)
+    for attr in LAZY_SRCSET_ATTRS:
+        srcset = getAttr(attr)
+        if srcset:
+            for src in parse_srcset(srcset):
+                _add(links.picUrls, src, pageUrl)
+    collect_css_links(getAttr("style"), pageUrl, links)
+
+
+def collect_css_links(css, pageUrl: str, links: ExtractedLinks):
+    """files the url() references of a style attribute or <style> block as pics"""
+    if css and "url(" in css.lower():
+        for src in CSS_URL.findall(css):
+            _add(links.picUrls, src, pageUrl)
+
+
+def _add(results: set, src, pageUrl: str):
+    if not src:
+        return
+    src = src.strip()
+    if not src or src.lower().startswith(SKIPPED_SCHEMES):
+        return
+    try:
+        if not (src.lower().startswith("http")):
+            src = urllib.parse.urljoin(pageUrl, src)
+        results.add(src)
+    except ValueError:
+        pass
+
+
+class LinkExtractor(ABC):
+
+    @abstractmethod
+    def extract(self, content: str, pageUrl: str) -> ExtractedLinks:
+        """parses the page once and returns every link and image reference on it"""
+
+
+class BeautifulSoupLinkExtractor(LinkExtractor):
+    """single bs4 parse, lxml when it's installed since it's several times faster than html.parser"""
+
+    def __init__(self, features=None):
+        if features is None:
+            try:
+                import lxml  # noqa: F401
+
+                features = "lxml"
+            except ImportError:
+                features = "html.parser"
+        self.features = features
+
+    def extract(self, content, pageUrl):
+        links = ExtractedLinks()
+        for tag in BeautifulSoup(content, features=self.features).find_all(True):
+            if tag.attrs:
+                collect_tag_links(tag.name, tag.attrs, pageUrl, links)
+            if tag.name == "style":
+                collect_css_links(tag.string, pageUrl, links)
+        return links
+
+
+class SelectolaxLinkExtractor(LinkExtractor):
+    """lexbor backed parser, walks the tree once in c"""
+
+    def extract(self, content, pageUrl):
+        from selectolax.lexbor import LexborHTMLParser
+
+        links = ExtractedLinks()
+        root = LexborHTMLParser(content).root
+        if root is None:
+            return links
+        for node in root.traverse():
+            attrs = node.attributes
+            if attrs:
+                collect_tag_links(node.tag, attrs, pageUrl, links)
+            if node.tag == "style":
+                collect_css_links(node.text(), pageUrl, links)
+        return links
+
+
+def build_link_extractor():
+    """fastest extractor whose parser is installed"""
+    try:
+        import selectolax.lexbor  # noqa: F401
+
+        return SelectolaxLinkExtractor()
+    except ImportError:
+        return BeautifulSoupLinkExtractor()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+import numpy as np
+
+from shared import DataStore
+
+# popcount of every byte value, used when numpy has no bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(a: np.ndarray, b: np.ndarray):
+    """bit distance between two broadcastable uint64 arrays"""
+    xor = np.bitwise_xor(a, b)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor)
+    xor = np.ascontiguousarray(xor)
+    return _BYTE_POPCOUNT[xor.view(np.uint8)].reshape(xor.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+class NearDuplicateIndex:
+    """
+    holds the 64 bit perceptual hash of every stored pic in one packed uint64 array
+    and answers hamming-distance nearest neighbour queries against all of them at
+    once. the datastore persists the hashes and the index loads them back in bulk.
+    """
+
+    def __init__(
+        self,
+        dataStore: DataStore,
+        maxDistance=6,
+        initialCapacity=1 << 16,
+        maxChunkCells=1 << 22,
+    ):
+        self.dataStore = dataStore
+        self.maxDistance = maxDistance
+        self.maxChunkCells = maxChunkCells
+        self._hashes = np.zeros(initialCapacity, dtype=np.uint64)
+        self._shas = []
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self):
+        return len(self._shas)
+
+    def find_near(self, perceptualHash: int):
+        """sha of the closest stored pic within maxDistance bits, None if there isn't one"""
+        return self.find_near_many([perceptualHash])[0]
+
+    def find_near_many(self, perceptualHashes):
+        """
+        find_near for a batch of hashes. queries x index distances are computed in
+        chunks of at most maxChunkCells cells, keeping the best match per query.
+        """
+        queries = np.array(perceptualHashes, dtype=np.uint64).reshape(-1, 1)
+        with self._lock:
+            count = len(self._shas)
+            hashes = self._hashes[:count]
+        bestDistance = np.full(len(queries), 65, dtype=np.uint8)
+        bestIndex = np.zeros(len(queries), dtype=np.int64)
+        chunk = max(1, self.maxChunkCells // max(1, len(queries)))
+        for start in range(0, count, chunk):
+            distances = hamming_distances(hashes[start : start + chunk], queries)
+            nearest = np.argmin(distances, axis=1)
+            nearestDistance = distances[np.arange(len(queries)), nearest]
+            better = nearestDistance < bestDistance
+            bestDistance[better] = nearestDistance[better]
+            bestIndex[better] = nearest[better] + start
+        # _shas is append only, so the first count entries still line up with hashes
+        return [
+            self._shas[index] if distance <= self.maxDistance else None
+            for index, distance in zip(bestIndex, bestDistance)
+        ]
+
+    def add(self, shaPicHash: str, perceptualHash: int):
+        """adds the hash to the index, the caller persists it in the datastore"""
+        with self._lock:
+            self._append([shaPicHash], np.array([perceptualHash], dtype=np.uint64))
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _append(self, shas, hashes: np.ndarray):
+        """called holding self._lock"""
+        count = len(self._shas)
+        needed = count + len(hashes)
+        if needed > len(self._hashes):
+            grown = np.zeros(max(needed, len(self._hashes) * 2), dtype=np.uint64)
+            grown[:count] = self._hashes[:count]
+            self._hashes = grown
+        self._hashes[count:needed] = hashes
+        self._shas.extend(shas)
+
+    def _load(self, batchSize=100_000):
+        """bulk loads the persisted hashes, batch by batch straight into the array"""
+        shas = []
+        hashes = []
+        with self._lock:
+            for shaPicHash, perceptualHash in self.dataStore.get_pic_perceptual_hashes():
+                shas.append(shaPicHash)
+                hashes.append(perceptualHash)
+                if len(shas) >= batchSize:
+                    self._append(shas, np.array(hashes, dtype=np.uint64))
+                    shas, hashes = [], []
+            if len(shas) > 0:
+                self._append(shas, np.array(hashes, dtype=np.uint64))
+        logging.info(f"Loaded near duplicate index with {len(self._shas)} pics")
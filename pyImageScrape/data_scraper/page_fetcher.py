@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+import requests
+
+# content types worth parsing for links, anything else is a download the browser would refuse too
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+
+class PageReqFailed(Exception):
+    def __init__(self, statusCode):
+        self.statusCode = statusCode
+
+
+class PageNotHtml(Exception):
+    def __init__(self, contentType):
+        self.contentType = contentType
+
+
+class PageTooLarge(Exception):
+    def __init__(self, contentLength):
+        self.contentLength = contentLength
+
+
+class PageNotModified(Exception):
+    """the server answered a conditional request with 304, validators are the ones it sent back"""
+
+    def __init__(self, validators):
+        self.validators = validators
+
+
+def build_conditional_headers(validators):
+    """If-None-Match / If-Modified-Since from stored (etag, lastModified), either can be None"""
+    headers = {}
+    if validators is None:
+        return headers
+    etag, lastModified = validators
+    if etag:
+        headers["If-None-Match"] = etag
+    if lastModified:
+        headers["If-Modified-Since"] = lastModified
+    return headers
+
+
+def get_response_validators(headers):
+    """(etag, lastModified) of a response, None when the server sent neither"""
+    etag = headers.get("ETag")
+    lastModified = headers.get("Last-Modified")
+    if etag is None and lastModified is None:
+        return None
+    return etag, lastModified
+
+
+def page_needs_js(content: str, minTags=5):
+    """
+    rough guess at whether a page only fills itself in with javascript.
+    pages with hardly any <a>/<img> tags, or a <noscript> shell around a thin
+    body, are probably rendered client side.
+    """
+    lowered = content.lower()
+    tagCount = lowered.count("<a ") + lowered.count("<a>") + lowered.count("<img")
+    if tagCount < minTags:
+        return True
+    if "<noscript" in lowered and tagCount < minTags * 4:
+        return True
+    return False
+
+
+class HttpPageFetcher:
+    """
+    fetches page html with a plain GET, no rendering.
+    each thread keeps its own pooled session so connections stay alive between pages.
+    the body is streamed, anything that isn't html is refused from its headers
+    before a byte of it is read, and pages past maxContentLength are cut off.
+    """
+
+    def __init__(self, timeout=30, maxRedirects=5, maxContentLength=10 * 1024 * 1024, chunkSize=64 * 1024):
+        self.timeout = timeout
+        self.maxRedirects = maxRedirects
+        self.maxContentLength = maxContentLength
+        self.chunkSize = chunkSize
+        self._local = threading.local()
+
+    def fetch(self, url, validators=None):
+        """
+        returns (final url after redirects, html, response validators).
+        given the validators of an earlier fetch the request is conditional,
+        and an unchanged page raises PageNotModified.
+        """
+        headers = {"User-agent": """Mozilla/5.0"""}
+        headers.update(build_conditional_headers(validators))
+        response = self._get_session().get(
+            url, headers=headers, timeout=self.timeout, stream=True
+        )
+        with response:
+            if response.status_code == requests.codes.not_modified:
+                raise PageNotModified(get_response_validators(response.headers) or validators)
+            if not response.status_code == requests.codes.ok:
+                raise PageReqFailed(response.status_code)
+            self._check_headers(response.headers)
+            body = bytearray()
+            for chunk in response.iter_content(self.chunkSize):
+                body += chunk
+                if len(body) > self.maxContentLength:
+                    raise PageTooLarge(len(body))
+            # requests' own default when the server names no charset
+            content = bytes(body).decode(response.encoding or "utf-8", errors="replace")
+        return response.url, content, get_response_validators(response.headers)
+
+    def _check_headers(self, headers):
+        """refuses non html pages and ones announced as too large before the body is read"""
+        # a missing content type is left to the parser, plenty of small servers send none
+        contentType = headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if contentType and contentType not in HTML_CONTENT_TYPES:
+            raise PageNotHtml(contentType)
+        contentLength = headers.get("Content-Length")
+        if contentLength is not None and contentLength.isdigit():
+            if int(contentLength) > self.maxContentLength:
+                raise PageTooLarge(int(contentLength))
+
+    def _get_session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.max_redirects = self.maxRedirects
+            self._local.session = session
+        return session
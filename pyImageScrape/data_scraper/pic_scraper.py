@@ -7,9 +7,21 @@ import requests
 import os
 import urllib
 import logging
+import threading
+import time
 
-from PIL import Image
+from concurrent.futures.process import BrokenProcessPool
 from shared import DataStore, FileStorage
+from data_scraper.image_processing import (
+    ImageProcessor,
+    ImgTooSmall,
+    OUTPUT_REENCODE,
+    PASSTHROUGH_FORMATS,
+)
+from data_scraper.image_probe import probe_image_size
+from data_scraper.dedup_index import ContentDedupIndex
+from data_scraper.retry_policy import RetryPolicy
+from data_scraper.page_fetcher import build_conditional_headers, get_response_validators
 
 
 def build_base_url(url: str):
@@ -26,15 +38,33 @@ def mkdirs_if_needed(path: str):
         os.makedirs(path)
 
 
+# the image process pool broke or a worker was interrupted, the pic itself is fine
+PROCESSOR_INTERRUPTIONS = (BrokenProcessPool, KeyboardInterrupt)
+
+
 class ImgReqFailed(Exception):
     def __init__(self, statusCode):
         self.statusCode = statusCode
 
 
-class ImgTooSmall(Exception):
-    def __init__(self, width, height):
-        self.width = width
-        self.height = height
+class ImgNearDuplicate(Exception):
+    def __init__(self, shaPicHash):
+        self.shaPicHash = shaPicHash
+
+
+class ImgTooLarge(Exception):
+    def __init__(self, contentLength):
+        self.contentLength = contentLength
+
+
+class ImgNotModified(Exception):
+    def __init__(self, validators):
+        self.validators = validators
+
+
+class ImgStoreFailed(Exception):
+    def __init__(self, cause):
+        self.cause = cause
 
 
 class ImageScraper:
@@ -46,74 +76,272 @@ class ImageScraper:
         imageMinWidth=400,
         imageMinHeight=300,
         outputType="png",
+        outputPolicy=OUTPUT_REENCODE,
+        outputQuality=None,
+        maxDimension=None,
+        passthroughFormats=PASSTHROUGH_FORMATS,
+        imageProcessor: ImageProcessor = None,
+        maxContentLength=50 * 1024 * 1024,
+        maxProbeBytes=64 * 1024,
+        downloadChunkSize=16 * 1024,
+        dedupIndex: ContentDedupIndex = None,
+        nearDupIndex=None,
+        responseListener=None,
+        retryPolicy: RetryPolicy = None,
+        conditionalRequests: bool = False,
     ):
         self.dataStore = dataStore
         self.imageMinWidth = imageMinWidth
         self.imageMinHeight = imageMinHeight
         self.outputType = outputType
+        # passthrough keeps the downloaded bytes of allowed formats instead of re-encoding them
+        self.outputPolicy = outputPolicy
+        self.outputQuality = outputQuality
+        self.maxDimension = maxDimension
+        self.passthroughFormats = passthroughFormats
+        self.maxContentLength = maxContentLength
+        self.maxProbeBytes = maxProbeBytes
+        self.downloadChunkSize = downloadChunkSize
         self.fileStorage = fileStorage
+        self.dedupIndex = dedupIndex
+        # optional NearDuplicateIndex (needs numpy), turns on perceptual hashing
+        self.nearDupIndex = nearDupIndex
+        # optional callable(url, statusCode, latency, retryAfter), e.g. HostScheduler.on_response
+        self.responseListener = responseListener
+        # transient failures go back on the frontier with backoff instead of being given up on
+        self.retryPolicy = retryPolicy if retryPolicy is not None else RetryPolicy()
+        # recrawls send the stored ETag/Last-Modified and skip pics that haven't changed
+        self.conditionalRequests = conditionalRequests
+        # decode/encode runs inline unless given a pooled processor
+        self.imageProcessor = (
+            imageProcessor if imageProcessor is not None else ImageProcessor(processes=0)
+        )
         self.continueScraping = True
+        self._local = threading.local()
 
     def scrape_url(self, url):
         """grabes image, checks it, and saves image to output directory"""
         try:
-            self._get_and_save_image_to_file(url)
-        except ImgReqFailed as e:
-            self.dataStore.add_visited_pic_url(
-                url, "HTTP_STATUS: " + str(e.statusCode)
-            )
-        except ImgTooSmall as e:
-            self.dataStore.add_visited_pic_url(
-                url,
-                "IMG_TOO_SMALL: width=" + str(e.width) + " height=" + str(e.height),
-            )
-        except requests.exceptions.Timeout:
-            self.dataStore.add_visited_pic_url(url, "TIMEOUT")
-        except requests.exceptions.TooManyRedirects:
-            self.dataStore.add_visited_pic_url(url, "TOO_MANY_REDIRECT")
-        except requests.exceptions.RequestException as e:
-            self.dataStore.add_visited_pic_url(url, "UNKNOWN_REQ_FAILURE")
+            content, validators = self._get_image(url)
+            self._save_image(url, content, validators)
+        except ImgNotModified as e:
+            self._record_not_modified(url, e.validators)
+        except PROCESSOR_INTERRUPTIONS as e:
+            self._record_interrupted(url, e)
         except Exception as e:
-            self.dataStore.add_visited_pic_url(url, "UNKNOWN_FAILURE")
-
-    def _get_and_save_image_to_file(self, image_url):
-        # make the request
-        session = requests.Session()
-        session.max_redirects = 5
-        response = session.get(
-            image_url, headers={"User-agent": """Mozilla/5.0"""}, timeout=30
+            self._record_failure(url, e)
+
+    def close(self):
+        """stops the image processor, sessions die with their threads"""
+        self.imageProcessor.close()
+
+    def _record_not_modified(self, url, validators):
+        """a 304 on a recrawl, what was stored last time still stands"""
+        if validators is not None:
+            self.dataStore.add_pic_url_validators(url, *validators)
+        self.dataStore.add_visited_pic_url(url)
+        logging.info(f"Pic unchanged {url=}")
+
+    def _record_interrupted(self, url, e):
+        """
+        the image process died under the job, nothing is wrong with the pic. it goes
+        straight back on the frontier without using up an attempt
+        """
+        attempts = self.dataStore.get_pic_attempts(url)
+        self.dataStore.add_failed_pic_url(
+            url, "PROCESSOR_INTERRUPTED", "PROCESSOR_INTERRUPTED", attempts, time.time()
         )
+        logging.warning(f"Image processing interrupted, releasing pic {url=} {e=}")
+
+    def _record_failure(self, url, e):
+        """marks the url failed, scheduling another attempt if the failure looks transient"""
+        err = self._get_failure_reason(e)
+        errClass = self._get_failure_class(e, err)
+        if not self.retryPolicy.is_transient(errClass):
+            self.dataStore.add_visited_pic_url(url, err)
+            return
+        attempts = self.dataStore.get_pic_attempts(url) + 1
+        nextEligibleAt = None
+        if self.retryPolicy.should_retry(errClass, attempts):
+            nextEligibleAt = time.time() + self.retryPolicy.get_delay(attempts)
+            logging.info(f"Retrying pic later {url=} {err=} {attempts=}")
+        self.dataStore.add_failed_pic_url(url, err, errClass, attempts, nextEligibleAt)
+
+    def _get_failure_class(self, e, err):
+        """coarse class of a failure, what retry decisions are made on"""
+        if isinstance(e, ImgReqFailed):
+            if e.statusCode == 429:
+                return "HTTP_429"
+            if e.statusCode >= 500:
+                return "HTTP_5XX"
+            return "HTTP_4XX"
+        return err.split(":")[0]
+
+    def _get_failure_reason(self, e):
+        """maps a failed scrape attempt to the err stored with the url"""
+        if isinstance(e, ImgReqFailed):
+            return "HTTP_STATUS: " + str(e.statusCode)
+        if isinstance(e, ImgTooSmall):
+            return "IMG_TOO_SMALL: width=" + str(e.width) + " height=" + str(e.height)
+        if isinstance(e, ImgNearDuplicate):
+            return "NEAR_DUPLICATE: sha=" + e.shaPicHash
+        if isinstance(e, ImgTooLarge):
+            return "IMG_TOO_LARGE: bytes=" + str(e.contentLength)
+        if isinstance(e, ImgStoreFailed):
+            return "STORE_FAILED: " + type(e.cause).__name__
+        if isinstance(e, requests.exceptions.Timeout):
+            return "TIMEOUT"
+        if isinstance(e, requests.exceptions.TooManyRedirects):
+            return "TOO_MANY_REDIRECT"
+        if isinstance(e, requests.exceptions.RequestException):
+            return "UNKNOWN_REQ_FAILURE"
+        return "UNKNOWN_FAILURE"
+
+    def _notify_response(self, url, statusCode, startedAt, retryAfter=None):
+        """tells the listener how a request went, statusCode None when nothing came back"""
+        if self.responseListener is not None:
+            self.responseListener(url, statusCode, time.monotonic() - startedAt, retryAfter)
 
-        # throw err if failed
-        if not response.status_code == requests.codes.ok:
-            raise ImgReqFailed(response.status_code)
+    def _get_session(self):
+        """one pooled session per thread, keeps connections alive between images"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.max_redirects = 5
+            self._local.session = session
+        return session
 
-        image_content = response.content
-        image_file = io.BytesIO(image_content)
-        image = Image.open(image_file).convert("RGB")
+    def _get_request(self, image_url):
+        """request headers for the pic, and the validators stored from its last fetch"""
+        headers = {"User-agent": """Mozilla/5.0"""}
+        validators = None
+        if self.conditionalRequests:
+            validators = self.dataStore.get_pic_url_validators(image_url)
+            headers.update(build_conditional_headers(validators))
+        return headers, validators
 
-        # throw err if img is too small to care about
-        width, height = image.size
+    def _get_image(self, image_url):
+        """
+        streams the raw image bytes, bailing out early on small or huge images.
+        returns (bytes, response validators)
+        """
+        headers, validators = self._get_request(image_url)
+        startedAt = time.monotonic()
+        try:
+            response = self._get_session().get(
+                image_url, headers=headers, timeout=30, stream=True
+            )
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            self._notify_response(image_url, None, startedAt)
+            raise
+        with response:
+            self._notify_response(
+                image_url, response.status_code, startedAt, response.headers.get("Retry-After")
+            )
+            if response.status_code == requests.codes.not_modified:
+                raise ImgNotModified(get_response_validators(response.headers) or validators)
+            # throw err if failed
+            if not response.status_code == requests.codes.ok:
+                raise ImgReqFailed(response.status_code)
+            self._check_content_length(response.headers.get("Content-Length"))
+
+            received = bytearray()
+            sizeChecked = False
+            for chunk in response.iter_content(self.downloadChunkSize):
+                received += chunk
+                sizeChecked = self._check_partial_image(received, sizeChecked)
+            return bytes(received), get_response_validators(response.headers)
+
+    def _check_content_length(self, contentLength):
+        """refuse downloads that announce more bytes than we'll take"""
+        if contentLength is not None and contentLength.isdigit():
+            if int(contentLength) > self.maxContentLength:
+                raise ImgTooLarge(int(contentLength))
+
+    def _check_partial_image(self, received, sizeChecked):
+        """
+        early checks while the body streams in, raising aborts the transfer.
+        returns whether the image dimensions have been checked yet.
+        """
+        if len(received) > self.maxContentLength:
+            raise ImgTooLarge(len(received))
+        if sizeChecked:
+            return True
+        size = probe_image_size(received[: self.maxProbeBytes])
+        if size is None:
+            # unknown format or header not in yet, leave it to the full decode past the probe window
+            return len(received) >= self.maxProbeBytes
+        width, height = size
         if width <= self.imageMinWidth or height <= self.imageMinHeight:
             raise ImgTooSmall(width, height)
+        return True
 
-        # calc out filename
-        urlType = self.outputType if self.outputType else get_url_filetype(image_url)
+    def _save_image(self, image_url, image_content, validators=None):
+        """checks the downloaded image, re-encodes it and stores it"""
         filesha = hashlib.sha1(image_content).hexdigest()[:15]
-        filename = filesha + "." + urlType
+        # same bytes already stored under another url, just point this url at them
+        if self.dedupIndex is not None and self.dedupIndex.contains(filesha):
+            self.dataStore.add_pic_url_alias(image_url, filesha)
+            self._record_validators(image_url, validators)
+            self.dataStore.add_visited_pic_url(image_url)
+            logging.info(f"Skipped duplicate pic {image_url=} {filesha=}")
+            return
+
+        # decode, size check & re-encode happen in the processor (possibly another process)
+        urlType = self.outputType if self.outputType else get_url_filetype(image_url)
+        processed = self.imageProcessor.process(
+            image_content,
+            self.imageMinWidth,
+            self.imageMinHeight,
+            urlType,
+            self.nearDupIndex is not None,
+            self.outputPolicy,
+            self.outputQuality,
+            self.maxDimension,
+            self.passthroughFormats,
+        )
+        # a resized / re-compressed copy of something already stored
+        if self.nearDupIndex is not None:
+            nearSha = self.nearDupIndex.find_near(processed.perceptualHash)
+            if nearSha is not None:
+                raise ImgNearDuplicate(nearSha)
+
+        # calc out filename
+        filename = filesha + "." + processed.fileType
         # calc out path
         fileRelPath = filesha[0:2] + "/" + filesha[2:4] + "/" + filesha[4:6] + "/" + filename
-        # save img to buffer
-        buffer = io.BytesIO()
-        image.save(buffer, format=urlType)
-        # store file in provider
-        buffer.seek(0)
-        image_bytes = buffer.read()
-        self.fileStorage.store_file(image_bytes, fileRelPath)
-        # mark pic as scraped
-        self.dataStore.add_stored_pic_url(image_url, fileRelPath, filesha)
+        # store file in provider, the pic is only recorded once the storage has it
+        self.fileStorage.store_file(
+            processed.imageBytes,
+            fileRelPath,
+            onStored=lambda: self._record_stored(
+                image_url, fileRelPath, filesha, processed, validators
+            ),
+            onFailed=lambda e: self._record_failure(image_url, ImgStoreFailed(e)),
+        )
+
+    def _record_stored(self, image_url, fileRelPath, filesha, processed, validators):
+        """marks the pic as scraped, called by the file storage once the file has landed"""
+        self.dataStore.add_stored_pic_url(
+            image_url,
+            fileRelPath,
+            filesha,
+            len(processed.imageBytes),
+            processed.encodeSeconds,
+        )
+        self._record_validators(image_url, validators)
         self.dataStore.add_visited_pic_url(image_url)
+        if self.dedupIndex is not None:
+            self.dedupIndex.add(filesha)
+        if self.nearDupIndex is not None:
+            self.dataStore.add_pic_perceptual_hash(filesha, processed.perceptualHash)
+            self.nearDupIndex.add(filesha, processed.perceptualHash)
         logging.info(f"Scraped pic {image_url=}")
 
+    def _record_validators(self, image_url, validators):
+        """only kept for pics that made it through, a 304 later means they're still good"""
+        if validators is not None:
+            self.dataStore.add_pic_url_validators(image_url, *validators)
+
     def set_can_stop_image_scraping(self):
         self.continueScraping = False
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+
+# error classes a later attempt can plausibly get past
+TRANSIENT_ERR_CLASSES = {"TIMEOUT", "UNKNOWN_REQ_FAILURE", "HTTP_5XX", "HTTP_429", "STORE_FAILED"}
+
+
+class RetryPolicy:
+    """
+    decides whether a failed fetch gets another attempt and how long it waits.
+    the delay doubles every attempt from baseDelay up to maxDelay, and jitter
+    takes up to that fraction off at random so a burst of failures against one
+    host doesn't all come back at the same moment.
+    """
+
+    def __init__(
+        self,
+        maxAttempts=5,
+        baseDelay=30,
+        maxDelay=600,
+        jitter=0.5,
+        transientErrClasses=TRANSIENT_ERR_CLASSES,
+    ):
+        self.maxAttempts = maxAttempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.jitter = jitter
+        self.transientErrClasses = set(transientErrClasses)
+
+    def is_transient(self, errClass):
+        return errClass in self.transientErrClasses
+
+    def should_retry(self, errClass, attempts):
+        """attempts counts the failure just seen"""
+        return self.is_transient(errClass) and attempts < self.maxAttempts
+
+    def get_delay(self, attempts):
+        """seconds to wait before the next attempt, attempts counts the failure just seen"""
+        delay = min(self.maxDelay, self.baseDelay * 2 ** (attempts - 1))
+        return delay * (1 - self.jitter * random.random())
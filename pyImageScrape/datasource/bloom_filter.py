@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import math
+import os
+import pickle
+
+
+class BloomFilter:
+    """
+    fixed size bloom filter over strings.
+    never gives false negatives, false positives stay near falsePositiveRate
+    until more than capacity items have been added.
+    """
+
+    def __init__(self, capacity=1_000_000, falsePositiveRate=0.001):
+        self.capacity = capacity
+        self.falsePositiveRate = falsePositiveRate
+        self.numBits = max(8, int(-capacity * math.log(falsePositiveRate) / (math.log(2) ** 2)))
+        self.numHashes = max(1, round(self.numBits / capacity * math.log(2)))
+        self.bits = bytearray((self.numBits + 7) // 8)
+        self.count = 0
+
+    def add(self, item: str):
+        """adds the item, returns False if it was (probably) already there"""
+        isNew = False
+        for pos in self._positions(item):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                isNew = True
+        if isNew:
+            self.count += 1
+        return isNew
+
+    def __contains__(self, item: str):
+        for pos in self._positions(item):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, item: str):
+        # double hashing, k positions out of one 128 bit digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.numBits for i in range(self.numHashes)]
+
+
+class ScalableBloomFilter:
+    """
+    bloom filter that keeps its false positive rate bounded however many items go in.
+    once a filter fills up a new one twice the size with a tighter error rate is
+    stacked on top, the first filter starts at falsePositiveRate * (1 - tightening)
+    so the rates summed over every filter stay under falsePositiveRate.
+    """
+
+    def __init__(
+        self,
+        initialCapacity=100_000,
+        falsePositiveRate=0.0001,
+        growth=2,
+        tightening=0.5,
+    ):
+        self.initialCapacity = initialCapacity
+        self.falsePositiveRate = falsePositiveRate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = [BloomFilter(initialCapacity, falsePositiveRate * (1 - tightening))]
+
+    def add(self, item: str):
+        """adds the item, returns False if it was (probably) already there"""
+        if item in self:
+            return False
+        current = self.filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(
+                current.capacity * self.growth,
+                current.falsePositiveRate * self.tightening,
+            )
+            self.filters.append(current)
+        return current.add(item)
+
+    def __contains__(self, item: str):
+        for bloom in reversed(self.filters):
+            if item in bloom:
+                return True
+        return False
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    def save(self, path: str):
+        """writes the filter to path, through a temp file so a crash never leaves half a file"""
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, path)
+
+    @staticmethod
+    def load(path: str):
+        with open(path, "rb") as file:
+            return pickle.load(file)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from shared import DataStore
+
+
+class BufferedDataStore:
+    """
+    write-behind wrapper that works around any datastore.
+    pic visited/stored updates are held in memory and flushed in bulk once
+    maxBatchSize of them are waiting or the oldest is maxBatchAge seconds old,
+    which bounds how much can be lost if the process dies.
+    everything else is passed straight through to the wrapped datastore.
+    """
+
+    def __init__(self, dataStore: DataStore, maxBatchSize=500, maxBatchAge=2.0):
+        self.dataStore = dataStore
+        self.maxBatchSize = maxBatchSize
+        self.maxBatchAge = maxBatchAge
+        self._lock = threading.Lock()
+        self._flushLock = threading.Lock()
+        self._visited = {}
+        self._stored = []
+        self._flushing = set()
+        self._oldest = None
+        self._closed = False
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._run_flusher, daemon=True)
+        self._flusher.start()
+
+    def __getattr__(self, name):
+        return getattr(self.dataStore, name)
+
+    # BUFFERED METHODS
+    # ================================
+
+    def add_visited_pic_url(self, urlLoc, err=None):
+        with self._lock:
+            self._visited[urlLoc] = err
+            self._mark_pending()
+
+    def add_visited_pic_urls(self, visits):
+        with self._lock:
+            for urlLoc, err in visits:
+                self._visited[urlLoc] = err
+            self._mark_pending()
+
+    def add_stored_pic_url(self, urlLoc, filePath, shaPicHash, storedSize=None, encodeSeconds=None):
+        with self._lock:
+            self._stored.append((urlLoc, filePath, shaPicHash, storedSize, encodeSeconds))
+            self._mark_pending()
+
+    def add_stored_pic_urls(self, storedPics):
+        with self._lock:
+            self._stored.extend(storedPics)
+            self._mark_pending()
+
+    # READS (hide urls whose visit hasn't reached the datastore yet)
+    # ================================
+
+    def get_next_pic_to_visit(self):
+        with self._lock:
+            pendingCount = len(self._visited) + len(self._flushing)
+        for url in self.get_all_pics_to_visit(pendingCount + 1):
+            return url
+        return None
+
+    def get_all_pics_to_visit(self, n=1000):
+        return self._drop_pending(self.dataStore.get_all_pics_to_visit(n))
+
+    def claim_pics_to_visit(self, n=1000, leaseSeconds=300, leaseOwner=None):
+        return self._drop_pending(
+            self.dataStore.claim_pics_to_visit(n, leaseSeconds, leaseOwner)
+        )
+
+    def reconcile_stored_pics(self):
+        # anything still buffered has to land before the datastore can be compared
+        self.flush()
+        return self.dataStore.reconcile_stored_pics()
+
+    # LIFECYCLE
+    # ================================
+
+    def flush(self):
+        """writes every buffered update to the wrapped datastore"""
+        with self._flushLock:
+            with self._lock:
+                visited, self._visited = self._visited, {}
+                stored, self._stored = self._stored, []
+                self._flushing = set(visited)
+                self._oldest = None
+            try:
+                # stored first, so a crash in between only costs a re-fetch
+                if len(stored) > 0:
+                    self.dataStore.add_stored_pic_urls(stored)
+                if len(visited) > 0:
+                    self.dataStore.add_visited_pic_urls(list(visited.items()))
+            except Exception as e:
+                logging.error(f"Failed to flush buffered updates, requeueing: {e}")
+                with self._lock:
+                    for urlLoc, err in visited.items():
+                        self._visited.setdefault(urlLoc, err)
+                    self._stored = stored + self._stored
+                    self._mark_pending()
+            finally:
+                with self._lock:
+                    self._flushing = set()
+
+    def close(self):
+        """flushes what is left, then closes the wrapped datastore"""
+        self._closed = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        self.dataStore.close()
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _drop_pending(self, urls):
+        """filters out urls that already have a visit waiting to be flushed"""
+        with self._lock:
+            return [
+                url
+                for url in urls
+                if url not in self._visited and url not in self._flushing
+            ]
+
+    def _mark_pending(self):
+        """called holding self._lock after adding updates"""
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._visited) + len(self._stored) >= self.maxBatchSize:
+            self._wake.set()
+
+    def _run_flusher(self):
+        """background loop that flushes by size or age"""
+        while not self._closed:
+            with self._lock:
+                oldest = self._oldest
+                size = len(self._visited) + len(self._stored)
+            if oldest is None:
+                timeout = self.maxBatchAge
+            else:
+                timeout = oldest + self.maxBatchAge - time.monotonic()
+            if size < self.maxBatchSize and timeout > 0:
+                self._wake.wait(timeout)
+                self._wake.clear()
+                continue
+            self.flush()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from shared import DataStore
+from datasource.url_canonicalizer import UrlCanonicalizer
+
+
+class CanonicalizingDataStore:
+    """
+    wrapper that canonicalizes every url before it reaches the frontier.
+    per rule it counts how many urls the rule rewrote, and how many of those
+    rewrites collapsed into a url that was already in the same batch or already in
+    the frontier, i.e. the frontier rows the rule saved. rewritten urls are added
+    in one batch per combination of rules, so the wrapped datastore's new-row
+    count tells how many of them it already had. the counts go to the datastore
+    every statsFlushBatches batches and on close.
+    everything else is passed straight through to the wrapped datastore.
+    """
+
+    def __init__(
+        self,
+        dataStore: DataStore,
+        canonicalizer: UrlCanonicalizer = None,
+        statsFlushBatches=100,
+    ):
+        self.dataStore = dataStore
+        self.canonicalizer = canonicalizer if canonicalizer is not None else UrlCanonicalizer()
+        self.statsFlushBatches = statsFlushBatches
+        self._stats = {}
+        self._batches = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.dataStore, name)
+
+    def add_to_visit_content_urls(self, urlLocs, parentUrl=None, priority=0):
+        return self._add_canonical(
+            urlLocs, parentUrl, priority, self.dataStore.add_to_visit_content_urls
+        )
+
+    def add_to_visit_pic_urls(self, urlLocs, parentUrl=None, priority=0):
+        return self._add_canonical(
+            urlLocs, parentUrl, priority, self.dataStore.add_to_visit_pic_urls
+        )
+
+    def flush_stats(self):
+        """hands the counted stats to the datastore"""
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            self._batches = 0
+        if len(stats) > 0:
+            self.dataStore.add_canonicalization_stats(stats)
+
+    def close(self):
+        self.flush_stats()
+        self.dataStore.close()
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _canonical_parent(self, parentUrl):
+        if parentUrl is None:
+            return None
+        return self.canonicalizer.canonicalize(parentUrl)[0]
+
+    def _add_canonical(self, urlLocs, parentUrl, priority, addToVisit):
+        """adds the batch's canonical urls, returns how many were new"""
+        groups, batchStats = self._canonicalize_batch(urlLocs)
+        parentUrl = self._canonical_parent(parentUrl)
+        newCount = 0
+        for applied, urls in groups.items():
+            added = addToVisit(urls, parentUrl, priority)
+            newCount += added
+            # the rest of the group's rewrites landed on rows the frontier already had
+            for rule in applied:
+                rewritten, collapsed = batchStats[rule]
+                batchStats[rule] = (rewritten, collapsed + len(urls) - added)
+        self._count_stats(batchStats)
+        return newCount
+
+    def _canonicalize_batch(self, urlLocs):
+        """
+        canonical urls of the batch without duplicates, grouped by the rules that
+        rewrote them, plus the per rule (rewritten, collapsed within the batch) counts
+        """
+        canonicalUrls = {}
+        batchStats = {}
+        for url in urlLocs:
+            if not url:
+                continue
+            canonicalUrl, applied = self.canonicalizer.canonicalize(url)
+            collapsed = canonicalUrl in canonicalUrls and canonicalUrls[canonicalUrl][0] != url
+            for rule in applied:
+                rewritten, collapsedCount = batchStats.get(rule, (0, 0))
+                batchStats[rule] = (rewritten + 1, collapsedCount + (1 if collapsed else 0))
+            canonicalUrls.setdefault(canonicalUrl, (url, tuple(applied)))
+
+        groups = {}
+        for canonicalUrl, (_, applied) in canonicalUrls.items():
+            groups.setdefault(applied, []).append(canonicalUrl)
+        return groups, batchStats
+
+    def _count_stats(self, batchStats):
+        with self._lock:
+            for rule, (rewritten, collapsedCount) in batchStats.items():
+                total = self._stats.get(rule, (0, 0))
+                self._stats[rule] = (total[0] + rewritten, total[1] + collapsedCount)
+            self._batches += 1
+            shouldFlush = self._batches >= self.statsFlushBatches
+        if shouldFlush:
+            self.flush_stats()
@@ -0,0 +1,24 @@
+-- partial indexes over the unvisited frontier, they hold every column the frontier
+-- queries touch (visited included, sqlite only treats a partial index as covering
+-- when it holds the columns of its own WHERE clause) so next-batch lookups never
+-- have to visit the table itself
+
+CREATE INDEX IF NOT EXISTS urls_frontier_bfs
+    ON urls (depth, priority DESC, discoveredAt, urlLoc, leaseExpires, nextEligibleAt, visited) WHERE visited = 0;
+
+CREATE INDEX IF NOT EXISTS urls_frontier_priority
+    ON urls (priority DESC, depth, discoveredAt, urlLoc, leaseExpires, nextEligibleAt, visited) WHERE visited = 0;
+
+CREATE INDEX IF NOT EXISTS picUrls_frontier_bfs
+    ON picUrls (depth, priority DESC, discoveredAt, urlLoc, leaseExpires, nextEligibleAt, visited) WHERE visited = 0;
+
+CREATE INDEX IF NOT EXISTS picUrls_frontier_priority
+    ON picUrls (priority DESC, depth, discoveredAt, urlLoc, leaseExpires, nextEligibleAt, visited) WHERE visited = 0;
+
+-- leases still held on unvisited urls, so a restarting worker finds its own quickly
+
+CREATE INDEX IF NOT EXISTS urls_lease_owner
+    ON urls (leaseOwner) WHERE leaseOwner IS NOT NULL AND visited = 0;
+
+CREATE INDEX IF NOT EXISTS picUrls_lease_owner
+    ON picUrls (leaseOwner) WHERE leaseOwner IS NOT NULL AND visited = 0;
@@ -1,10 +1,17 @@
 import logging
+import threading
+import time
+import uuid
 
 from opensearchpy import (
     OpenSearch,
     Document,
     Text,
     Boolean,
+    Float,
+    Integer,
+    Keyword,
+    Long,
     Search,
     helpers
 )
@@ -18,6 +25,20 @@ from opensearchpy import (
 URL_INDEX = "url"
 PIC_URL_INDEX = "pic_url"
 STORED_PIC_INDEX = "stored_pic"
+PIC_URL_HASH_INDEX = "pic_url_hash"
+PIC_PERCEPTUAL_HASH_INDEX = "pic_perceptual_hash"
+CANONICALIZATION_STATS_INDEX = "canonicalization_stats"
+WORKER_INDEX = "worker"
+FRONTIER_INFO_INDEX = "frontier_info"
+
+# bfs frontier order, shallowest first then highest priority then oldest
+FRONTIER_SORT = (
+    {"depth": {"order": "asc", "missing": "_first"}},
+    {"priority": {"order": "desc", "missing": "_last"}},
+    {"discoveredAt": {"order": "asc", "missing": "_first"}},
+)
+# search_after needs a unique sort, urls found on one page share all of the above
+PAGED_FRONTIER_SORT = FRONTIER_SORT + ({"_id": {"order": "asc"}},)
 
 # CREATE DOC CLASSES
 # =======================================
@@ -27,6 +48,14 @@ class Url(Document):
 
     err = Text()
     visited = Boolean()
+    leaseExpires = Long()
+    leaseOwner = Keyword()
+    depth = Integer()
+    priority = Integer()
+    discoveredAt = Long()
+    etag = Keyword()
+    lastModified = Keyword()
+    fetchedAt = Long()
 
     class Index:
         name = URL_INDEX
@@ -39,6 +68,17 @@ class PicUrl(Document):
 
     err = Text()
     visited = Boolean()
+    leaseExpires = Long()
+    leaseOwner = Keyword()
+    depth = Integer()
+    priority = Integer()
+    discoveredAt = Long()
+    attempts = Integer()
+    nextEligibleAt = Long()
+    errClass = Keyword()
+    etag = Keyword()
+    lastModified = Keyword()
+    fetchedAt = Long()
 
     class Index:
         name = PIC_URL_INDEX
@@ -51,6 +91,8 @@ class StoredPic(Document):
 
     filePath = Text()
     url = Text()
+    storedSize = Long()
+    encodeSeconds = Float()
 
     class Index:
         name = STORED_PIC_INDEX
@@ -59,78 +101,443 @@ class StoredPic(Document):
         return super(StoredPic, self).save(**kwargs)
 
 
+class PicUrlHash(Document):
+
+    shaPicHash = Keyword()
+
+    class Index:
+        name = PIC_URL_HASH_INDEX
+
+    def save(self, **kwargs):
+        return super(PicUrlHash, self).save(**kwargs)
+
+
+class PicPerceptualHash(Document):
+
+    # unsigned 64 bit hash kept as a hex string, opensearch longs are signed
+    perceptualHash = Keyword()
+
+    class Index:
+        name = PIC_PERCEPTUAL_HASH_INDEX
+
+    def save(self, **kwargs):
+        return super(PicPerceptualHash, self).save(**kwargs)
+
+
+class Worker(Document):
+
+    heartbeatAt = Long()
+
+    class Index:
+        name = WORKER_INDEX
+
+    def save(self, **kwargs):
+        return super(Worker, self).save(**kwargs)
+
+
+class FrontierInfo(Document):
+
+    frontierId = Keyword()
+
+    class Index:
+        name = FRONTIER_INFO_INDEX
+
+    def save(self, **kwargs):
+        return super(FrontierInfo, self).save(**kwargs)
+
+
 # CREATE Datastore
 # =======================================
 
 
 class SimpleOpenSearchDataStore:
-
-    def __init__(self, conn: OpenSearch):
+    """
+    datastore over opensearch. by default every write is refreshed straight away,
+    so it's visible to the next search.
+    with highThroughput the indices refresh every refreshInterval instead, visited,
+    failed, stored & validator writes are queued and sent as bulk actions bulkSize
+    at a time (and before any read that depends on them), and claims page through
+    the frontier with a point in time + search_after, pageSize hits at a time, so
+    urls leased since the last refresh are stepped over instead of stalling the claim.
+    urls added since the last refresh are invisible to searches, so a claim or
+    frontier read that comes back short refreshes the index and looks again before
+    the producer can take it as the frontier running dry.
+    high throughput mode sets refreshInterval on the url, pic url, stored pic & alias
+    indices for good, close() leaves it in place since other workers may still be
+    writing. a later run without highThroughput refreshes on every write anyway.
+    stored pics & aliases are always indexed, a later write for the same id replaces it.
+    a stored pic is keyed by its hash, so every stored url also gets an alias,
+    a url whose doc was replaced by another url storing the same bytes keeps its hash.
+    """
+
+    def __init__(
+        self,
+        conn: OpenSearch,
+        highThroughput=False,
+        refreshInterval="1s",
+        bulkSize=500,
+        pageSize=1000,
+        pitKeepAlive="1m",
+    ):
         self.conn = conn
+        self.highThroughput = highThroughput
+        self.refreshInterval = refreshInterval
+        self.bulkSize = bulkSize
+        self.pageSize = pageSize
+        self.pitKeepAlive = pitKeepAlive
+        # per write refreshes are what high throughput mode does without
+        self._refresh = not highThroughput
+        self._pendingActions = []
+        self._pendingLock = threading.Lock()
+        self._flushLock = threading.Lock()
         self._run_setup()
 
-    def add_to_visit_content_urls(self, urlLocs):
+    def add_to_visit_content_urls(self, urlLocs, parentUrl=None, priority=0):
         urls = []
-        for url in urlLocs:
-            urls.append(Url(meta={"id": url}, visited=False, err=None))
+        depth = self._get_child_depth(parentUrl)
+        nowMs = int(time.time() * 1000)
+        for url in dict.fromkeys(urlLocs):
+            urls.append(
+                Url(
+                    meta={"id": url},
+                    visited=False,
+                    err=None,
+                    depth=depth,
+                    priority=priority,
+                    discoveredAt=nowMs,
+                )
+            )
         actions = self._build_bulk_create(Url.Index.name, urls)
-        helpers.bulk(self.conn, actions, refresh=True, raise_on_error=False)
+        created, _ = helpers.bulk(
+            self.conn, actions, refresh=self._refresh, raise_on_error=False
+        )
+        return created
 
-    def add_to_visit_pic_urls(self, urlLocs):
+    def add_to_visit_pic_urls(self, urlLocs, parentUrl=None, priority=0):
         urls = []
-        for url in urlLocs:
-            urls.append(PicUrl(meta={"id": url}, visited=False, err=None))
+        depth = self._get_child_depth(parentUrl)
+        nowMs = int(time.time() * 1000)
+        for url in dict.fromkeys(urlLocs):
+            urls.append(
+                PicUrl(
+                    meta={"id": url},
+                    visited=False,
+                    err=None,
+                    depth=depth,
+                    priority=priority,
+                    discoveredAt=nowMs,
+                )
+            )
         actions = self._build_bulk_create(PicUrl.Index.name, urls)
-        helpers.bulk(self.conn, actions, refresh=True, raise_on_error=False)
+        created, _ = helpers.bulk(
+            self.conn, actions, refresh=self._refresh, raise_on_error=False
+        )
+        return created
 
     def add_visited_content_url(self, urlLoc, err=None):
-        self.conn.update(
-            index=URL_INDEX,
-            id=urlLoc,
-            body={"doc": {"visited": True, "err": err}},
-            refresh=True,
-        )
+        self._update(URL_INDEX, urlLoc, {"visited": True, "err": err}, refresh=True)
 
     def add_visited_pic_url(self, urlLoc, err=None):
-        self.conn.update(
-            index=PIC_URL_INDEX,
-            id=urlLoc,
-            body={"doc": {"visited": True, "err": err}},
+        self._update(PIC_URL_INDEX, urlLoc, {"visited": True, "err": err}, refresh=True)
+
+    def add_visited_pic_urls(self, visits):
+        actions = [
+            {
+                "_op_type": "update",
+                "_index": PIC_URL_INDEX,
+                "_id": urlLoc,
+                "doc": {"visited": True, "err": err},
+            }
+            for urlLoc, err in visits
+        ]
+        if self.highThroughput:
+            self._queue_actions(actions)
+            return
+        helpers.bulk(self.conn, actions, refresh=True, raise_on_error=False)
+
+    def add_failed_pic_url(self, urlLoc, err, errClass, attempts, nextEligibleAt=None):
+        self._update(
+            PIC_URL_INDEX,
+            urlLoc,
+            {
+                "visited": nextEligibleAt is None,
+                "err": err,
+                "errClass": errClass,
+                "attempts": attempts,
+                "nextEligibleAt": (
+                    int(nextEligibleAt * 1000) if nextEligibleAt is not None else None
+                ),
+                "leaseExpires": None,
+            },
             refresh=True,
         )
 
-    def add_stored_pic_url(self, urlLoc, filePath, shaPicHash):
-        doc = StoredPic(meta={"id": shaPicHash}, filePath=filePath, url=urlLoc)
+    def get_pic_attempts(self, urlLoc):
+        self.flush()
+        doc = PicUrl.get(id=urlLoc, using=self.conn, ignore=404)
+        if doc is not None and doc.attempts is not None:
+            return doc.attempts
+        return 0
+
+    def get_next_pic_retry_at(self):
+        self.flush()
+        self._refresh_unseen(PIC_URL_INDEX)
+        search = (
+            Search(using=self.conn, index=PIC_URL_INDEX)
+            .filter("term", visited=False)
+            .filter("exists", field="nextEligibleAt")
+            .extra(size=0)
+        )
+        search.aggs.metric("nextRetry", "min", field="nextEligibleAt")
+        nextRetryMs = search.execute().aggregations.nextRetry.value
+        if nextRetryMs is None:
+            return None
+        return nextRetryMs / 1000
+
+    def add_content_url_validators(self, urlLoc, etag, lastModified):
+        self._add_validators(URL_INDEX, urlLoc, etag, lastModified)
+
+    def add_pic_url_validators(self, urlLoc, etag, lastModified):
+        self._add_validators(PIC_URL_INDEX, urlLoc, etag, lastModified)
+
+    def get_content_url_validators(self, urlLoc):
+        return self._get_validators(Url, urlLoc)
+
+    def get_pic_url_validators(self, urlLoc):
+        return self._get_validators(PicUrl, urlLoc)
+
+    def start_recrawl(self):
+        self.flush()
+        for index in (URL_INDEX, PIC_URL_INDEX):
+            self.conn.update_by_query(
+                index=index,
+                body={
+                    "query": {"term": {"visited": True}},
+                    "script": {
+                        "source": "ctx._source.visited = false; ctx._source.leaseExpires = null; "
+                        "ctx._source.attempts = 0; ctx._source.nextEligibleAt = null",
+                    },
+                },
+                conflicts="proceed",
+                refresh=True,
+            )
+        FrontierInfo(meta={"id": "frontier"}, frontierId=uuid.uuid4().hex).save(
+            using=self.conn, refresh=True
+        )
+
+    def get_frontier_id(self):
+        info = FrontierInfo.get(id="frontier", using=self.conn, ignore=404)
+        if info is None:
+            # create only, when two workers race the first one's id sticks
+            self.conn.index(
+                index=FRONTIER_INFO_INDEX,
+                id="frontier",
+                body={"frontierId": uuid.uuid4().hex},
+                op_type="create",
+                refresh=True,
+                ignore=409,
+            )
+            info = FrontierInfo.get(id="frontier", using=self.conn)
+        return info.frontierId
+
+    def add_stored_pic_url(self, urlLoc, filePath, shaPicHash, storedSize=None, encodeSeconds=None):
+        self.add_stored_pic_urls([(urlLoc, filePath, shaPicHash, storedSize, encodeSeconds)])
+
+    def add_stored_pic_urls(self, storedPics):
+        docs = [self._build_stored_pic(*storedPic) for storedPic in storedPics]
+        aliases = [
+            PicUrlHash(meta={"id": doc.url}, shaPicHash=doc.meta.id) for doc in docs
+        ]
+        actions = self._build_bulk_create(
+            StoredPic.Index.name, docs, "index"
+        ) + self._build_bulk_create(PicUrlHash.Index.name, aliases, "index")
+        if self.highThroughput:
+            self._queue_actions(actions)
+            return
+        helpers.bulk(self.conn, actions, refresh=True, raise_on_error=False)
+
+    def add_pic_url_alias(self, urlLoc, shaPicHash):
+        doc = PicUrlHash(meta={"id": urlLoc}, shaPicHash=shaPicHash)
+        if self.highThroughput:
+            self._queue_actions(self._build_bulk_create(PicUrlHash.Index.name, [doc], "index"))
+            return
         doc.save(using=self.conn)
 
+    def get_stored_pic_path(self, shaPicHash):
+        self.flush()
+        doc = StoredPic.get(id=shaPicHash, using=self.conn, ignore=404)
+        if doc is not None:
+            return doc.filePath
+        return None
+
+    def get_stored_pic_hashes(self):
+        self.flush()
+        for hit in helpers.scan(
+            self.conn, index=STORED_PIC_INDEX, query={"_source": False}
+        ):
+            yield hit["_id"]
+
+    def add_pic_perceptual_hash(self, shaPicHash, perceptualHash):
+        doc = PicPerceptualHash(
+            meta={"id": shaPicHash}, perceptualHash=format(perceptualHash, "016x")
+        )
+        doc.save(using=self.conn)
+
+    def get_pic_perceptual_hashes(self):
+        for hit in helpers.scan(self.conn, index=PIC_PERCEPTUAL_HASH_INDEX):
+            yield hit["_id"], int(hit["_source"]["perceptualHash"], 16)
+
+    def add_canonicalization_stats(self, stats):
+        actions = [
+            {
+                "_op_type": "update",
+                "_index": CANONICALIZATION_STATS_INDEX,
+                "_id": rule,
+                "script": {
+                    "source": "ctx._source.rewritten += params.rewritten; ctx._source.collapsed += params.collapsed",
+                    "params": {"rewritten": rewritten, "collapsed": collapsed},
+                },
+                "upsert": {"rewritten": rewritten, "collapsed": collapsed},
+            }
+            for rule, (rewritten, collapsed) in stats.items()
+        ]
+        helpers.bulk(self.conn, actions, raise_on_error=False)
+
+    def get_canonicalization_stats(self):
+        stats = {}
+        for hit in helpers.scan(self.conn, index=CANONICALIZATION_STATS_INDEX):
+            stats[hit["_id"]] = (hit["_source"]["rewritten"], hit["_source"]["collapsed"])
+        return stats
+
     def get_next_pic_to_visit(self):
+        self.flush()
         search = self._get_next_to_visit_query(PIC_URL_INDEX)
         response = search.execute()
         for doc in response:
             return doc.meta.id
 
     def get_next_content_to_visit(self):
+        self.flush()
         search = self._get_next_to_visit_query(URL_INDEX)
         response = search.execute()
         for doc in response:
             return doc.meta.id
 
     def get_all_pics_to_visit(self, n=1000):
-        urls = []
+        return self._get_all_to_visit(PIC_URL_INDEX, n)
+
+    def get_all_content_to_visit(self, n=1000):
+        return self._get_all_to_visit(URL_INDEX, n)
+
+    def claim_pics_to_visit(self, n=1000, leaseSeconds=300, leaseOwner=None):
+        return self._claim_to_visit(PIC_URL_INDEX, n, leaseSeconds, leaseOwner)
+
+    def claim_content_to_visit(self, n=1, leaseSeconds=600, leaseOwner=None):
+        return self._claim_to_visit(URL_INDEX, n, leaseSeconds, leaseOwner)
+
+    def release_leases(self, leaseOwner):
+        self.flush()
+        released = 0
+        for index in (URL_INDEX, PIC_URL_INDEX):
+            response = self.conn.update_by_query(
+                index=index,
+                body={
+                    "query": {
+                        "bool": {
+                            "filter": [
+                                {"term": {"leaseOwner": leaseOwner}},
+                                {"term": {"visited": False}},
+                            ]
+                        }
+                    },
+                    "script": {
+                        "source": "ctx._source.leaseExpires = null; ctx._source.leaseOwner = null",
+                    },
+                },
+                conflicts="proceed",
+                refresh=True,
+            )
+            released += response.get("updated", 0)
+        return released
+
+    def add_worker_heartbeat(self, workerId):
+        doc = Worker(meta={"id": workerId}, heartbeatAt=int(time.time() * 1000))
+        doc.save(using=self.conn, refresh=True)
+
+    def get_dead_workers(self, deadAfterSeconds):
+        deadBeforeMs = int((time.time() - deadAfterSeconds) * 1000)
+        search = (
+            Search(using=self.conn, index=WORKER_INDEX)
+            .filter("range", heartbeatAt={"lt": deadBeforeMs})
+            .source(False)
+        )
+        return [hit.meta.id for hit in search.scan()]
+
+    def remove_worker(self, workerId):
+        self.conn.delete(index=WORKER_INDEX, id=workerId, refresh=True, ignore=404)
+
+    def reconcile_stored_pics(self, batchSize=1000):
+        """
+        marks the leased pic urls whose pic was stored as visited. only a leased url
+        can have been in flight, so the rest of the frontier is never walked. every
+        stored url has an alias, looked up by id so it's seen without a refresh.
+        """
+        self.flush()
+        # leases made since the last refresh
+        self.conn.indices.refresh(index=PIC_URL_INDEX)
         search = (
             Search(using=self.conn, index=PIC_URL_INDEX)
-            .query("match", visited=False)
-            .extra(size=n)
+            .filter("exists", field="leaseOwner")
+            .filter("term", visited=False)
+            .source(False)
         )
-        response = search.execute()
-        for doc in response:
-            urls.append(doc.meta.id)
-        return urls
+        reconciled = 0
+        batch = []
+        for hit in search.scan():
+            batch.append(hit.meta.id)
+            if len(batch) >= batchSize:
+                reconciled += self._mark_unvisited_visited(self._get_stored_pic_urls(batch))
+                batch = []
+        if len(batch) > 0:
+            reconciled += self._mark_unvisited_visited(self._get_stored_pic_urls(batch))
+        return reconciled
+
+    def flush(self):
+        """sends every queued write as bulk actions, a no-op unless highThroughput"""
+        with self._flushLock:
+            with self._pendingLock:
+                actions, self._pendingActions = self._pendingActions, []
+            if len(actions) == 0:
+                return
+            _, errors = helpers.bulk(self.conn, actions, raise_on_error=False)
+            if len(errors) > 0:
+                logging.error(f"{len(errors)} of {len(actions)} bulk writes failed, first: {errors[0]}")
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def _queue_actions(self, actions):
+        with self._pendingLock:
+            self._pendingActions.extend(actions)
+            full = len(self._pendingActions) >= self.bulkSize
+        if full:
+            self.flush()
+
+    def _update(self, index, urlLoc, doc, refresh=None):
+        """partial doc update, queued as a bulk action in high throughput mode"""
+        if self.highThroughput:
+            self._queue_actions(
+                [{"_op_type": "update", "_index": index, "_id": urlLoc, "doc": doc}]
+            )
+            return
+        self.conn.update(index=index, id=urlLoc, body={"doc": doc}, refresh=refresh)
     
-    def _build_bulk_create(self, indexName, inputObjs):
+    def _build_bulk_create(self, indexName, inputObjs, opType="create"):
+        """bulk actions for whole docs, "create" skips ids that exist, "index" replaces them"""
         return [
             {
-                "_op_type": "create", 
+                "_op_type": opType,
                 "_index": indexName,
                 "_id": url.meta.id,
                 "_source": url.to_dict(),  # Convert the document to a dict
@@ -138,17 +545,223 @@ class SimpleOpenSearchDataStore:
             for url in inputObjs
         ]
 
+    def _build_stored_pic(self, urlLoc, filePath, shaPicHash, storedSize=None, encodeSeconds=None):
+        return StoredPic(
+            meta={"id": shaPicHash},
+            filePath=filePath,
+            url=urlLoc,
+            storedSize=storedSize,
+            encodeSeconds=encodeSeconds,
+        )
+
+    def _get_stored_pic_urls(self, urlLocs):
+        """the urls out of urlLocs that have an alias, i.e. whose pic was stored"""
+        response = self.conn.mget(
+            index=PIC_URL_HASH_INDEX, body={"ids": urlLocs}, _source=False
+        )
+        return [doc["_id"] for doc in response["docs"] if doc.get("found")]
+
+    def _mark_unvisited_visited(self, urlLocs):
+        if len(urlLocs) == 0:
+            return 0
+        search = (
+            Search(using=self.conn, index=PIC_URL_INDEX)
+            .filter("ids", values=urlLocs)
+            .filter("term", visited=False)
+            .source(False)
+            .extra(size=len(urlLocs))
+        )
+        actions = [
+            {
+                "_op_type": "update",
+                "_index": PIC_URL_INDEX,
+                "_id": hit.meta.id,
+                "doc": {"visited": True, "err": None, "leaseExpires": None, "leaseOwner": None},
+            }
+            for hit in search.execute()
+        ]
+        if len(actions) == 0:
+            return 0
+        updated, _ = helpers.bulk(self.conn, actions, refresh=self._refresh, raise_on_error=False)
+        return updated
+
+    def _claim_to_visit(self, index, n, leaseSeconds, leaseOwner):
+        """
+        lease up to n unvisited urls. each lease is written with the seq_no/primary_term
+        the doc was read at, so when two claimers race only one of them wins the doc.
+        """
+        self.flush()
+        nowMs = int(time.time() * 1000)
+        search = self._get_claimable_query(index, nowMs)
+        if self.highThroughput:
+            claimed = self._claim_paged(index, search, n, leaseSeconds, leaseOwner, nowMs)
+            if len(claimed) < n:
+                # short, the rest may only be missing from the last refresh
+                self._refresh_unseen(index)
+                claimed.extend(
+                    self._claim_paged(index, search, n - len(claimed), leaseSeconds, leaseOwner, nowMs)
+                )
+            return claimed
+        hits = [
+            hit.meta for hit in search.sort(*FRONTIER_SORT).extra(size=n).execute()
+        ]
+        return self._lease_hits(index, hits, leaseSeconds, leaseOwner, nowMs)
+
+    def _claim_paged(self, index, search, n, leaseSeconds, leaseOwner, nowMs):
+        """
+        claims page by page from one point in time. hits leased since the last refresh
+        still look claimable, their conditional update just fails and the next page is tried.
+        """
+        claimed = []
+        for hits in self._iter_pages(index, search, min(n, self.pageSize)):
+            claimed.extend(
+                self._lease_hits(index, hits[: n - len(claimed)], leaseSeconds, leaseOwner, nowMs)
+            )
+            if len(claimed) >= n:
+                break
+        return claimed
+
+    def _lease_hits(self, index, hits, leaseSeconds, leaseOwner, nowMs):
+        actions = [
+            {
+                "_op_type": "update",
+                "_index": index,
+                "_id": meta.id,
+                "if_seq_no": meta.seq_no,
+                "if_primary_term": meta.primary_term,
+                "doc": {
+                    "leaseExpires": nowMs + int(leaseSeconds * 1000),
+                    "leaseOwner": leaseOwner,
+                },
+            }
+            for meta in hits
+        ]
+        if len(actions) == 0:
+            return []
+        _, errors = helpers.bulk(
+            self.conn, actions, refresh=self._refresh, raise_on_error=False
+        )
+        lost = {list(err.values())[0]["_id"] for err in errors}
+        return [meta.id for meta in hits if meta.id not in lost]
+
+    def _iter_pages(self, index, search, pageSize):
+        """hit metas of search in frontier order, a page at a time, all read from one point in time"""
+        pitId = self.conn.create_pit(index=index, keep_alive=self.pitKeepAlive)["pit_id"]
+        try:
+            searchAfter = None
+            while True:
+                page = (
+                    search.index()
+                    .sort(*PAGED_FRONTIER_SORT)
+                    .extra(
+                        size=pageSize,
+                        seq_no_primary_term=True,
+                        pit={"id": pitId, "keep_alive": self.pitKeepAlive},
+                    )
+                )
+                if searchAfter is not None:
+                    page = page.extra(search_after=searchAfter)
+                hits = [hit.meta for hit in page.execute()]
+                if len(hits) == 0:
+                    return
+                yield hits
+                if len(hits) < pageSize:
+                    return
+                searchAfter = list(hits[-1].sort)
+        finally:
+            self.conn.delete_pit(body={"pit_id": [pitId]})
+
+    def _get_claimable_query(self, index, nowMs):
+        """unvisited urls with no live lease that aren't waiting out a retry backoff"""
+        return (
+            Search(using=self.conn, index=index)
+            .filter("term", visited=False)
+            .filter(
+                "bool",
+                should=[
+                    {"bool": {"must_not": {"exists": {"field": "leaseExpires"}}}},
+                    {"range": {"leaseExpires": {"lt": nowMs}}},
+                ],
+                minimum_should_match=1,
+            )
+            .filter(
+                "bool",
+                should=[
+                    {"bool": {"must_not": {"exists": {"field": "nextEligibleAt"}}}},
+                    {"range": {"nextEligibleAt": {"lte": nowMs}}},
+                ],
+                minimum_should_match=1,
+            )
+            .extra(seq_no_primary_term=True)
+        )
+
+    def _get_all_to_visit(self, index, n):
+        self.flush()
+        search = Search(using=self.conn, index=index).filter("term", visited=False)
+        if self.highThroughput:
+            urls = self._get_all_paged(index, search, n)
+            if len(urls) < n:
+                # short, only an up to date view can say the frontier is this small
+                self._refresh_unseen(index)
+                urls = self._get_all_paged(index, search, n)
+            return urls
+        response = search.sort(*FRONTIER_SORT).extra(size=n).execute()
+        return [doc.meta.id for doc in response]
+
+    def _get_all_paged(self, index, search, n):
+        urls = []
+        for hits in self._iter_pages(index, search, min(n, self.pageSize)):
+            urls.extend(meta.id for meta in hits[: n - len(urls)])
+            if len(urls) >= n:
+                break
+        return urls
+
+    def _refresh_unseen(self, index):
+        """makes writes since the last periodic refresh searchable, already the case without highThroughput"""
+        if self.highThroughput:
+            self.conn.indices.refresh(index=index)
+
+    def _add_validators(self, index, urlLoc, etag, lastModified):
+        self._update(
+            index,
+            urlLoc,
+            {
+                "etag": etag,
+                "lastModified": lastModified,
+                "fetchedAt": int(time.time() * 1000),
+            },
+        )
+
+    def _get_validators(self, docType, urlLoc):
+        self.flush()
+        doc = docType.get(id=urlLoc, using=self.conn, ignore=404)
+        if doc is not None:
+            return doc.etag, doc.lastModified
+        return None, None
+
+    def _get_child_depth(self, parentUrl):
+        """depth of urls found on the parent content page"""
+        if parentUrl is None:
+            return 0
+        parent = Url.get(id=parentUrl, using=self.conn, ignore=404)
+        if parent is not None and parent.depth is not None:
+            return parent.depth + 1
+        return 1
+
     def _get_next_to_visit_query(self, index):
         return (
             Search(using=self.conn, index=index)
-            .query("match", visited=False)
-            .extra(size=25)
+            .filter("term", visited=False)
+            .sort(*FRONTIER_SORT)
+            .extra(size=1)
         )
 
     def _run_setup(self):
         index_body = {
             "settings": {"index": {"number_of_shards": 1, "number_of_replicas": 1}}
         }
+        if self.highThroughput:
+            index_body["settings"]["index"]["refresh_interval"] = self.refreshInterval
         logging.info("Setting Up OpenSearch Indices")
         if not self.conn.indices.exists(URL_INDEX):
             response = self.conn.indices.create(URL_INDEX, index_body)
@@ -159,6 +772,31 @@ class SimpleOpenSearchDataStore:
         if not self.conn.indices.exists(STORED_PIC_INDEX):
             response = self.conn.indices.create(STORED_PIC_INDEX, index_body)
             logging.info(response)
+        if not self.conn.indices.exists(PIC_URL_HASH_INDEX):
+            response = self.conn.indices.create(PIC_URL_HASH_INDEX, index_body)
+            logging.info(response)
+        if not self.conn.indices.exists(PIC_PERCEPTUAL_HASH_INDEX):
+            response = self.conn.indices.create(PIC_PERCEPTUAL_HASH_INDEX, index_body)
+            logging.info(response)
+        if not self.conn.indices.exists(CANONICALIZATION_STATS_INDEX):
+            response = self.conn.indices.create(CANONICALIZATION_STATS_INDEX, index_body)
+            logging.info(response)
+        if not self.conn.indices.exists(WORKER_INDEX):
+            response = self.conn.indices.create(WORKER_INDEX, index_body)
+            logging.info(response)
+        if not self.conn.indices.exists(FRONTIER_INFO_INDEX):
+            response = self.conn.indices.create(FRONTIER_INFO_INDEX, index_body)
+            logging.info(response)
+        if self.highThroughput:
+            # indices made by an earlier run still carry their own interval
+            for index in (URL_INDEX, PIC_URL_INDEX, STORED_PIC_INDEX, PIC_URL_HASH_INDEX):
+                self.conn.indices.put_settings(
+                    index=index, body={"index": {"refresh_interval": self.refreshInterval}}
+                )
         Url.init(using=self.conn)
         PicUrl.init(using=self.conn)
         StoredPic.init(using=self.conn)
+        PicUrlHash.init(using=self.conn)
+        PicPerceptualHash.init(using=self.conn)
+        Worker.init(using=self.conn)
+        FrontierInfo.init(using=self.conn)
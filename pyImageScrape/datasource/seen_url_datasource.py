@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import threading
+
+from collections import OrderedDict
+from shared import DataStore
+from datasource.bloom_filter import ScalableBloomFilter
+
+CONTENT_URLS = "content"
+PIC_URLS = "pic"
+
+
+class SeenUrlFilter:
+    """exact lru of recent urls in front of a scalable bloom filter of every url ever seen"""
+
+    def __init__(self, lruSize, bloom: ScalableBloomFilter):
+        self.lruSize = lruSize
+        self.bloom = bloom
+        self.lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def filter_unseen(self, urls):
+        """returns the urls not seen before"""
+        unseen = []
+        for url in dict.fromkeys(urls):
+            if url in self.lru:
+                self.lru.move_to_end(url)
+                self.hits += 1
+            elif url in self.bloom:
+                self._remember(url)
+                self.hits += 1
+            else:
+                unseen.append(url)
+                self.misses += 1
+        return unseen
+
+    def mark_seen(self, urls):
+        for url in urls:
+            self.bloom.add(url)
+            self._remember(url)
+
+    def _remember(self, url):
+        self.lru[url] = True
+        if len(self.lru) > self.lruSize:
+            self.lru.popitem(last=False)
+
+
+class SeenUrlCacheDataStore:
+    """
+    wrapper that drops urls this process has already sent to the frontier before
+    they cost a datastore round trip. a bloom false positive silently drops a new
+    url, so keep falsePositiveRate small. with persistPath set the bloom filters
+    are saved on close with the datastore's frontier id, and only loaded back on
+    the next start if the frontier is still the one they were saved against.
+    start_recrawl empties them.
+    everything else is passed straight through to the wrapped datastore.
+    """
+
+    def __init__(
+        self,
+        dataStore: DataStore,
+        lruSize=100_000,
+        initialCapacity=1_000_000,
+        falsePositiveRate=0.00001,
+        persistPath: str = None,
+    ):
+        self.dataStore = dataStore
+        self.persistPath = persistPath
+        self.lruSize = lruSize
+        self.initialCapacity = initialCapacity
+        self.falsePositiveRate = falsePositiveRate
+        self._lock = threading.Lock()
+        frontierId = self.dataStore.get_frontier_id() if persistPath is not None else None
+        self._filters = self._build_filters(self._is_saved_for(frontierId))
+
+    def __getattr__(self, name):
+        return getattr(self.dataStore, name)
+
+    def add_to_visit_content_urls(self, urlLocs, parentUrl=None, priority=0):
+        return self._add_unseen(
+            CONTENT_URLS, urlLocs, parentUrl, priority, self.dataStore.add_to_visit_content_urls
+        )
+
+    def add_to_visit_pic_urls(self, urlLocs, parentUrl=None, priority=0):
+        return self._add_unseen(
+            PIC_URLS, urlLocs, parentUrl, priority, self.dataStore.add_to_visit_pic_urls
+        )
+
+    def start_recrawl(self):
+        with self._lock:
+            self._filters = self._build_filters(False)
+        return self.dataStore.start_recrawl()
+
+    def get_seen_url_stats(self):
+        """hit/miss counters per url kind, plus totals"""
+        with self._lock:
+            stats = {
+                kind: {"hits": seen.hits, "misses": seen.misses}
+                for kind, seen in self._filters.items()
+            }
+        stats["hits"] = sum(stats[kind]["hits"] for kind in self._filters)
+        stats["misses"] = sum(stats[kind]["misses"] for kind in self._filters)
+        return stats
+
+    def close(self):
+        if self.persistPath is not None:
+            frontierId = self.dataStore.get_frontier_id()
+            if os.path.exists(self._frontier_id_path()):
+                os.remove(self._frontier_id_path())
+            with self._lock:
+                for kind, seen in self._filters.items():
+                    seen.bloom.save(self._bloom_path(kind))
+            # written last, blooms without a matching id are never loaded
+            with open(self._frontier_id_path(), "w") as f:
+                f.write(frontierId)
+        logging.info(f"Seen url cache {self.get_seen_url_stats()}")
+        self.dataStore.close()
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _add_unseen(self, kind, urlLocs, parentUrl, priority, addToVisit):
+        """passes only unseen urls on, they're marked seen once the datastore has them"""
+        with self._lock:
+            unseen = self._filters[kind].filter_unseen(url for url in urlLocs if url)
+        if len(unseen) == 0:
+            return 0
+        newCount = addToVisit(unseen, parentUrl, priority)
+        with self._lock:
+            self._filters[kind].mark_seen(unseen)
+        return newCount
+
+    def _build_filters(self, loadSaved):
+        return {
+            kind: SeenUrlFilter(
+                self.lruSize,
+                (self._load_bloom(kind) if loadSaved else None)
+                or ScalableBloomFilter(self.initialCapacity, self.falsePositiveRate),
+            )
+            for kind in (CONTENT_URLS, PIC_URLS)
+        }
+
+    def _bloom_path(self, kind):
+        return self.persistPath + "." + kind
+
+    def _frontier_id_path(self):
+        return self.persistPath + ".id"
+
+    def _is_saved_for(self, frontierId):
+        """whether the saved blooms were made against this frontier, a new or recrawled one has new urls to see"""
+        if frontierId is None or not os.path.exists(self._frontier_id_path()):
+            return False
+        with open(self._frontier_id_path()) as f:
+            savedId = f.read().strip()
+        if savedId != frontierId:
+            logging.info("Seen url cache was saved for another frontier, starting empty")
+            return False
+        return True
+
+    def _load_bloom(self, kind):
+        if self.persistPath is None or not os.path.exists(self._bloom_path(kind)):
+            return None
+        try:
+            return ScalableBloomFilter.load(self._bloom_path(kind))
+        except Exception as e:
+            logging.warning(f"Could not load seen url cache, starting empty: {e}")
+            return None
@@ -2,49 +2,181 @@
 # -*- coding: utf-8 -*-
 
 import sqlite3
+import threading
+import time
+import uuid
 
 from shared import get_current_folder
 
+# columns added after tables were first released, older dbs get them through ALTER TABLE
+FRONTIER_COLUMNS = [
+    ("leaseExpires", "REAL"),
+    ("depth", "INTEGER DEFAULT 0"),
+    ("priority", "INTEGER DEFAULT 0"),
+    ("discoveredAt", "REAL"),
+    ("attempts", "INTEGER DEFAULT 0"),
+    ("nextEligibleAt", "REAL"),
+    ("errClass", "TEXT"),
+    ("etag", "TEXT"),
+    ("lastModified", "TEXT"),
+    ("fetchedAt", "REAL"),
+    ("leaseOwner", "TEXT"),
+]
+STORED_PIC_COLUMNS = [
+    ("storedSize", "INTEGER"),
+    ("encodeSeconds", "REAL"),
+]
+MIGRATION_COLUMNS = {
+    "urls": FRONTIER_COLUMNS,
+    "picUrls": FRONTIER_COLUMNS,
+    "storedPics": STORED_PIC_COLUMNS,
+}
+# covering indexes over migrated columns, dropped when their table gains a column
+# so indexSetup.sql builds them again with the new column list
+MIGRATION_INDEXES = {
+    "urls": ["urls_frontier_bfs", "urls_frontier_priority"],
+    "picUrls": ["picUrls_frontier_bfs", "picUrls_frontier_priority"],
+}
+
 
 class DatabaseConnector:
+    """
+    keeps one sqlite connection open per thread. the db runs in WAL mode so
+    readers never block on the writer, while all writes go through a single
+    lock so only one thread is ever writing at a time. the conns of threads
+    that have exited are closed whenever a new thread opens its conn.
+    """
 
-    def __init__(self, dataFolder, dbSetupFolder=get_current_folder(__file__)):
+    def __init__(
+        self,
+        dataFolder,
+        dbSetupFolder=get_current_folder(__file__),
+        journalMode="WAL",
+        synchronous="NORMAL",
+        cacheSize=-64000,
+        busyTimeout=30,
+    ):
         self.setupFileLoc = dbSetupFolder + "/tableSetup.sql"
+        self.indexSetupFileLoc = dbSetupFolder + "/indexSetup.sql"
         self.dbPath = dataFolder + "/sqllite.db"
+        self.journalMode = journalMode
+        self.synchronous = synchronous
+        self.cacheSize = cacheSize
+        self.busyTimeout = busyTimeout
+        self._local = threading.local()
+        self._writeLock = threading.Lock()
+        self._connsLock = threading.Lock()
+        # thread -> its conn, so conns of threads that have exited can be closed
+        self._conns = {}
         self._run_setup()
 
     def _create_connection(self):
         """create db conn"""
-        conn = sqlite3.connect(self.dbPath)
+        conn = sqlite3.connect(
+            self.dbPath, timeout=self.busyTimeout, check_same_thread=False
+        )
         conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA journal_mode = {self.journalMode};")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous};")
+        conn.execute(f"PRAGMA cache_size = {int(self.cacheSize)};")
+        return conn
+
+    def _get_connection(self):
+        """gets the open conn for the current thread, creating it if needed"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._create_connection()
+            self._local.conn = conn
+            with self._connsLock:
+                self._close_dead_conns()
+                self._conns[threading.current_thread()] = conn
         return conn
 
+    def _close_dead_conns(self):
+        """called holding self._connsLock, closes the conns of threads that have exited"""
+        for thread in [thread for thread in self._conns if not thread.is_alive()]:
+            try:
+                self._conns.pop(thread).close()
+            except sqlite3.Error:
+                pass
+
     def _run_setup(self):
         """sets up database tables"""
-        with self._create_connection() as conn:
-            cursor = conn.cursor()
-            sql_file = open(self.setupFileLoc)
-            sql_as_string = sql_file.read()
-            cursor.executescript(sql_as_string)
+        conn = self._get_connection()
+        with self._writeLock:
+            with open(self.setupFileLoc) as sql_file:
+                conn.executescript(sql_file.read())
+            self._run_migrations(conn)
+            # indexes can reference migrated columns, so they go last
+            with open(self.indexSetupFileLoc) as sql_file:
+                conn.executescript(sql_file.read())
+            conn.commit()
+
+    def _run_migrations(self, conn):
+        """adds any columns missing from dbs made by older versions"""
+        for table, columns in MIGRATION_COLUMNS.items():
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table});")}
+            missing = [(column, columnType) for column, columnType in columns if column not in existing]
+            for column, columnType in missing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {columnType};")
+            if len(missing) > 0:
+                for index in MIGRATION_INDEXES.get(table, []):
+                    conn.execute(f"DROP INDEX IF EXISTS {index};")
+
+    def _is_read(self, query):
+        return query.lstrip()[:6].upper() == "SELECT"
 
     def execute(self, query, args):
         """Executes sql statements, and maps response to objects"""
-        with self._create_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, args)
-            conn.commit()
-            dictList = [dict(row) for row in cursor.fetchall()]
+        conn = self._get_connection()
+        if self._is_read(query):
+            cursor = conn.execute(query, args)
+            return [dict(row) for row in cursor.fetchall()]
+        with self._writeLock:
+            try:
+                cursor = conn.execute(query, args)
+                dictList = [dict(row) for row in cursor.fetchall()]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
             return dictList
 
-    def executeBatch(self, query, argsList):
-        """Executes sql statements, and maps response to objects"""
-        with self._create_connection() as conn:
-            cursor = conn.cursor()
-            for arg in argsList:
-                cursor.execute(query, arg)
-            conn.commit()
-            dictList = [dict(row) for row in cursor.fetchall()]
-            return dictList
+    def executeIter(self, query, args, batchSize=10000):
+        """Runs a read and yields rows as dicts without loading them all at once"""
+        # own conn, so a long scan never holds a read snapshot on the thread's shared one
+        cursor = self._create_connection().execute(query, args)
+        try:
+            rows = cursor.fetchmany(batchSize)
+            while rows:
+                for row in rows:
+                    yield dict(row)
+                rows = cursor.fetchmany(batchSize)
+        finally:
+            cursor.connection.close()
+
+    def executeMany(self, query, argsList):
+        """Executes one statement over every arg in a single transaction, returns rows changed"""
+        conn = self._get_connection()
+        with self._writeLock:
+            try:
+                cursor = conn.executemany(query, argsList)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return cursor.rowcount
+
+    def close(self):
+        """closes every conn opened by this connector"""
+        with self._connsLock:
+            conns, self._conns = self._conns, {}
+        for conn in conns.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
 
 
 class SqlLiteDataStore:
@@ -52,25 +184,108 @@ class SqlLiteDataStore:
     CONTENT_URL_TB = "urls"
     PIC_URL_TB = "picUrls"
 
-    CREATE = "INSERT OR IGNORE INTO TB_URL (urlLoc, visited) VALUES (?,?);"
-    READ_ONE_LIMIT = "SELECT * FROM TB_URL WHERE visited = ? LIMIT 1;"
-    READ_ALL = "SELECT * FROM TB_URL WHERE visited = ? LIMIT ?;"
+    # frontier orders, each backed by a partial index over unvisited rows (see indexSetup.sql)
+    FRONTIER_ORDERS = {
+        "bfs": "depth, priority DESC, discoveredAt",
+        "priority": "priority DESC, depth, discoveredAt",
+    }
+
+    CREATE = "INSERT OR IGNORE INTO TB_URL (urlLoc, visited, depth, priority, discoveredAt) VALUES (?,0,?,?,?);"
+    READ_DEPTH = "SELECT depth FROM TB_URL WHERE urlLoc = ?;"
+    READ_ONE_LIMIT = "SELECT urlLoc FROM TB_URL WHERE visited = 0 ORDER BY FRONTIER_ORDER LIMIT 1;"
+    READ_ALL = "SELECT urlLoc FROM TB_URL WHERE visited = 0 ORDER BY FRONTIER_ORDER LIMIT ?;"
     UPDATE_URL = "UPDATE TB_URL SET urlLoc = ?, visited = ?, err = ? WHERE urlLoc = ?;"
-    CREATE_STORED_PIC_URL = "INSERT OR IGNORE INTO storedPics (urlLoc, filePath, shaPicHash) VALUES (?,?,?);"
+    UPDATE_FAILED_URL = (
+        "UPDATE TB_URL SET visited = ?, err = ?, errClass = ?, attempts = ?, "
+        "nextEligibleAt = ?, leaseExpires = NULL WHERE urlLoc = ?;"
+    )
+    UPDATE_VALIDATORS = "UPDATE TB_URL SET etag = ?, lastModified = ?, fetchedAt = ? WHERE urlLoc = ?;"
+    READ_VALIDATORS = "SELECT etag, lastModified FROM TB_URL WHERE urlLoc = ?;"
+    RESET_VISITED = (
+        "UPDATE TB_URL SET visited = 0, leaseExpires = NULL, attempts = 0, nextEligibleAt = NULL "
+        "WHERE visited = 1;"
+    )
+    RELEASE_LEASES = (
+        "UPDATE TB_URL SET leaseExpires = NULL, leaseOwner = NULL "
+        "WHERE leaseOwner = ? AND visited = 0;"
+    )
+    # only leased urls can have been in flight, the scan runs over picUrls_lease_owner
+    # and checks each url by key, so neither the frontier nor storedPics is walked
+    RECONCILE_STORED_PICS = (
+        "UPDATE picUrls SET visited = 1, err = NULL, leaseExpires = NULL, leaseOwner = NULL "
+        "WHERE leaseOwner IS NOT NULL AND visited = 0 "
+        "AND (EXISTS (SELECT 1 FROM storedPics WHERE storedPics.urlLoc = picUrls.urlLoc) "
+        "OR EXISTS (SELECT 1 FROM picUrlHashes WHERE picUrlHashes.urlLoc = picUrls.urlLoc));"
+    )
+    UPSERT_WORKER_HEARTBEAT = (
+        "INSERT INTO workers (workerId, heartbeatAt) VALUES (?,?) "
+        "ON CONFLICT(workerId) DO UPDATE SET heartbeatAt = excluded.heartbeatAt;"
+    )
+    READ_DEAD_WORKERS = "SELECT workerId FROM workers WHERE heartbeatAt < ?;"
+    DELETE_WORKER = "DELETE FROM workers WHERE workerId = ?;"
+    CREATE_FRONTIER_ID = "INSERT OR IGNORE INTO frontierInfo (infoKey, infoValue) VALUES ('frontierId', ?);"
+    UPDATE_FRONTIER_ID = "INSERT OR REPLACE INTO frontierInfo (infoKey, infoValue) VALUES ('frontierId', ?);"
+    READ_FRONTIER_ID = "SELECT infoValue FROM frontierInfo WHERE infoKey = 'frontierId';"
+    READ_ATTEMPTS = "SELECT attempts FROM TB_URL WHERE urlLoc = ?;"
+    READ_NEXT_RETRY = (
+        "SELECT MIN(nextEligibleAt) AS nextEligibleAt FROM TB_URL "
+        "WHERE visited = 0 AND nextEligibleAt IS NOT NULL;"
+    )
+    # a recrawled url with new bytes takes over its row, unless another url already stored them
+    CREATE_STORED_PIC_URL = (
+        "INSERT INTO storedPics (urlLoc, filePath, shaPicHash, storedSize, encodeSeconds) "
+        "VALUES (?,?,?,?,?) "
+        "ON CONFLICT(urlLoc) DO UPDATE SET filePath = excluded.filePath, "
+        "shaPicHash = excluded.shaPicHash, storedSize = excluded.storedSize, "
+        "encodeSeconds = excluded.encodeSeconds "
+        "WHERE NOT EXISTS (SELECT 1 FROM storedPics WHERE shaPicHash = excluded.shaPicHash) "
+        "ON CONFLICT DO NOTHING;"
+    )
+    # a url that lost the race to store its bytes, or whose new bytes another url holds, keeps them as an alias
+    CREATE_LOST_STORED_PIC_ALIAS = (
+        "INSERT INTO picUrlHashes (urlLoc, shaPicHash) SELECT ?1, ?2 "
+        "WHERE NOT EXISTS (SELECT 1 FROM storedPics WHERE urlLoc = ?1 AND shaPicHash = ?2) "
+        "ON CONFLICT(urlLoc) DO UPDATE SET shaPicHash = excluded.shaPicHash;"
+    )
+    READ_STORED_PIC_PATH = "SELECT filePath FROM storedPics WHERE shaPicHash = ?;"
+    READ_STORED_PIC_HASHES = "SELECT shaPicHash FROM storedPics;"
+    CREATE_PIC_URL_HASH = (
+        "INSERT INTO picUrlHashes (urlLoc, shaPicHash) VALUES (?,?) "
+        "ON CONFLICT(urlLoc) DO UPDATE SET shaPicHash = excluded.shaPicHash;"
+    )
+    CREATE_PIC_PERCEPTUAL_HASH = "INSERT OR IGNORE INTO picPerceptualHashes (shaPicHash, perceptualHash) VALUES (?,?);"
+    READ_PIC_PERCEPTUAL_HASHES = "SELECT shaPicHash, perceptualHash FROM picPerceptualHashes;"
+    ADD_CANONICALIZATION_STATS = (
+        "INSERT INTO canonicalizationStats (rule, rewritten, collapsed) VALUES (?,?,?) "
+        "ON CONFLICT(rule) DO UPDATE SET rewritten = rewritten + excluded.rewritten, "
+        "collapsed = collapsed + excluded.collapsed;"
+    )
+    READ_CANONICALIZATION_STATS = "SELECT rule, rewritten, collapsed FROM canonicalizationStats;"
     CHECK_VISITED = "SELECT * FROM TB_URL WHERE urlLoc = ? AND visited = 1;"
     CHECK_EXISTS = "SELECT * FROM TB_URL WHERE urlLoc = ?;"
+    CLAIM = (
+        "UPDATE TB_URL SET leaseExpires = ?, leaseOwner = ? WHERE urlLoc IN ("
+        "SELECT urlLoc FROM TB_URL WHERE visited = 0 AND (leaseExpires IS NULL OR leaseExpires < ?) "
+        "AND (nextEligibleAt IS NULL OR nextEligibleAt <= ?) ORDER BY FRONTIER_ORDER LIMIT ?"
+        ") RETURNING urlLoc;"
+    )
 
-    def __init__(self, dbConn: DatabaseConnector):
+    def __init__(self, dbConn: DatabaseConnector, frontierOrder="bfs"):
         self.dbConn = dbConn
+        self.frontierOrder = SqlLiteDataStore.FRONTIER_ORDERS[frontierOrder]
 
     # ACCESSOR METHODS
     # ================================
 
-    def add_to_visit_content_urls(self, urlLocs):
-        self._add_to_visit_urls(urlLocs, SqlLiteDataStore.CONTENT_URL_TB)
+    def add_to_visit_content_urls(self, urlLocs, parentUrl=None, priority=0):
+        return self._add_to_visit_urls(
+            urlLocs, parentUrl, priority, SqlLiteDataStore.CONTENT_URL_TB
+        )
 
-    def add_to_visit_pic_urls(self, urlLocs):
-        self._add_to_visit_urls(urlLocs, SqlLiteDataStore.PIC_URL_TB)
+    def add_to_visit_pic_urls(self, urlLocs, parentUrl=None, priority=0):
+        return self._add_to_visit_urls(
+            urlLocs, parentUrl, priority, SqlLiteDataStore.PIC_URL_TB
+        )
 
     def get_next_pic_to_visit(self):
         return self._get_next_to_visit(SqlLiteDataStore.PIC_URL_TB)
@@ -79,7 +294,38 @@ class SqlLiteDataStore:
         return self._get_next_to_visit(SqlLiteDataStore.CONTENT_URL_TB)
 
     def get_all_pics_to_visit(self, n=10000):
-        return self._get_all_to_visit(str(n), SqlLiteDataStore.PIC_URL_TB)
+        return self._get_all_to_visit(n, SqlLiteDataStore.PIC_URL_TB)
+
+    def get_all_content_to_visit(self, n=10000):
+        return self._get_all_to_visit(n, SqlLiteDataStore.CONTENT_URL_TB)
+
+    def claim_pics_to_visit(self, n=1000, leaseSeconds=300, leaseOwner=None):
+        return self._claim_to_visit(n, leaseSeconds, leaseOwner, SqlLiteDataStore.PIC_URL_TB)
+
+    def claim_content_to_visit(self, n=1, leaseSeconds=600, leaseOwner=None):
+        return self._claim_to_visit(n, leaseSeconds, leaseOwner, SqlLiteDataStore.CONTENT_URL_TB)
+
+    def release_leases(self, leaseOwner):
+        released = 0
+        for table in (SqlLiteDataStore.CONTENT_URL_TB, SqlLiteDataStore.PIC_URL_TB):
+            query = SqlLiteDataStore.RELEASE_LEASES.replace("TB_URL", table)
+            released += self.dbConn.executeMany(query, [(leaseOwner,)])
+        return released
+
+    def add_worker_heartbeat(self, workerId):
+        self.dbConn.execute(SqlLiteDataStore.UPSERT_WORKER_HEARTBEAT, (workerId, time.time()))
+
+    def get_dead_workers(self, deadAfterSeconds):
+        resp = self.dbConn.execute(
+            SqlLiteDataStore.READ_DEAD_WORKERS, (time.time() - deadAfterSeconds,)
+        )
+        return [item["workerId"] for item in resp]
+
+    def remove_worker(self, workerId):
+        self.dbConn.execute(SqlLiteDataStore.DELETE_WORKER, (workerId,))
+
+    def reconcile_stored_pics(self):
+        return self.dbConn.executeMany(SqlLiteDataStore.RECONCILE_STORED_PICS, [()])
 
     def add_visited_content_url(self, urlLoc, err=None):
         self._add_visited_url(urlLoc, err, SqlLiteDataStore.CONTENT_URL_TB)
@@ -87,47 +333,171 @@ class SqlLiteDataStore:
     def add_visited_pic_url(self, urlLoc, err=None):
         self._add_visited_url(urlLoc, err, SqlLiteDataStore.PIC_URL_TB)
 
-    def add_stored_pic_url(self, urlLoc, filePath, shaPicHash):
+    def add_visited_pic_urls(self, visits):
+        query = SqlLiteDataStore.UPDATE_URL.replace("TB_URL", SqlLiteDataStore.PIC_URL_TB)
+        argsList = [(urlLoc, 1, err, urlLoc) for urlLoc, err in visits]
+        if len(argsList) > 0:
+            self.dbConn.executeMany(query, argsList)
+
+    def add_failed_pic_url(self, urlLoc, err, errClass, attempts, nextEligibleAt=None):
+        query = SqlLiteDataStore.UPDATE_FAILED_URL.replace("TB_URL", SqlLiteDataStore.PIC_URL_TB)
+        visited = 1 if nextEligibleAt is None else 0
+        self.dbConn.execute(query, (visited, err, errClass, attempts, nextEligibleAt, urlLoc))
+
+    def get_pic_attempts(self, urlLoc):
+        query = SqlLiteDataStore.READ_ATTEMPTS.replace("TB_URL", SqlLiteDataStore.PIC_URL_TB)
+        resp = self.dbConn.execute(query, (urlLoc,))
+        if len(resp) > 0 and resp[0]["attempts"] is not None:
+            return resp[0]["attempts"]
+        return 0
+
+    def get_next_pic_retry_at(self):
+        query = SqlLiteDataStore.READ_NEXT_RETRY.replace("TB_URL", SqlLiteDataStore.PIC_URL_TB)
+        return self.dbConn.execute(query, ())[0]["nextEligibleAt"]
+
+    def add_content_url_validators(self, urlLoc, etag, lastModified):
+        self._add_validators(urlLoc, etag, lastModified, SqlLiteDataStore.CONTENT_URL_TB)
+
+    def add_pic_url_validators(self, urlLoc, etag, lastModified):
+        self._add_validators(urlLoc, etag, lastModified, SqlLiteDataStore.PIC_URL_TB)
+
+    def get_content_url_validators(self, urlLoc):
+        return self._get_validators(urlLoc, SqlLiteDataStore.CONTENT_URL_TB)
+
+    def get_pic_url_validators(self, urlLoc):
+        return self._get_validators(urlLoc, SqlLiteDataStore.PIC_URL_TB)
+
+    def start_recrawl(self):
+        for table in (SqlLiteDataStore.CONTENT_URL_TB, SqlLiteDataStore.PIC_URL_TB):
+            self.dbConn.execute(SqlLiteDataStore.RESET_VISITED.replace("TB_URL", table), ())
+        self.dbConn.execute(SqlLiteDataStore.UPDATE_FRONTIER_ID, (uuid.uuid4().hex,))
+
+    def get_frontier_id(self):
+        self.dbConn.execute(SqlLiteDataStore.CREATE_FRONTIER_ID, (uuid.uuid4().hex,))
+        return self.dbConn.execute(SqlLiteDataStore.READ_FRONTIER_ID, ())[0]["infoValue"]
+
+    def add_stored_pic_url(self, urlLoc, filePath, shaPicHash, storedSize=None, encodeSeconds=None):
         # would also be good to save off timestamp of grab & alt data
+        self.add_stored_pic_urls([(urlLoc, filePath, shaPicHash, storedSize, encodeSeconds)])
+
+    def add_stored_pic_urls(self, storedPics):
+        # size & encode time are optional, older callers pass (urlLoc, filePath, shaPicHash)
+        argsList = [(tuple(storedPic) + (None, None))[:5] for storedPic in storedPics]
+        if len(argsList) > 0:
+            self.dbConn.executeMany(SqlLiteDataStore.CREATE_STORED_PIC_URL, argsList)
+            self.dbConn.executeMany(
+                SqlLiteDataStore.CREATE_LOST_STORED_PIC_ALIAS,
+                [(urlLoc, shaPicHash) for urlLoc, _, shaPicHash, _, _ in argsList],
+            )
+
+    def add_pic_url_alias(self, urlLoc, shaPicHash):
+        self.dbConn.execute(SqlLiteDataStore.CREATE_PIC_URL_HASH, (urlLoc, shaPicHash))
+
+    def get_stored_pic_path(self, shaPicHash):
+        resp = self.dbConn.execute(SqlLiteDataStore.READ_STORED_PIC_PATH, (shaPicHash,))
+        if len(resp) > 0:
+            return resp[0]["filePath"]
+        return None
+
+    def get_stored_pic_hashes(self):
+        for row in self.dbConn.executeIter(SqlLiteDataStore.READ_STORED_PIC_HASHES, ()):
+            yield row["shaPicHash"]
+
+    def add_pic_perceptual_hash(self, shaPicHash, perceptualHash):
+        # sqlite ints are signed 64 bit, store the unsigned hash's bit pattern
+        signedHash = perceptualHash - (1 << 64) if perceptualHash >= (1 << 63) else perceptualHash
         self.dbConn.execute(
-            SqlLiteDataStore.CREATE_STORED_PIC_URL, (urlLoc, filePath, shaPicHash)
+            SqlLiteDataStore.CREATE_PIC_PERCEPTUAL_HASH, (shaPicHash, signedHash)
         )
 
+    def get_pic_perceptual_hashes(self):
+        for row in self.dbConn.executeIter(SqlLiteDataStore.READ_PIC_PERCEPTUAL_HASHES, ()):
+            yield row["shaPicHash"], row["perceptualHash"] & 0xFFFFFFFFFFFFFFFF
+
+    def add_canonicalization_stats(self, stats):
+        argsList = [(rule, rewritten, collapsed) for rule, (rewritten, collapsed) in stats.items()]
+        if len(argsList) > 0:
+            self.dbConn.executeMany(SqlLiteDataStore.ADD_CANONICALIZATION_STATS, argsList)
+
+    def get_canonicalization_stats(self):
+        resp = self.dbConn.execute(SqlLiteDataStore.READ_CANONICALIZATION_STATS, ())
+        return {item["rule"]: (item["rewritten"], item["collapsed"]) for item in resp}
+
+    def close(self):
+        self.dbConn.close()
+
     # INTERNAL METHODS
     # ================================
 
-    def _add_to_visit_urls(self, urlLocs, table):
-        """add multiple urls to visit"""
-        argsList = []
-        for url in urlLocs:
-            argsList.append((url, 0))
+    def _add_to_visit_urls(self, urlLocs, parentUrl, priority, table):
+        """add multiple urls to visit, returns how many were new"""
+        # dedupe inside the batch so the db only sees each url once
+        urls = [url for url in dict.fromkeys(urlLocs) if url]
+        if len(urls) == 0:
+            return 0
+        depth = self._get_child_depth(parentUrl)
+        now = time.time()
+        argsList = [(url, depth, priority, now) for url in urls]
         query = SqlLiteDataStore.CREATE.replace("TB_URL", table)
-        self.dbConn.executeBatch(query, argsList)
+        return self.dbConn.executeMany(query, argsList)
+
+    def _get_child_depth(self, parentUrl):
+        """depth of urls found on the parent content page"""
+        if parentUrl is None:
+            return 0
+        query = SqlLiteDataStore.READ_DEPTH.replace(
+            "TB_URL", SqlLiteDataStore.CONTENT_URL_TB
+        )
+        resp = self.dbConn.execute(query, (parentUrl,))
+        if len(resp) > 0 and resp[0]["depth"] is not None:
+            return resp[0]["depth"] + 1
+        return 1
 
     def _add_visited_url(self, urlLoc, err, table):
         """tag url as visited"""
         query = SqlLiteDataStore.UPDATE_URL.replace("TB_URL", table)
         self.dbConn.execute(query, (urlLoc, 1, err, urlLoc))
 
+    def _add_validators(self, urlLoc, etag, lastModified, table):
+        query = SqlLiteDataStore.UPDATE_VALIDATORS.replace("TB_URL", table)
+        self.dbConn.execute(query, (etag, lastModified, time.time(), urlLoc))
+
+    def _get_validators(self, urlLoc, table):
+        query = SqlLiteDataStore.READ_VALIDATORS.replace("TB_URL", table)
+        resp = self.dbConn.execute(query, (urlLoc,))
+        if len(resp) > 0:
+            return resp[0]["etag"], resp[0]["lastModified"]
+        return None, None
+
     def _get_next_to_visit(self, table):
         """get the next url to visit"""
-        query = SqlLiteDataStore.READ_ONE_LIMIT.replace("TB_URL", table)
-        resp = self.dbConn.execute(query, (0,))
+        query = self._frontier_query(SqlLiteDataStore.READ_ONE_LIMIT, table)
+        resp = self.dbConn.execute(query, ())
         if len(resp) > 0:
             return resp[0]["urlLoc"]
         else:
             return None
 
+    def _claim_to_visit(self, n, leaseSeconds, leaseOwner, table):
+        """lease up to n unvisited urls, urls whose lease ran out can be claimed again"""
+        now = time.time()
+        query = self._frontier_query(SqlLiteDataStore.CLAIM, table)
+        resp = self.dbConn.execute(query, (now + leaseSeconds, leaseOwner, now, now, n))
+        return [item["urlLoc"] for item in resp]
+
     def _get_all_to_visit(self, size, table):
         """get all the next urls to visit"""
-        query = SqlLiteDataStore.READ_ALL.replace("TB_URL", table)
-        resp = self.dbConn.execute(query, (0,size))
+        query = self._frontier_query(SqlLiteDataStore.READ_ALL, table)
+        resp = self.dbConn.execute(query, (size,))
         visitList = []
         for item in resp:
             visitList.append(item["urlLoc"])
         return visitList
 
+    def _frontier_query(self, query, table):
+        return query.replace("TB_URL", table).replace("FRONTIER_ORDER", self.frontierOrder)
+
 
-def get_sqllite_datastore(dataPath: str):
+def get_sqllite_datastore(dataPath: str, frontierOrder="bfs", **connectorArgs):
     """gets an sqllite impl of the datasource"""
-    return SqlLiteDataStore(DatabaseConnector(dataPath))
+    return SqlLiteDataStore(DatabaseConnector(dataPath, **connectorArgs), frontierOrder)
@@ -1,17 +1,67 @@
 CREATE TABLE IF NOT EXISTS urls (
     urlLoc TEXT PRIMARY KEY NOT NULL,
     err TEXT,
-    visited INTEGER
+    visited INTEGER,
+    leaseExpires REAL,
+    depth INTEGER DEFAULT 0,
+    priority INTEGER DEFAULT 0,
+    discoveredAt REAL,
+    attempts INTEGER DEFAULT 0,
+    nextEligibleAt REAL,
+    errClass TEXT,
+    etag TEXT,
+    lastModified TEXT,
+    fetchedAt REAL,
+    leaseOwner TEXT
 );
 
 CREATE TABLE IF NOT EXISTS picUrls (
     urlLoc TEXT PRIMARY KEY NOT NULL,
     err TEXT,
-    visited INTEGER
+    visited INTEGER,
+    leaseExpires REAL,
+    depth INTEGER DEFAULT 0,
+    priority INTEGER DEFAULT 0,
+    discoveredAt REAL,
+    attempts INTEGER DEFAULT 0,
+    nextEligibleAt REAL,
+    errClass TEXT,
+    etag TEXT,
+    lastModified TEXT,
+    fetchedAt REAL,
+    leaseOwner TEXT
 );
 
 CREATE TABLE IF NOT EXISTS storedPics (
     shaPicHash TEXT PRIMARY KEY NOT NULL,
     filePath TEXT NOT NULL UNIQUE,
-    urlLoc TEXT NOT NULL UNIQUE 
+    urlLoc TEXT NOT NULL UNIQUE,
+    storedSize INTEGER,
+    encodeSeconds REAL
+);
+
+CREATE TABLE IF NOT EXISTS picUrlHashes (
+    urlLoc TEXT PRIMARY KEY NOT NULL,
+    shaPicHash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS picPerceptualHashes (
+    shaPicHash TEXT PRIMARY KEY NOT NULL,
+    perceptualHash INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS workers (
+    workerId TEXT PRIMARY KEY NOT NULL,
+    heartbeatAt REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS frontierInfo (
+    infoKey TEXT PRIMARY KEY NOT NULL,
+    infoValue TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS canonicalizationStats (
+    rule TEXT PRIMARY KEY NOT NULL,
+    rewritten INTEGER NOT NULL DEFAULT 0,
+    collapsed INTEGER NOT NULL DEFAULT 0
 );
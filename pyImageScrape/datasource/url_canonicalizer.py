@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+import urllib.parse
+
+# rule names, also the keys the datastore records stats under
+RULE_FRAGMENT = "fragment"
+RULE_CASE = "scheme_host_case"
+RULE_DEFAULT_PORT = "default_port"
+RULE_TRACKING_PARAMS = "tracking_params"
+RULE_SORTED_QUERY = "sorted_query"
+RULE_TRAILING_SLASH = "trailing_slash"
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+DEFAULT_TRACKING_PARAMS = [
+    r"^utm_",
+    r"^fbclid$",
+    r"^gclid$",
+    r"^dclid$",
+    r"^msclkid$",
+    r"^yclid$",
+    r"^igshid$",
+    r"^mc_(cid|eid)$",
+    r"^_ga$",
+    r"^_gl$",
+]
+
+
+class UrlCanonicalizer:
+    """
+    rewrites urls into one canonical form so the same page/pic isn't queued
+    under several spellings. every rule can be switched off, and tracking
+    params are dropped by regex so sites with their own junk params can add them.
+    stripping trailing slashes is opt-in, plenty of servers redirect /foo to /foo/
+    and the stripped url would cost a redirect (and a browser reload) on every visit.
+    """
+
+    def __init__(
+        self,
+        stripFragment=True,
+        lowercaseSchemeHost=True,
+        stripDefaultPort=True,
+        sortQuery=True,
+        stripTrailingSlash=False,
+        trackingParams=DEFAULT_TRACKING_PARAMS,
+    ):
+        self.stripFragment = stripFragment
+        self.lowercaseSchemeHost = lowercaseSchemeHost
+        self.stripDefaultPort = stripDefaultPort
+        self.sortQuery = sortQuery
+        self.stripTrailingSlash = stripTrailingSlash
+        self.trackingParams = [re.compile(pattern, re.IGNORECASE) for pattern in trackingParams]
+
+    def canonicalize(self, url: str):
+        """returns (canonical url, names of the rules that changed it)"""
+        try:
+            parsed = urllib.parse.urlsplit(url)
+            port = parsed.port
+        except ValueError:
+            # leave urls we can't parse alone
+            return url, []
+        applied = []
+        scheme, netloc, path, query, fragment = parsed
+
+        if self.stripFragment and fragment:
+            fragment = ""
+            applied.append(RULE_FRAGMENT)
+
+        if self.lowercaseSchemeHost:
+            # only the host part is case insensitive, keep any userinfo as is
+            userinfo, _, hostport = netloc.rpartition("@")
+            lowered = scheme.lower(), (userinfo + "@" if userinfo else "") + hostport.lower()
+            if lowered != (scheme, netloc):
+                scheme, netloc = lowered
+                applied.append(RULE_CASE)
+
+        if self.stripDefaultPort and port is not None and DEFAULT_PORTS.get(scheme) == port:
+            userinfo, _, hostport = netloc.rpartition("@")
+            hostport = hostport[: hostport.rfind(":")]
+            netloc = (userinfo + "@" if userinfo else "") + hostport
+            applied.append(RULE_DEFAULT_PORT)
+
+        if query:
+            # params are kept as written, so a valueless ?flag doesn't turn into flag=
+            params = [param for param in query.split("&") if param]
+            kept = [
+                param
+                for param in params
+                if not any(
+                    pattern.search(urllib.parse.unquote_plus(param.partition("=")[0]))
+                    for pattern in self.trackingParams
+                )
+            ]
+            if len(kept) != len(params):
+                applied.append(RULE_TRACKING_PARAMS)
+            if self.sortQuery:
+                ordered = sorted(kept, key=lambda param: param.partition("="))
+                if ordered != kept:
+                    kept = ordered
+                    applied.append(RULE_SORTED_QUERY)
+            if RULE_TRACKING_PARAMS in applied or RULE_SORTED_QUERY in applied:
+                query = "&".join(kept)
+
+        if path == "":
+            path = "/"
+        elif self.stripTrailingSlash and len(path) > 1 and path.endswith("/"):
+            path = path.rstrip("/") or "/"
+            applied.append(RULE_TRAILING_SLASH)
+
+        return urllib.parse.urlunsplit((scheme, netloc, path, query, fragment)), applied
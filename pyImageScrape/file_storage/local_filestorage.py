@@ -1,22 +1,50 @@
-
 import os
 import io
+import threading
 
 class LocalFileStorage:
     """
-    storage for local files
+    storage for local files.
+    directories already made are remembered so makedirs runs once per directory,
+    fsyncEvery > 0 fsyncs every fsyncEvery-th file, 0 leaves it to the os
     """
     def __init__(
         self,
         dataDir,
+        fsyncEvery=0,
     ):
         self.dataDir = dataDir
+        self.fsyncEvery = fsyncEvery
+        self._madeDirs = set()
+        self._lock = threading.Lock()
+        self._unsynced = 0
     
-    def store_file(self, bytes:bytes, path:str):
+    def store_file(self, bytes:bytes, path:str, onStored=None, onFailed=None):
         # calc full path
         savePath = self.dataDir + "/" + path
         # ensure directories exist
-        os.makedirs(os.path.dirname(savePath), exist_ok=True)
+        dirPath = os.path.dirname(savePath)
+        if dirPath not in self._madeDirs:
+            os.makedirs(dirPath, exist_ok=True)
+            self._madeDirs.add(dirPath)
         # write file to fs
         with open(savePath, "wb") as file:
             file.write(bytes)
+            if self.fsyncEvery > 0 and self._count_unsynced():
+                file.flush()
+                os.fsync(file.fileno())
+        # written synchronously, a failed write raises to the caller instead of calling onFailed
+        if onStored is not None:
+            onStored()
+
+    def close(self):
+        pass
+
+    def _count_unsynced(self):
+        """counts a written file, True when it's the one to fsync"""
+        with self._lock:
+            self._unsynced += 1
+            if self._unsynced < self.fsyncEvery:
+                return False
+            self._unsynced = 0
+            return True
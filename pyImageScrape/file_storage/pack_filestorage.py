@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import glob
+import logging
+import mmap
+import os
+import tarfile
+import threading
+import time
+
+TAR_BLOCK = 512
+SHARD_PATTERN = "shard-{:06d}.tar"
+INDEX_SUFFIX = ".idx"
+
+
+def get_path_sha(path: str):
+    """the sha a stored pic path was named after, aa/bb/cc/<sha>.png -> <sha>"""
+    return os.path.basename(path).split(".", 1)[0]
+
+
+def build_tar_member(name: str, data: bytes):
+    """ustar header + data padded to the block size, the data starts one block in"""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    padding = (TAR_BLOCK - len(data) % TAR_BLOCK) % TAR_BLOCK
+    return info.tobuf(format=tarfile.USTAR_FORMAT) + data + b"\0" * padding
+
+
+class PackEntry:
+    """where one stored pic's bytes sit inside a shard"""
+
+    def __init__(self, shard: int, offset: int, length: int):
+        self.shard = shard
+        self.offset = offset
+        self.length = length
+
+
+class PackFileStorage:
+    """
+    storage that appends pics into large tar shards (WebDataset style, one member
+    per pic named <sha>.<ext>) instead of one file each, so millions of pics cost
+    a few hundred files. every shard has a sidecar index of sha, offset & length
+    lines that's read back on start, so read_file() finds a pic by sha in one
+    mmap slice. writes are batched: up to maxBatchFiles pics / maxBatchBytes are
+    held in memory and appended with one write, at the latest maxBatchAge seconds
+    after the first one came in. fsyncEvery > 0 fsyncs shard and index after every
+    fsyncEvery pics, and after a batch flushed by age, 0 leaves it to the os.
+    a pic's onStored only runs once its batch is appended, and fsynced when
+    fsyncEvery is set, so the datastore never records a pic a crash can still lose.
+    each run starts a new shard, shards roll over once they pass maxShardBytes.
+    """
+
+    def __init__(
+        self,
+        dataDir,
+        maxShardBytes=1024 * 1024 * 1024,
+        maxBatchFiles=64,
+        maxBatchBytes=16 * 1024 * 1024,
+        maxBatchAge=2.0,
+        fsyncEvery=0,
+    ):
+        self.dataDir = dataDir
+        self.maxShardBytes = maxShardBytes
+        self.maxBatchFiles = maxBatchFiles
+        self.maxBatchBytes = maxBatchBytes
+        self.maxBatchAge = maxBatchAge
+        self.fsyncEvery = fsyncEvery
+        self._lock = threading.Lock()
+        self._writeLock = threading.Lock()
+        self._index = {}
+        self._pending = {}
+        self._pendingBytes = 0
+        self._oldest = None
+        self._unsynced = 0
+        self._unsyncedCallbacks = []
+        self._maps = {}
+        os.makedirs(dataDir, exist_ok=True)
+        self._shard = self._load_index() + 1
+        self._packFile = None
+        self._indexFile = None
+        self._packSize = 0
+        self._closed = False
+        self._wake = threading.Event()
+        self._flusher = threading.Thread(target=self._run_flusher, daemon=True)
+        self._flusher.start()
+
+    def store_file(self, bytes: bytes, path: str, onStored=None, onFailed=None):
+        sha = get_path_sha(path)
+        with self._lock:
+            if sha in self._pending:
+                # same bytes waiting in this batch, recorded when it lands
+                self._pending[sha][2].append((onStored, onFailed))
+                return
+            stored = sha in self._index
+            if not stored:
+                self._pending[sha] = (os.path.basename(path), bytes, [(onStored, onFailed)])
+                self._pendingBytes += len(bytes)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._wake.set()
+            full = (
+                len(self._pending) >= self.maxBatchFiles
+                or self._pendingBytes >= self.maxBatchBytes
+            )
+        if stored:
+            self._run_callback(onStored)
+        elif full:
+            try:
+                self.flush()
+            except Exception as e:
+                # every pic of the batch, this one too, already went to its onFailed
+                logging.error(f"Failed to append pack batch: {e}")
+
+    def read_file(self, shaPicHash: str):
+        """bytes of a stored pic, None if it isn't stored"""
+        with self._lock:
+            if shaPicHash in self._pending:
+                return self._pending[shaPicHash][1]
+            entry = self._index.get(shaPicHash)
+        if entry is None:
+            return None
+        fileMap = self._get_map(entry.shard, entry.offset + entry.length)
+        return fileMap[entry.offset : entry.offset + entry.length]
+
+    def __contains__(self, shaPicHash: str):
+        with self._lock:
+            return shaPicHash in self._pending or shaPicHash in self._index
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index) + len(self._pending)
+
+    def flush(self, forceSync=False):
+        """appends every held pic to the current shard, forceSync fsyncs it whatever the count"""
+        with self._writeLock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pendingBytes = 0
+                self._oldest = None
+            if len(pending) > 0:
+                callbacks = [callback for _, _, batched in pending.values() for callback in batched]
+                try:
+                    entries = self._append(pending)
+                except Exception as e:
+                    for _, onFailed in callbacks:
+                        self._run_callback(onFailed, e)
+                    raise
+                with self._lock:
+                    self._index.update(entries)
+                self._unsynced += len(pending)
+                self._unsyncedCallbacks.extend(callbacks)
+            if self.fsyncEvery > 0 and self._unsynced > 0:
+                if forceSync or self._unsynced >= self.fsyncEvery:
+                    self._sync()
+            landed = self._unsyncedCallbacks if self.fsyncEvery <= 0 or self._unsynced == 0 else []
+            if len(landed) > 0:
+                self._unsyncedCallbacks = []
+        for onStored, _ in landed:
+            self._run_callback(onStored)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush(forceSync=True)
+        with self._writeLock:
+            self._close_shard()
+            with self._lock:
+                maps, self._maps = self._maps, {}
+            for fileMap, _ in maps.values():
+                fileMap.close()
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _append(self, pending):
+        """writes a batch to the current shard, returns its index entries"""
+        if self._packFile is not None and self._packSize >= self.maxShardBytes:
+            self._close_shard()
+            self._shard += 1
+        if self._packFile is None:
+            self._open_shard()
+        chunks = []
+        indexLines = []
+        entries = {}
+        offset = self._packSize
+        for sha, (name, data, _) in pending.items():
+            member = build_tar_member(name, data)
+            entries[sha] = PackEntry(self._shard, offset + TAR_BLOCK, len(data))
+            indexLines.append(f"{sha}\t{offset + TAR_BLOCK}\t{len(data)}\t{name}\n")
+            chunks.append(member)
+            offset += len(member)
+        # pack first, an index line never points past what's on disk
+        self._packFile.write(b"".join(chunks))
+        self._packFile.flush()
+        self._indexFile.write("".join(indexLines))
+        self._indexFile.flush()
+        self._packSize = offset
+        return entries
+
+    def _sync(self):
+        os.fsync(self._packFile.fileno())
+        os.fsync(self._indexFile.fileno())
+        self._unsynced = 0
+
+    def _run_callback(self, callback, *args):
+        """a failing callback is logged, it mustn't stop the rest of the batch"""
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logging.error(f"Failed to record pack write result: {e}")
+
+    def _shard_path(self, shard):
+        return os.path.join(self.dataDir, SHARD_PATTERN.format(shard))
+
+    def _load_index(self):
+        """reads every shard's index, returns the highest shard number or -1"""
+        lastShard = -1
+        for indexPath in sorted(glob.glob(os.path.join(self.dataDir, "shard-*.tar" + INDEX_SUFFIX))):
+            shardPath = indexPath[: -len(INDEX_SUFFIX)]
+            shard = int(os.path.basename(shardPath)[len("shard-") : -len(".tar")])
+            lastShard = max(lastShard, shard)
+            shardSize = os.path.getsize(shardPath) if os.path.exists(shardPath) else 0
+            with open(indexPath) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    # a torn last line or a pic the crash kept off disk
+                    if len(parts) != 4:
+                        continue
+                    sha, offset, length = parts[0], int(parts[1]), int(parts[2])
+                    if offset + length > shardSize:
+                        continue
+                    self._index[sha] = PackEntry(shard, offset, length)
+        logging.info(f"Loaded pack index with {len(self._index)} stored pics")
+        return lastShard
+
+    def _open_shard(self):
+        self._packFile = open(self._shard_path(self._shard), "ab")
+        self._indexFile = open(self._shard_path(self._shard) + INDEX_SUFFIX, "a")
+        self._packSize = self._packFile.tell()
+
+    def _close_shard(self):
+        if self._packFile is None:
+            return
+        # two zero blocks end the archive, so tar & webdataset readers take the shard as is
+        self._packFile.write(b"\0" * (TAR_BLOCK * 2))
+        if self.fsyncEvery > 0:
+            os.fsync(self._packFile.fileno())
+            os.fsync(self._indexFile.fileno())
+        self._packFile.close()
+        self._indexFile.close()
+        self._packFile = None
+        self._indexFile = None
+
+    def _get_map(self, shard, end):
+        """mmap of a shard, re-mapped once it has grown past what the old map covers"""
+        with self._lock:
+            fileMap, size = self._maps.get(shard, (None, 0))
+            if fileMap is not None and size >= end:
+                return fileMap
+            with open(self._shard_path(shard), "rb") as f:
+                newMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard] = (newMap, len(newMap))
+        # readers still slicing the old map keep it alive until they're done
+        return newMap
+
+    def _run_flusher(self):
+        """flushes a batch once its first pic is maxBatchAge seconds old"""
+        while not self._closed:
+            with self._lock:
+                oldest = self._oldest
+            if oldest is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            waitSeconds = oldest + self.maxBatchAge - time.monotonic()
+            if waitSeconds > 0:
+                self._wake.wait(waitSeconds)
+                self._wake.clear()
+                continue
+            try:
+                # a batch flushed by age is a slow trickle, sync it rather than keep its pics waiting
+                self.flush(forceSync=True)
+            except Exception as e:
+                logging.error(f"Failed to flush pack batch: {e}")
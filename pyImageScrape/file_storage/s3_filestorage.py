@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import logging
+import mimetypes
+import queue
+import threading
+
+import boto3
+
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# put on the upload queue once per upload thread when closing
+_STOP_UPLOADING = None
+
+
+class S3FileStorage:
+    """
+    storage for any s3 compatible object store (aws, minio, ...).
+    store_file only queues the bytes, uploadThreads upload them in the background
+    over one pooled client, so downloads never wait on the object store. onStored
+    runs on the upload thread once the object is up, onFailed(e) when the upload
+    gave up after the client's own retries. the queue
+    is bounded by maxQueuedBytes, store_file blocks once that much is waiting.
+    objects past multipartThreshold go up as multipart uploads, multipartChunkSize
+    at a time. keys are content hashes, so a key that already exists is never
+    uploaded again, and a key stored again while its first copy is still queued
+    or uploading just waits on that upload's result. close() waits until
+    everything queued is uploaded.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        keyPrefix="",
+        client=None,
+        endpointUrl: str = None,
+        uploadThreads=8,
+        maxQueuedBytes=256 * 1024 * 1024,
+        multipartThreshold=8 * 1024 * 1024,
+        multipartChunkSize=8 * 1024 * 1024,
+        skipExisting=True,
+    ):
+        self.bucket = bucket
+        self.keyPrefix = keyPrefix
+        self.maxQueuedBytes = maxQueuedBytes
+        self.skipExisting = skipExisting
+        # the client is thread safe, its connection pool is shared by every upload thread
+        self.client = (
+            client
+            if client is not None
+            else boto3.client(
+                "s3",
+                endpoint_url=endpointUrl,
+                config=Config(
+                    max_pool_connections=uploadThreads * 2,
+                    retries={"max_attempts": 5, "mode": "adaptive"},
+                ),
+            )
+        )
+        self.transferConfig = TransferConfig(
+            multipart_threshold=multipartThreshold,
+            multipart_chunksize=multipartChunkSize,
+            max_concurrency=2,
+            use_threads=True,
+        )
+        self.uploaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._queuedBytes = 0
+        # key -> callbacks of later stores of the same key, guarded by _queuedCond
+        self._inFlight = {}
+        self._queuedCond = threading.Condition()
+        self._statsLock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._run_uploader, daemon=True)
+            for _ in range(uploadThreads)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def store_file(self, bytes: bytes, path: str, onStored=None, onFailed=None):
+        key = self.keyPrefix + path
+        with self._queuedCond:
+            if self.skipExisting and key in self._inFlight:
+                self._inFlight[key].append((onStored, onFailed))
+                return
+            # an object bigger than the bound still goes once the queue is empty
+            while self._queuedBytes > 0 and self._queuedBytes + len(bytes) > self.maxQueuedBytes:
+                self._queuedCond.wait()
+            self._queuedBytes += len(bytes)
+            if self.skipExisting:
+                self._inFlight[key] = []
+        self._queue.put((key, bytes, onStored, onFailed))
+
+    def close(self):
+        """waits for the queued uploads, then stops the upload threads"""
+        for _ in self._workers:
+            self._queue.put(_STOP_UPLOADING)
+        for worker in self._workers:
+            worker.join()
+        logging.info(
+            f"S3 storage uploaded={self.uploaded} skipped={self.skipped} failed={self.failed}"
+        )
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _run_uploader(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP_UPLOADING:
+                return
+            key, data, onStored, onFailed = item
+            error = None
+            try:
+                self._upload(key, data)
+            except Exception as e:
+                logging.error(f"Failed to upload {key=} to s3: {e}")
+                with self._statsLock:
+                    self.failed += 1
+                error = e
+            with self._queuedCond:
+                self._queuedBytes -= len(data)
+                waiters = self._inFlight.pop(key, [])
+                self._queuedCond.notify_all()
+            # stores of the same key that came in meanwhile share this upload's result
+            for stored, failed in [(onStored, onFailed)] + waiters:
+                if error is None:
+                    self._run_callback(stored)
+                else:
+                    self._run_callback(failed, error)
+
+    def _run_callback(self, callback, *args):
+        """a failing callback is logged, it mustn't take the upload thread down"""
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logging.error(f"Failed to record s3 upload result: {e}")
+
+    def _upload(self, key, data):
+        if self.skipExisting and self._exists(key):
+            with self._statsLock:
+                self.skipped += 1
+            return
+        contentType = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        # upload_fileobj switches to multipart past multipartThreshold
+        self.client.upload_fileobj(
+            io.BytesIO(data),
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": contentType},
+            Config=self.transferConfig,
+        )
+        with self._statsLock:
+            self.uploaded += 1
+
+    def _exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
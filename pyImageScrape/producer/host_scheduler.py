@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import email.utils
+import logging
+import math
+import threading
+import time
+import urllib.parse
+
+
+def get_url_host(url: str):
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+def parse_retry_after(value):
+    """seconds to wait from a Retry-After header (delay-seconds or http-date), None if unusable"""
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retryAt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retryAt is None:
+        return None
+    return max(0.0, retryAt.timestamp() - time.time())
+
+
+class HostState:
+    """token bucket, in-flight count and learned request rate of one host"""
+
+    def __init__(self, rate, burst):
+        self.urls = collections.deque()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updatedAt = time.monotonic()
+        self.inFlight = 0
+        self.blockedUntil = 0.0
+        self.latency = None
+        self.baseLatency = None
+
+    def get_delay(self, now, maxPerHost):
+        """seconds until this host may take another request, 0 if it may right now"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+        if self.inFlight >= maxPerHost:
+            # only a finishing request frees a slot
+            return math.inf
+        if now < self.blockedUntil:
+            return self.blockedUntil - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class HostScheduler:
+    """
+    per host politeness between the frontier and the pic consumers.
+    stands in for the producer's pic queue: put() blocks once maxQueued urls are
+    waiting, get() hands out urls round robin over every host that is ready so a
+    slow or rate limited host never holds up the others, and returns None once
+    None was put and everything queued is handed out.
+    each host gets a token bucket (ratePerHost requests/s, up to burst at once)
+    and at most maxPerHost requests in flight. on_response() feeds back what came
+    of each request: Retry-After blocks the host, 429/5xx/failed requests halve its
+    rate, latency well above the fastest seen eases it down, and anything else
+    adds rateIncrease back (AIMD).
+    urls wait here with their lease running, and a backed off host can hold
+    them far longer than any queue bound allows for. a url put with expiresAt is
+    dropped instead of handed out once that passes, and given to expiredListener,
+    so a url whose lease ran out in the queue is never downloaded next to the
+    claim that took it over.
+    """
+
+    def __init__(
+        self,
+        maxQueued=1000,
+        ratePerHost=2.0,
+        burst=2,
+        maxPerHost=4,
+        minRate=0.05,
+        maxRate=20.0,
+        rateIncrease=0.1,
+        backoffFactor=0.5,
+        latencyFactor=3.0,
+        maxRetryAfter=600,
+        expiredListener=None,
+    ):
+        self.maxQueued = maxQueued
+        self.ratePerHost = ratePerHost
+        self.burst = burst
+        self.maxPerHost = maxPerHost
+        self.minRate = minRate
+        self.maxRate = maxRate
+        self.rateIncrease = rateIncrease
+        self.backoffFactor = backoffFactor
+        self.latencyFactor = latencyFactor
+        self.maxRetryAfter = maxRetryAfter
+        # optional callable(url), called with the scheduler's lock held
+        self.expiredListener = expiredListener
+        self._cond = threading.Condition()
+        self._hosts = {}
+        # hosts with queued urls, in the order they get their next turn
+        self._ring = collections.deque()
+        self._queued = 0
+        self._finished = False
+
+    def put(self, url, expiresAt=None):
+        """
+        queues a url under its host, None marks the end of the urls.
+        expiresAt is a time.monotonic() after which the url is dropped instead of handed out
+        """
+        with self._cond:
+            if url is None:
+                self._finished = True
+                self._cond.notify_all()
+                return
+            while self._queued >= self.maxQueued:
+                self._cond.wait()
+            host = get_url_host(url)
+            state = self._get_host(host)
+            if len(state.urls) == 0:
+                self._ring.append(host)
+            state.urls.append((url, expiresAt))
+            self._queued += 1
+            self._cond.notify_all()
+
+    def wait_until_queued_below(self, limit, timeout=None):
+        """blocks until fewer than limit urls are queued, returns whether that happened in timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._queued < limit, timeout)
+
+    def get(self):
+        """blocks until some host may take a request, returns its next url"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = math.inf
+                for _ in range(len(self._ring)):
+                    host = self._ring[0]
+                    self._ring.rotate(-1)
+                    state = self._hosts[host]
+                    self._drop_expired(state, now)
+                    if len(state.urls) == 0:
+                        # it just rotated to the back
+                        self._ring.pop()
+                        continue
+                    delay = state.get_delay(now, self.maxPerHost)
+                    if delay > 0:
+                        wait = min(wait, delay)
+                        continue
+                    url, _ = state.urls.popleft()
+                    if len(state.urls) == 0:
+                        self._ring.pop()
+                    state.tokens -= 1
+                    state.inFlight += 1
+                    self._queued -= 1
+                    self._cond.notify_all()
+                    return url
+                if self._queued == 0 and self._finished:
+                    return None
+                self._cond.wait(None if wait == math.inf else wait)
+
+    def task_done(self, url):
+        """frees the host's in-flight slot, call once per url from get()"""
+        with self._cond:
+            self._get_host(get_url_host(url)).inFlight -= 1
+            self._cond.notify_all()
+
+    def on_response(self, url, statusCode, latency, retryAfter=None):
+        """
+        feedback from a consumer. statusCode is None when no response came back,
+        latency is seconds until the response headers arrived.
+        """
+        host = get_url_host(url)
+        retrySeconds = parse_retry_after(retryAfter)
+        with self._cond:
+            state = self._get_host(host)
+            now = time.monotonic()
+            if retrySeconds is not None:
+                state.blockedUntil = max(
+                    state.blockedUntil, now + min(retrySeconds, self.maxRetryAfter)
+                )
+            if statusCode is None or statusCode == 429 or statusCode >= 500:
+                self._set_rate(state, state.rate * self.backoffFactor)
+                # spend what's left in the bucket so the slower rate applies right away
+                state.tokens = min(state.tokens, 0)
+                logging.info(
+                    f"Backing off {host=} {statusCode=} rate={state.rate:.2f}/s "
+                    f"retryAfter={retrySeconds}"
+                )
+            else:
+                state.latency = (
+                    latency if state.latency is None else 0.8 * state.latency + 0.2 * latency
+                )
+                state.baseLatency = (
+                    latency if state.baseLatency is None else min(state.baseLatency, latency)
+                )
+                if state.latency > self.latencyFactor * max(state.baseLatency, 0.05):
+                    # host is slowing down under us, ease off before it starts failing
+                    self._set_rate(state, state.rate * 0.9)
+                else:
+                    self._set_rate(state, state.rate + self.rateIncrease)
+            self._cond.notify_all()
+
+    def get_host_stats(self):
+        """current rate, queued and in-flight counts per host"""
+        with self._cond:
+            return {
+                host: {
+                    "rate": state.rate,
+                    "queued": len(state.urls),
+                    "inFlight": state.inFlight,
+                    "latency": state.latency,
+                }
+                for host, state in self._hosts.items()
+            }
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _get_host(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = HostState(self.ratePerHost, self.burst)
+            self._hosts[host] = state
+        return state
+
+    def _drop_expired(self, state, now):
+        """drops the host's urls whose expiresAt has passed, they're queued oldest first"""
+        while len(state.urls) > 0:
+            url, expiresAt = state.urls[0]
+            if expiresAt is None or expiresAt > now:
+                return
+            state.urls.popleft()
+            self._queued -= 1
+            self._cond.notify_all()
+            logging.info(f"Dropped pic, its lease ran out while queued {url=}")
+            if self.expiredListener is not None:
+                self.expiredListener(url)
+
+    def _set_rate(self, state, rate):
+        state.rate = min(self.maxRate, max(self.minRate, rate))
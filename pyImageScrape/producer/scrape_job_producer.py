@@ -1,16 +1,39 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import functools
 import logging
+import queue
 import threading
 import time
 
-from shared import UrlScrapeJobConsumer, DataStore
+from shared import UrlScrapeJobConsumer, AsyncUrlScrapeJobConsumer, DataStore
+from producer.host_scheduler import HostScheduler
 from typing import List
-from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import ThreadPoolExecutor
+
+# put on the pic queue once the frontier is drained and content scraping is over
+_NO_MORE_PICS = None
+
 
 class SimpleScrapeJobProducer:
     """
-    Kicks off scrape jobs to the consumers to handle
+    Kicks off scrape jobs to the consumers to handle.
+    pic urls stream through a bounded queue: a prefetch thread claims the next
+    frontier batch while the current one downloads, and the dispatcher keeps
+    up to maxPicsInFlight jobs running at all times.
+    given a hostScheduler, it takes the place of the queue and the dispatcher
+    only hands out urls whose host is ready for another request. the prefetcher
+    only claims once fewer than picPrefetchSize urls wait in it, so a slow host
+    doesn't sit on leases other workers could be serving. a url still
+    queued half a lease after it was claimed is dropped, its lease runs out and
+    it's claimed again later rather than downloaded after someone else took it.
+    every claim is leased under leaseOwner. a restart with the same leaseOwner
+    hands back whatever the last run still held and marks pics that were stored
+    but never recorded as visited, so the crawl picks up where it left off.
+    stop() stops claiming, lets queued & running jobs finish, then releases what's left.
+    with sharedFrontier other workers claim from the same datastore, so running out
+    of claimable urls only ends the crawl once no unvisited url is left at all:
+    a url leased to another worker may still add pages, or come back if it dies.
     """
 
     def __init__(
@@ -19,7 +42,16 @@ class SimpleScrapeJobProducer:
         dataStore: DataStore,
         contentJobConsumer: UrlScrapeJobConsumer,
         picJobConsumer: UrlScrapeJobConsumer,
-        maxPicScrapeThreads = 8
+        maxPicScrapeThreads = 8,
+        picLeaseSeconds = 300,
+        maxPicsInFlight = None,
+        picPrefetchSize = None,
+        idleWaitSeconds = 5,
+        maxContentScrapeThreads = 1,
+        contentLeaseSeconds = 600,
+        hostScheduler: HostScheduler = None,
+        leaseOwner: str = None,
+        sharedFrontier = False,
     ):
         self.baseUrl = baseUrl
         self.dataStore = dataStore
@@ -27,10 +59,35 @@ class SimpleScrapeJobProducer:
         self.picJobConsumer = picJobConsumer
         self.continueScrapingImages = True
         self.maxPicScrapeThreads = maxPicScrapeThreads
+        self.picLeaseSeconds = picLeaseSeconds
+        self.maxPicsInFlight = maxPicsInFlight or maxPicScrapeThreads
+        self.picPrefetchSize = picPrefetchSize or self.maxPicsInFlight * 2
+        self.idleWaitSeconds = idleWaitSeconds
+        self.maxContentScrapeThreads = maxContentScrapeThreads
+        self.contentLeaseSeconds = contentLeaseSeconds
         self._threadExec = ThreadPoolExecutor(max_workers=maxPicScrapeThreads)
+        self.hostScheduler = hostScheduler
+        self.leaseOwner = leaseOwner
+        self.sharedFrontier = sharedFrontier
+        self._stopping = threading.Event()
+        self._picQueue = (
+            hostScheduler
+            if hostScheduler is not None
+            else queue.Queue(maxsize=self.picPrefetchSize)
+        )
+        if hostScheduler is not None and hostScheduler.expiredListener is None:
+            hostScheduler.expiredListener = self._finish_expired_pic
+        self._picSlots = threading.BoundedSemaphore(self.maxPicsInFlight)
+        self._frontierChanged = threading.Event()
+        self._pendingLock = threading.Lock()
+        self._pendingPics = 0
+        self._contentCond = threading.Condition()
+        self._activeContentWorkers = 0
+        self._contentDone = False
     
     def run_producer(self):
-        # put root URL into queue
+        self._resume()
+        # put root URL into queue, a no-op when resuming
         self.dataStore.add_to_visit_content_urls([self.baseUrl])
         # kick off threads to manage scraping
         logging.info("Starting image scraping")
@@ -41,45 +98,220 @@ class SimpleScrapeJobProducer:
         scrape_url_thread.start()
         scrape_url_thread.join()
         self.continueScrapingImages = False
+        self._frontierChanged.set()
         scrape_img_thread.join()
+        if self._stopping.is_set():
+            self._release_leases()
+            logging.info("Scraping Producer stopped, restart to resume")
+            return
         logging.info("Scraping Producer is finished")
+
+    def stop(self):
+        """stop claiming new urls, run_producer returns once the queued & running jobs finish"""
+        if self._stopping.is_set():
+            return
+        logging.info("Stopping, finishing queued & running jobs")
+        self._stopping.set()
+        self._frontierChanged.set()
+        with self._contentCond:
+            self._contentCond.notify_all()
     
     def produce_content_urls(self):
-         # run until there are no content urls left, or program ends
-        contentLeft = True
-        while contentLeft:
-            newUrl = self.dataStore.get_next_content_to_visit()
-            if newUrl is not None:
-                self.contentJobConsumer.scrape_url(newUrl)
-            else:
-                contentLeft = False
+        """runs maxContentScrapeThreads content workers until no content urls are left"""
+        workers = [
+            threading.Thread(target=self._scrape_content_urls)
+            for _ in range(self.maxContentScrapeThreads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
 
-    
     def produce_pic_urls(self):
-        # run until there are no pics left or program ends
-        picsStillExist = True
-        while self.continueScrapingImages or picsStillExist:
+        """dispatches queued pic urls, keeping the in-flight window full"""
+        prefetcher = threading.Thread(target=self._prefetch_pic_urls)
+        prefetcher.start()
+        while True:
+            # take the slot first, a url out of the scheduler counts against its host
+            self._picSlots.acquire()
+            url = self._picQueue.get()
+            if url is _NO_MORE_PICS:
+                self._picSlots.release()
+                break
+            try:
+                future = self._submit_pic_job(url)
+                future.add_done_callback(functools.partial(self._on_pic_job_done, url))
+            except Exception as e:
+                self._picSlots.release()
+                self._finish_pending_pic(url)
+                logging.error(f"Failed to download picture {url=}: {e}")
+        prefetcher.join()
+        # every running job holds a slot, so owning them all means every job is done
+        for _ in range(self.maxPicsInFlight):
+            self._picSlots.acquire()
+        for _ in range(self.maxPicsInFlight):
+            self._picSlots.release()
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _resume(self):
+        """catches up on stored pics and hands back leases a dead run of this owner still holds"""
+        # reconcile only looks at leased urls, so it has to run before the leases are dropped
+        try:
+            reconciled = self.dataStore.reconcile_stored_pics()
+            if reconciled > 0:
+                logging.info(f"Resuming, {reconciled} stored pics marked visited")
+        except Exception as e:
+            logging.error(f"Failed to reconcile stored pics: {e}")
+        if self.leaseOwner is not None:
+            released = self._release_leases()
+            if released > 0:
+                logging.info(f"Resuming, reclaimed {released} urls left in flight by the last run")
+
+    def _release_leases(self):
+        if self.leaseOwner is None:
+            return 0
+        try:
+            return self.dataStore.release_leases(self.leaseOwner)
+        except Exception as e:
+            logging.error(f"Failed to release leases of {self.leaseOwner}: {e}")
+            return 0
+
+    def _scrape_content_urls(self):
+        """
+        one content worker. the crawl is only over once every worker is out of work
+        at the same time, since a page still being scraped can add more urls.
+        """
+        with self._contentCond:
+            self._activeContentWorkers += 1
+        while True:
+            if self._stopping.is_set():
+                with self._contentCond:
+                    self._activeContentWorkers -= 1
+                return
             try:
-                # grab all some image urls
-                futures = []
-                allToVisit = self.dataStore.get_all_pics_to_visit(self.maxPicScrapeThreads)
-
-                # go back if nothing to visit
-                if allToVisit is None or len(allToVisit) == 0:
-                    time.sleep(1)
-                    picsStillExist = False
-                    continue
-
-                for item in allToVisit:
-                    try:
-                        future = self._threadExec.submit(
-                            self.picJobConsumer.scrape_url,
-                            item,
-                        )
-                        futures.append(future)
-                    except Exception as e:
-                        print("Failed to download picture: " + str(item))
-                        print(e)
-                wait(futures)
+                claimed = self.dataStore.claim_content_to_visit(
+                    1, self.contentLeaseSeconds, self.leaseOwner
+                )
             except Exception as e:
-                print(e)
\ No newline at end of file
+                logging.error(f"Failed to claim content urls: {e}")
+                claimed = []
+
+            if len(claimed) > 0:
+                for url in claimed:
+                    self.contentJobConsumer.scrape_url(url)
+                # new pic & content urls may have landed in the frontier
+                self._frontierChanged.set()
+                with self._contentCond:
+                    self._contentCond.notify_all()
+                continue
+
+            with self._contentCond:
+                self._activeContentWorkers -= 1
+                if self._activeContentWorkers == 0 and not self._held_elsewhere(
+                    self.dataStore.get_all_content_to_visit
+                ):
+                    self._contentDone = True
+                    self._contentCond.notify_all()
+                    return
+                # wait for a busy worker to finish its page, then look again
+                self._contentCond.wait(self.idleWaitSeconds)
+                if self._contentDone or self._stopping.is_set():
+                    return
+                self._activeContentWorkers += 1
+
+    def _submit_pic_job(self, url):
+        """async consumers run the job on their own loop, others get a pool thread"""
+        if isinstance(self.picJobConsumer, AsyncUrlScrapeJobConsumer):
+            return self.picJobConsumer.submit_url(url)
+        return self._threadExec.submit(self.picJobConsumer.scrape_url, url)
+
+    def _prefetch_pic_urls(self):
+        """claims frontier batches into the pic queue until everything is done"""
+        while True:
+            if self._stopping.is_set():
+                # urls already queued still run, that's the drain
+                self._picQueue.put(_NO_MORE_PICS)
+                return
+            # the scheduler's own bound is far past what a slow host serves within a lease
+            if self.hostScheduler is not None and not self.hostScheduler.wait_until_queued_below(
+                self.picPrefetchSize, self.idleWaitSeconds
+            ):
+                continue
+            # read before claiming, so urls added by the last content page are never missed
+            contentDone = not self.continueScrapingImages
+            self._frontierChanged.clear()
+            # the other half of the lease is for the download itself
+            expiresAt = time.monotonic() + self.picLeaseSeconds / 2
+            try:
+                batch = self.dataStore.claim_pics_to_visit(
+                    self.picPrefetchSize, self.picLeaseSeconds, self.leaseOwner
+                )
+            except Exception as e:
+                logging.error(f"Failed to claim pic urls: {e}")
+                batch = []
+
+            if batch is not None and len(batch) > 0:
+                with self._pendingLock:
+                    self._pendingPics += len(batch)
+                for url in batch:
+                    # blocks while the queue is full, that's the prefetch bound
+                    if self.hostScheduler is not None:
+                        self.hostScheduler.put(url, expiresAt)
+                    else:
+                        self._picQueue.put(url)
+                continue
+
+            with self._pendingLock:
+                pending = self._pendingPics
+            waitSeconds = self.idleWaitSeconds
+            if contentDone and pending == 0:
+                retryAt = self._get_next_pic_retry_at()
+                if retryAt is None and not self._held_elsewhere(
+                    self.dataStore.get_all_pics_to_visit
+                ):
+                    self._picQueue.put(_NO_MORE_PICS)
+                    return
+                # only failed pics waiting out their backoff are left, sleep until the first is due
+                if retryAt is not None and retryAt > time.time():
+                    waitSeconds = retryAt - time.time()
+            # nothing claimable right now, sleep until a page is scraped or a job ends
+            self._frontierChanged.wait(waitSeconds)
+
+    def _held_elsewhere(self, getToVisit):
+        """whether another worker of a shared frontier still holds unvisited urls"""
+        if not self.sharedFrontier:
+            return False
+        try:
+            return len(getToVisit(1)) > 0
+        except Exception as e:
+            logging.error(f"Failed to check the shared frontier: {e}")
+            return True
+
+    def _get_next_pic_retry_at(self):
+        try:
+            return self.dataStore.get_next_pic_retry_at()
+        except Exception as e:
+            logging.error(f"Failed to read pic retry times: {e}")
+            return None
+
+    def _on_pic_job_done(self, url, future):
+        self._picSlots.release()
+        err = future.exception()
+        if err is not None:
+            logging.error(f"Pic scrape job failed: {err}")
+        self._finish_pending_pic(url)
+
+    def _finish_expired_pic(self, url):
+        """counts a claimed pic as done, the scheduler calls it directly for urls it held too long"""
+        with self._pendingLock:
+            self._pendingPics -= 1
+            drained = self._pendingPics == 0
+        if drained:
+            self._frontierChanged.set()
+
+    def _finish_pending_pic(self, url):
+        if self.hostScheduler is not None:
+            self.hostScheduler.task_done(url)
+        self._finish_expired_pic(url)
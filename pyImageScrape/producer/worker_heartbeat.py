@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+from shared import DataStore
+
+
+class WorkerHeartbeat:
+    """
+    keeps one worker of a shared crawl registered with the datastore.
+    every intervalSeconds it records a heartbeat for workerId, then looks for
+    workers that haven't sent one in deadAfterSeconds and hands their leases back
+    to the frontier, so the urls a crashed worker held are picked up in about
+    deadAfterSeconds instead of waiting out their leases. pics a dead worker stored
+    but never marked visited are reconciled first, while their leases still mark them.
+    keep deadAfterSeconds several intervals long, a slow datastore call shouldn't
+    make a live worker look dead.
+    """
+
+    def __init__(
+        self,
+        dataStore: DataStore,
+        workerId: str,
+        intervalSeconds=10,
+        deadAfterSeconds=60,
+    ):
+        self.dataStore = dataStore
+        self.workerId = workerId
+        self.intervalSeconds = intervalSeconds
+        self.deadAfterSeconds = deadAfterSeconds
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._beat()
+        self._thread.start()
+
+    def stop(self):
+        """stops beating and deregisters, the producer has already released its leases"""
+        self._stopped.set()
+        self._thread.join()
+        try:
+            self.dataStore.remove_worker(self.workerId)
+        except Exception as e:
+            logging.error(f"Failed to deregister worker {self.workerId}: {e}")
+
+    # INTERNAL METHODS
+    # ================================
+
+    def _run(self):
+        while not self._stopped.wait(self.intervalSeconds):
+            self._beat()
+            self._reclaim_dead_workers()
+
+    def _beat(self):
+        try:
+            self.dataStore.add_worker_heartbeat(self.workerId)
+        except Exception as e:
+            logging.error(f"Failed to send heartbeat for worker {self.workerId}: {e}")
+
+    def _reclaim_dead_workers(self):
+        try:
+            deadWorkers = self.dataStore.get_dead_workers(self.deadAfterSeconds)
+        except Exception as e:
+            logging.error(f"Failed to look up dead workers: {e}")
+            return
+        deadWorkers = [workerId for workerId in deadWorkers if workerId != self.workerId]
+        if len(deadWorkers) == 0:
+            return
+        try:
+            self.dataStore.reconcile_stored_pics()
+        except Exception as e:
+            logging.error(f"Failed to reconcile stored pics of dead workers: {e}")
+        for workerId in deadWorkers:
+            try:
+                released = self.dataStore.release_leases(workerId)
+                self.dataStore.remove_worker(workerId)
+            except Exception as e:
+                logging.error(f"Failed to reclaim dead worker {workerId}: {e}")
+                continue
+            logging.info(f"Worker {workerId} is dead, reclaimed {released} of its urls")
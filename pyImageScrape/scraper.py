@@ -2,13 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import os
+import signal
+import threading
+import uuid
 
 from shared import get_current_folder, DataStore, ScrapeJobProducer, FileStorage
 from datasource.sqllite_datasource import get_sqllite_datastore
+from datasource.buffered_datasource import BufferedDataStore
+from datasource.canonical_datasource import CanonicalizingDataStore
+from datasource.seen_url_datasource import SeenUrlCacheDataStore
+from datasource.url_canonicalizer import UrlCanonicalizer
 from data_scraper.content_scraper import URLScraper
+from data_scraper.driver_pool import DriverPool
 from data_scraper.pic_scraper import ImageScraper
+from data_scraper.image_processing import ImageProcessor, OUTPUT_REENCODE
+from data_scraper.dedup_index import ContentDedupIndex
+from data_scraper.retry_policy import RetryPolicy
 from producer.scrape_job_producer import SimpleScrapeJobProducer
+from producer.host_scheduler import HostScheduler
+from producer.worker_heartbeat import WorkerHeartbeat
 from file_storage.local_filestorage import LocalFileStorage
+from file_storage.pack_filestorage import PackFileStorage
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,10 +32,27 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M",
 )
 
+def load_lease_owner(dataFolderPath: str):
+    """the id this data folder leases urls under, kept on disk so a restart gets its leases back"""
+    path = dataFolderPath + "/leaseOwner"
+    if os.path.exists(path):
+        with open(path) as f:
+            leaseOwner = f.read().strip()
+        if leaseOwner:
+            return leaseOwner
+    leaseOwner = uuid.uuid4().hex
+    os.makedirs(dataFolderPath, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(leaseOwner)
+    return leaseOwner
+
 class Scraper:
     """
     crawls a website, and scrapes all images.
-    saves them to output dir
+    saves them to output dir.
+    given a workerId it's one worker of a crawl shared over the same datastore:
+    it leases urls as workerId, sends heartbeats so dead workers' urls are
+    reclaimed, and keeps its per process files (seen url cache, pack shards) apart.
     """
 
     def __init__(
@@ -32,33 +64,108 @@ class Scraper:
         dataStore: DataStore = None,
         fileStorage: FileStorage = None,
         scrapeJobProducer: ScrapeJobProducer = None,
+        bufferedWrites: bool = True,
+        writeBatchSize: int = 500,
+        writeBatchAge: float = 2.0,
+        imageProcesses: int = None,
+        nearDuplicateDistance: int = None,
+        contentScrapeThreads: int = 1,
+        urlCanonicalizer: UrlCanonicalizer = None,
+        seenUrlCache: bool = True,
+        hostScheduler: HostScheduler = None,
+        retryPolicy: RetryPolicy = None,
+        recrawl: bool = False,
+        leaseOwner: str = None,
+        packFiles: bool = False,
+        fsyncEvery: int = 0,
+        outputPolicy: str = OUTPUT_REENCODE,
+        outputType: str = "png",
+        outputQuality: int = None,
+        maxDimension: int = None,
+        workerId: str = None,
     ):
+        # a recrawl revisits everything, asking the server whether each url changed first
+        self.recrawl = recrawl
+        self.workerId = workerId
+        # worker files go in their own place so workers sharing a data folder don't clobber each other
+        workerSuffix = "" if workerId is None else "." + workerId
         # setup datastore, use sqllite datasource if not given
         self.dataStore = (
             dataStore
             if dataStore is not None
             else get_sqllite_datastore(dataFolderPath)
         )
+        # batch pic status updates, at most writeBatchSize updates / writeBatchAge seconds can be lost
+        if bufferedWrites:
+            self.dataStore = BufferedDataStore(
+                self.dataStore, maxBatchSize=writeBatchSize, maxBatchAge=writeBatchAge
+            )
+        # known urls are dropped in memory instead of costing a datastore round trip
+        if seenUrlCache:
+            self.dataStore = SeenUrlCacheDataStore(
+                self.dataStore, persistPath=dataFolderPath + "/seenUrls" + workerSuffix + ".bloom"
+            )
+        # every url is canonicalized before it reaches the frontier
+        self.dataStore = CanonicalizingDataStore(self.dataStore, urlCanonicalizer)
 
         # setup url scraper
         self.urlscraper = (
             urlscraper
             if urlscraper is not None
-            else URLScraper(self.dataStore, baseUrl)
+            else URLScraper(
+                self.dataStore,
+                baseUrl,
+                driverPool=DriverPool(size=contentScrapeThreads),
+                conditionalRequests=recrawl,
+            )
         )
 
-        # setup file storage provider
-        self.fileStorage = (
-            fileStorage
-            if fileStorage is not None
-            else LocalFileStorage(dataFolderPath + "/images")
-        )
+        # setup file storage provider, pack files keep millions of pics in a few hundred shards
+        if fileStorage is not None:
+            self.fileStorage = fileStorage
+        elif packFiles:
+            self.fileStorage = PackFileStorage(
+                dataFolderPath + "/packs" + ("" if workerId is None else "/" + workerId),
+                fsyncEvery=fsyncEvery,
+            )
+        else:
+            self.fileStorage = LocalFileStorage(dataFolderPath + "/images", fsyncEvery=fsyncEvery)
+
+        # near duplicate detection is opt in, it needs numpy
+        nearDupIndex = None
+        if nearDuplicateDistance is not None:
+            from data_scraper.near_dup_index import NearDuplicateIndex
+
+            nearDupIndex = NearDuplicateIndex(self.dataStore, nearDuplicateDistance)
+
+        # per host rate limits, fed back by the img scraper's responses
+        self.hostScheduler = hostScheduler if hostScheduler is not None else HostScheduler()
 
         # setup img scraper
         self.imgScraper = (
             imgScraper
             if imgScraper is not None
-            else ImageScraper(self.dataStore, self.fileStorage)
+            else ImageScraper(
+                self.dataStore,
+                self.fileStorage,
+                outputType=outputType,
+                outputPolicy=outputPolicy,
+                outputQuality=outputQuality,
+                maxDimension=maxDimension,
+                imageProcessor=ImageProcessor(imageProcesses),
+                dedupIndex=ContentDedupIndex(self.dataStore),
+                nearDupIndex=nearDupIndex,
+                responseListener=self.hostScheduler.on_response,
+                retryPolicy=retryPolicy,
+                conditionalRequests=recrawl,
+            )
+        )
+
+        # a worker leases as itself, a lone scraper under the id kept in its data folder
+        if leaseOwner is None:
+            leaseOwner = workerId if workerId is not None else load_lease_owner(dataFolderPath)
+        self.heartbeat = (
+            WorkerHeartbeat(self.dataStore, workerId) if workerId is not None else None
         )
 
         # setup scrape job producer
@@ -66,11 +173,56 @@ class Scraper:
             scrapeJobProducer
             if scrapeJobProducer is not None
             else SimpleScrapeJobProducer(
-                baseUrl, self.dataStore, self.urlscraper, self.imgScraper
+                baseUrl,
+                self.dataStore,
+                self.urlscraper,
+                self.imgScraper,
+                maxContentScrapeThreads=contentScrapeThreads,
+                # pages scraped by other workers never wake this one, so look again sooner
+                idleWaitSeconds=5 if workerId is None else 0.5,
+                hostScheduler=self.hostScheduler,
+                leaseOwner=leaseOwner,
+                sharedFrontier=workerId is not None,
             )
         )
 
     def run(self):
+        # workers share the frontier, whoever launches them starts the recrawl
+        if self.recrawl and self.workerId is None:
+            logging.info("Starting recrawl, every visited url is queued again")
+            self.dataStore.start_recrawl()
         logging.info("Running Scrape Job Producer")
-        self.scrapeJobProducer.run_producer()
+        previousHandlers = self._install_stop_handlers()
+        if self.heartbeat is not None:
+            self.heartbeat.start()
+        try:
+            self.scrapeJobProducer.run_producer()
+        finally:
+            for signum, handler in previousHandlers.items():
+                signal.signal(signum, handler)
+            if self.heartbeat is not None:
+                self.heartbeat.stop()
+            self.urlscraper.close()
+            self.imgScraper.close()
+            # files land before the datastore records them as stored
+            self.fileStorage.close()
+            # flushes any buffered writes before closing
+            self.dataStore.close()
         logging.info("Scraping is finished, exiting program")
+
+    def _install_stop_handlers(self):
+        """first SIGINT/SIGTERM drains the producer, a second one interrupts as usual"""
+        # signal handlers can only be set from the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return {}
+        previousHandlers = {}
+
+        def on_signal(signum, frame):
+            if signum in previousHandlers:
+                signal.signal(signum, previousHandlers.pop(signum))
+            logging.info(f"Got {signal.Signals(signum).name}, draining before exit")
+            self.scrapeJobProducer.stop()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            previousHandlers[signum] = signal.signal(signum, on_signal)
+        return previousHandlers
@@ -3,8 +3,102 @@
 
 import logging
 import argparse
+import multiprocessing
+import signal
+import socket
 
 from scraper import Scraper
+from data_scraper.image_processing import OUTPUT_POLICIES, OUTPUT_REENCODE, OUTPUT_TYPES
+from datasource.sqllite_datasource import get_sqllite_datastore
+from producer.host_scheduler import HostScheduler
+
+# ================================================================
+#
+# Workers
+#
+# ================================================================
+
+
+def build_datastore(args):
+    """the shared datastore, None leaves the scraper on sqlite in dataFolderPath"""
+    if args.opensearchUrl is None:
+        return None
+    # only needed for opensearch crawls
+    from opensearchpy import OpenSearch
+    from datasource.opensearch_datasource import SimpleOpenSearchDataStore
+
+    logging.getLogger("opensearch").setLevel(logging.WARN)
+    return SimpleOpenSearchDataStore(
+        OpenSearch(hosts=[args.opensearchUrl], pool_maxsize=10), highThroughput=True
+    )
+
+
+def build_scraper(args, workerId=None, workers=1):
+    # the per host rate is for the whole crawl, every local worker gets its share
+    hostScheduler = HostScheduler(
+        ratePerHost=args.ratePerHost / workers, maxRate=args.maxRatePerHost / workers
+    )
+    # so are the cores, each worker would otherwise start a pool of cpu_count processes
+    imageProcesses = args.imageProcesses
+    if imageProcesses is None:
+        imageProcesses = max(1, multiprocessing.cpu_count() // workers)
+    return Scraper(
+        args.url,
+        dataFolderPath=args.dataFolderPath,
+        dataStore=build_datastore(args),
+        hostScheduler=hostScheduler,
+        imageProcesses=imageProcesses,
+        recrawl=args.recrawl,
+        packFiles=args.packFiles,
+        fsyncEvery=args.fsyncEvery,
+        outputPolicy=args.outputPolicy,
+        outputType=args.outputType,
+        outputQuality=args.outputQuality,
+        maxDimension=args.maxDimension,
+        workerId=workerId,
+    )
+
+
+def run_worker(args, workerId, workers):
+    """entry point of one local worker process"""
+    build_scraper(args, workerId, workers).run()
+
+
+def run_workers(args):
+    """
+    runs args.workers worker processes over one shared datastore and waits for them.
+    this process only prepares the datastore (tables, migrations, the recrawl reset)
+    before they start, so they never race over it.
+    """
+    dataStore = build_datastore(args)
+    if dataStore is None:
+        dataStore = get_sqllite_datastore(args.dataFolderPath)
+    if args.recrawl:
+        logging.info("Starting recrawl, every visited url is queued again")
+        dataStore.start_recrawl()
+    dataStore.close()
+
+    context = multiprocessing.get_context("spawn")
+    baseId = f"{socket.gethostname()}-{args.urlId}"
+    processes = [
+        context.Process(target=run_worker, args=(args, f"{baseId}-{i}", args.workers))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    logging.info(f"Started {len(processes)} workers")
+
+    # ctrl+c reaches every worker from the terminal, a SIGTERM to this process is passed on
+    def on_sigterm(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, on_sigterm)
+    for process in processes:
+        process.join()
+    logging.info("Every worker is finished, exiting program")
 
 # ================================================================
 #
@@ -13,10 +107,19 @@ from scraper import Scraper
 # ================================================================
 
 
+def output_quality(value):
+    """argparse type for --outputQuality, pillow only takes 1-100"""
+    quality = int(value)
+    if not 1 <= quality <= 100:
+        raise argparse.ArgumentTypeError(f"quality must be between 1 and 100, got {quality}")
+    return quality
+
+
 def main():
     '''
     Takes input for url + id
     Ex.  scraperCli.py "https://www.master-plan.me/" "masterplan" "F:/test stuff"
+    Ex.  scraperCli.py "https://www.master-plan.me/" "masterplan" "F:/test stuff" --workers 4
     '''
     parser = argparse.ArgumentParser(description='Crawls the url for all pics')
 
@@ -24,12 +127,89 @@ def main():
     parser.add_argument("url", help="url to crawl")
     parser.add_argument("urlId", help="unique url identifier")
     parser.add_argument("dataFolderPath", help="path for where the parsing data will end up")
+    parser.add_argument(
+        "--recrawl",
+        action="store_true",
+        help="revisit an earlier crawl, only re-downloading pages and pics that changed",
+    )
+    parser.add_argument(
+        "--packFiles",
+        action="store_true",
+        help="append pics into large tar shards instead of writing one file per pic",
+    )
+    parser.add_argument(
+        "--fsyncEvery",
+        type=int,
+        default=0,
+        help="fsync stored pics every N files, 0 leaves it to the os",
+    )
+    parser.add_argument(
+        "--outputPolicy",
+        choices=OUTPUT_POLICIES,
+        default=OUTPUT_REENCODE,
+        help="passthrough keeps the original bytes of jpeg/png/webp/gif pics, reencode converts every pic",
+    )
+    parser.add_argument(
+        "--outputType",
+        choices=OUTPUT_TYPES,
+        default="png",
+        help="format pics are re-encoded to",
+    )
+    parser.add_argument(
+        "--outputQuality",
+        type=output_quality,
+        default=None,
+        help="quality (1-100) for jpg/webp re-encodes",
+    )
+    parser.add_argument(
+        "--maxDimension",
+        type=int,
+        default=None,
+        help="downscale pics so neither side is larger than this",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes to split the crawl over, they share the datastore",
+    )
+    parser.add_argument(
+        "--workerId",
+        default=None,
+        help="run as one worker of a crawl shared with other processes or nodes",
+    )
+    parser.add_argument(
+        "--imageProcesses",
+        type=int,
+        default=None,
+        help="processes decoding & encoding pics, split over the local workers by default",
+    )
+    parser.add_argument(
+        "--opensearchUrl",
+        default=None,
+        help="keep the frontier in opensearch instead of sqlite, ex. http://localhost:9200",
+    )
+    parser.add_argument(
+        "--ratePerHost",
+        type=float,
+        default=2.0,
+        help="starting pic requests/s per host, split over the local workers",
+    )
+    parser.add_argument(
+        "--maxRatePerHost",
+        type=float,
+        default=20.0,
+        help="pic requests/s per host the rate can grow to, split over the local workers",
+    )
 
     # parse
     args = parser.parse_args()
 
     # run
-    Scraper(args.url, dataFolderPath=args.dataFolderPath).run()
+    if args.workers > 1:
+        run_workers(args)
+    else:
+        build_scraper(args, args.workerId).run()
 
 
 if __name__ == '__main__':
@@ -12,8 +12,16 @@ def get_current_folder(file):
 class FileStorage(ABC):
 
     @abstractmethod
-    def store_file(self, bytes:bytes, path:str):
-        """stores files to some impl"""
+    def store_file(self, bytes:bytes, path:str, onStored=None, onFailed=None):
+        """
+        stores files to some impl. onStored() runs once the file has landed,
+        onFailed(e) if it never will. storages that write in the background call
+        them from their own threads, neither runs when store_file itself raises
+        """
+
+    @abstractmethod
+    def close(self):
+        """write out anything still held and release the storage"""
 
 class ScrapeJobProducer(ABC):
 
@@ -21,22 +29,36 @@ class ScrapeJobProducer(ABC):
     def run_producer(self):
         """runs the producer for Scrape jobs"""
 
+    @abstractmethod
+    def stop(self):
+        """stop handing out new jobs, run_producer returns once the running ones finish"""
+
 class UrlScrapeJobConsumer(ABC):
 
     @abstractmethod
     def scrape_url(self, url):
         """executes a scrape attempt on the provided URL"""
 
+    @abstractmethod
+    def close(self):
+        """release anything the consumer holds open"""
+
+class AsyncUrlScrapeJobConsumer(UrlScrapeJobConsumer):
+
+    @abstractmethod
+    def submit_url(self, url):
+        """starts a scrape attempt without blocking, returns a concurrent.futures.Future"""
+
 class DataStore(ABC):
 
     @abstractmethod
-    def add_to_visit_content_urls(self, urlLocs):
-        """add multiple content urls to visit"""
+    def add_to_visit_content_urls(self, urlLocs, parentUrl=None, priority=0):
+        """add multiple content urls to visit, returns how many were new"""
         pass
 
     @abstractmethod
-    def add_to_visit_pic_urls(self, urlLocs):
-        """add multiple pic urls to visit"""
+    def add_to_visit_pic_urls(self, urlLocs, parentUrl=None, priority=0):
+        """add multiple pic urls to visit, returns how many were new"""
         pass
 
     @abstractmethod
@@ -50,8 +72,97 @@ class DataStore(ABC):
         pass
 
     @abstractmethod
-    def add_stored_pic_url(self, urlLoc, filePath, shaPicHash):
-        """store a picture from a url"""
+    def add_visited_pic_urls(self, visits):
+        """tag multiple pic urls as visited, visits are (urlLoc, err) pairs"""
+        pass
+
+    @abstractmethod
+    def add_failed_pic_url(self, urlLoc, err, errClass, attempts, nextEligibleAt=None):
+        """record a failed pic fetch, retried after nextEligibleAt (epoch seconds) or given up on when None"""
+        pass
+
+    @abstractmethod
+    def get_pic_attempts(self, urlLoc):
+        """how many failed fetches of the pic url were recorded"""
+        pass
+
+    @abstractmethod
+    def get_next_pic_retry_at(self):
+        """earliest nextEligibleAt of the pic urls waiting on a retry, None if there are none"""
+        pass
+
+    @abstractmethod
+    def add_content_url_validators(self, urlLoc, etag, lastModified):
+        """record the ETag/Last-Modified a content url was last fetched with, and when"""
+        pass
+
+    @abstractmethod
+    def add_pic_url_validators(self, urlLoc, etag, lastModified):
+        """record the ETag/Last-Modified a pic url was last fetched with, and when"""
+        pass
+
+    @abstractmethod
+    def get_content_url_validators(self, urlLoc):
+        """(etag, lastModified) the content url was last fetched with, either can be None"""
+        pass
+
+    @abstractmethod
+    def get_pic_url_validators(self, urlLoc):
+        """(etag, lastModified) the pic url was last fetched with, either can be None"""
+        pass
+
+    @abstractmethod
+    def start_recrawl(self):
+        """mark every visited url to be visited again, keeping what they were fetched with"""
+        pass
+
+    @abstractmethod
+    def add_stored_pic_url(self, urlLoc, filePath, shaPicHash, storedSize=None, encodeSeconds=None):
+        """
+        store a picture from a url, with its size on disk and how long encoding it took.
+        a url stored before points at the new picture afterwards, the old file is kept
+        since it's named by its content and other urls may be aliased to it
+        """
+        pass
+
+    @abstractmethod
+    def add_stored_pic_urls(self, storedPics):
+        """store multiple pictures, storedPics are (urlLoc, filePath, shaPicHash[, storedSize, encodeSeconds]) tuples"""
+        pass
+
+    @abstractmethod
+    def add_pic_url_alias(self, urlLoc, shaPicHash):
+        """record that a url serves the same bytes as an already stored picture, replacing an older alias"""
+        pass
+
+    @abstractmethod
+    def get_stored_pic_path(self, shaPicHash):
+        """get the file path of a stored picture, None if it isn't stored"""
+        pass
+
+    @abstractmethod
+    def get_stored_pic_hashes(self):
+        """iterate over the sha of every stored picture"""
+        pass
+
+    @abstractmethod
+    def add_pic_perceptual_hash(self, shaPicHash, perceptualHash):
+        """store the 64 bit perceptual hash of a stored picture"""
+        pass
+
+    @abstractmethod
+    def get_pic_perceptual_hashes(self):
+        """iterate over (shaPicHash, perceptualHash) of every hashed picture"""
+        pass
+
+    @abstractmethod
+    def add_canonicalization_stats(self, stats):
+        """add to the per rule counters, stats maps rule -> (rewritten, collapsed)"""
+        pass
+
+    @abstractmethod
+    def get_canonicalization_stats(self):
+        """get the per rule counters as rule -> (rewritten, collapsed)"""
         pass
 
     @abstractmethod
@@ -68,3 +179,56 @@ class DataStore(ABC):
     def get_all_pics_to_visit(self, n=1000):
         """get all the next pic urls to visit"""
         pass
+
+    @abstractmethod
+    def get_all_content_to_visit(self, n=1000):
+        """get the next batch of content urls to visit, in frontier order"""
+        pass
+
+    @abstractmethod
+    def claim_pics_to_visit(self, n=1000, leaseSeconds=300, leaseOwner=None):
+        """lease up to n pic urls to visit so nobody else is handed them until the lease expires"""
+        pass
+
+    @abstractmethod
+    def claim_content_to_visit(self, n=1, leaseSeconds=600, leaseOwner=None):
+        """lease up to n content urls to visit so nobody else is handed them until the lease expires"""
+        pass
+
+    @abstractmethod
+    def release_leases(self, leaseOwner):
+        """drop the leases leaseOwner holds on unvisited urls so they can be claimed again, returns how many"""
+        pass
+
+    @abstractmethod
+    def add_worker_heartbeat(self, workerId):
+        """record that workerId is alive right now"""
+        pass
+
+    @abstractmethod
+    def get_dead_workers(self, deadAfterSeconds):
+        """ids of the workers that haven't sent a heartbeat in deadAfterSeconds"""
+        pass
+
+    @abstractmethod
+    def remove_worker(self, workerId):
+        """forget a worker that exited or was found dead"""
+        pass
+
+    @abstractmethod
+    def get_frontier_id(self):
+        """
+        id made with the frontier and renewed by start_recrawl. anything cached about
+        what's in the frontier is only good while the id it was saved with still holds
+        """
+        pass
+
+    @abstractmethod
+    def reconcile_stored_pics(self):
+        """mark leased pic urls visited whose picture or alias was stored, returns how many"""
+        pass
+
+    @abstractmethod
+    def close(self):
+        """release any connections held by the datastore"""
+        pass
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pathlib
+import sys
+
+# modules import each other from the package folder, the same way the cli runs them
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent.absolute()))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from datasource.buffered_datasource import BufferedDataStore
+
+
+class RecordingDataStore:
+    """keeps the order writes reach it in, fails the first failWrites of them"""
+
+    def __init__(self, failWrites=0):
+        self.calls = []
+        self.failWrites = failWrites
+
+    def add_stored_pic_urls(self, storedPics):
+        self._record("stored", list(storedPics))
+
+    def add_visited_pic_urls(self, visits):
+        self._record("visited", list(visits))
+
+    def claim_pics_to_visit(self, n=1000, leaseSeconds=300, leaseOwner=None):
+        return ["http://h/1.png", "http://h/2.png"]
+
+    def close(self):
+        pass
+
+    def _record(self, kind, args):
+        if self.failWrites > 0:
+            self.failWrites -= 1
+            raise IOError("datastore down")
+        self.calls.append((kind, args))
+
+
+def build_buffered(dataStore):
+    # nothing flushes on its own during a test
+    return BufferedDataStore(dataStore, maxBatchSize=1000, maxBatchAge=600)
+
+
+def test_flush_writes_stored_before_visited():
+    inner = RecordingDataStore()
+    dataStore = build_buffered(inner)
+    dataStore.add_visited_pic_url("http://h/1.png")
+    dataStore.add_stored_pic_url("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef", 10, 0.1)
+
+    assert inner.calls == []
+    dataStore.flush()
+
+    assert inner.calls == [
+        ("stored", [("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef", 10, 0.1)]),
+        ("visited", [("http://h/1.png", None)]),
+    ]
+    dataStore.close()
+
+
+def test_failed_flush_is_requeued():
+    inner = RecordingDataStore(failWrites=1)
+    dataStore = build_buffered(inner)
+    dataStore.add_stored_pic_url("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef")
+    dataStore.add_visited_pic_url("http://h/1.png")
+
+    dataStore.flush()
+    assert inner.calls == []
+    dataStore.close()
+
+    assert [kind for kind, _ in inner.calls] == ["stored", "visited"]
+
+
+def test_claims_hide_urls_with_a_pending_visit():
+    dataStore = build_buffered(RecordingDataStore())
+    dataStore.add_visited_pic_url("http://h/1.png")
+
+    assert dataStore.claim_pics_to_visit(10, 300, "a") == ["http://h/2.png"]
+    dataStore.close()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from datasource.canonical_datasource import CanonicalizingDataStore
+from datasource.sqllite_datasource import get_sqllite_datastore
+from datasource.url_canonicalizer import (
+    RULE_CASE,
+    RULE_FRAGMENT,
+    RULE_SORTED_QUERY,
+    RULE_TRACKING_PARAMS,
+    UrlCanonicalizer,
+)
+
+
+@pytest.fixture
+def dataStore(tmp_path):
+    dataStore = CanonicalizingDataStore(get_sqllite_datastore(str(tmp_path)))
+    yield dataStore
+    dataStore.close()
+
+
+def test_valueless_query_keys_are_kept():
+    canonicalizer = UrlCanonicalizer()
+    assert canonicalizer.canonicalize("http://h/p?flag&b=2&a=1&utm_source=x") == (
+        "http://h/p?a=1&b=2&flag",
+        [RULE_TRACKING_PARAMS, RULE_SORTED_QUERY],
+    )
+    assert canonicalizer.canonicalize("http://h/p?a=&flag") == ("http://h/p?a=&flag", [])
+
+
+def test_rewrites_onto_frontier_rows_count_as_collapsed(dataStore):
+    assert dataStore.add_to_visit_pic_urls(["http://h/a.png", "http://h/b.png"]) == 2
+    newCount = dataStore.add_to_visit_pic_urls(
+        [
+            # already in the frontier under its canonical form
+            "http://h/a.png#top",
+            "HTTP://H/b.png",
+            # collapses into a url of the same batch
+            "http://h/c.png",
+            "http://h/c.png#top",
+            # new
+            "http://h/d.png#top",
+        ]
+    )
+    assert newCount == 2
+    dataStore.flush_stats()
+    assert dataStore.get_canonicalization_stats() == {
+        RULE_FRAGMENT: (3, 2),
+        RULE_CASE: (1, 1),
+    }
+    assert set(dataStore.get_all_pics_to_visit()) == {
+        "http://h/a.png",
+        "http://h/b.png",
+        "http://h/c.png",
+        "http://h/d.png",
+    }
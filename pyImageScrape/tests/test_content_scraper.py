@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from data_scraper.content_scraper import FETCH_AUTO, FETCH_HTTP, URLScraper
+from data_scraper.driver_pool import DriverPool
+from datasource.sqllite_datasource import get_sqllite_datastore
+
+PAGE = b"""<html><body>
+<a href="/next">next</a>
+<a href="http://elsewhere.test/page">offsite</a>
+<a href="/gallery/big.jpg">full size</a>
+<img src="/thumbs/a.png">
+<img srcset="/thumbs/b.png 1x, /thumbs/b2.png 2x">
+</body></html>"""
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/page":
+            contentType, body = "text/html", PAGE
+        elif self.path == "/file.zip":
+            contentType, body = "application/zip", b"PK\0\0"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class NoBrowser:
+    """driver factory that counts how often a browser was wanted"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        raise RuntimeError("page should have been fetched over plain http")
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def dataStore(tmp_path):
+    dataStore = get_sqllite_datastore(str(tmp_path))
+    yield dataStore
+    dataStore.close()
+
+
+def test_scrape_stores_the_pages_links_and_pics(server, dataStore):
+    pageUrl = server + "/page"
+    dataStore.add_to_visit_content_urls([pageUrl])
+    scraper = URLScraper(dataStore, server, fetchMode=FETCH_HTTP)
+    scraper.scrape_url(pageUrl)
+
+    # offsite links are dropped, the page itself is done
+    assert set(dataStore.get_all_content_to_visit()) == {
+        server + "/next",
+        server + "/gallery/big.jpg",
+    }
+    assert set(dataStore.get_all_pics_to_visit()) == {
+        server + "/gallery/big.jpg",
+        server + "/thumbs/a.png",
+        server + "/thumbs/b.png",
+        server + "/thumbs/b2.png",
+    }
+
+
+def test_downloads_are_not_handed_to_the_browser(server, dataStore):
+    fileUrl = server + "/file.zip"
+    dataStore.add_to_visit_content_urls([fileUrl])
+    browser = NoBrowser()
+    scraper = URLScraper(
+        dataStore, server, fetchMode=FETCH_AUTO, driverPool=DriverPool(driverFactory=browser)
+    )
+    scraper.scrape_url(fileUrl)
+    assert browser.calls == 0
+    assert dataStore.get_all_content_to_visit() == []
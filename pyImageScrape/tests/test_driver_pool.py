@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from data_scraper.driver_pool import DriverPool
+
+
+class FakeDriver:
+    """answers the pool's health & wear checks without a browser"""
+
+    def __init__(self):
+        self.crashed = False
+        self.quit_called = False
+        self.window_handles = ["main"]
+        self.usedBytes = 0
+
+    @property
+    def current_url(self):
+        if self.crashed:
+            raise ConnectionError("browser is gone")
+        return "about:blank"
+
+    def execute_script(self, script):
+        return self.usedBytes
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeDriverFactory:
+    def __init__(self):
+        self.built = []
+
+    def __call__(self):
+        driver = FakeDriver()
+        self.built.append(driver)
+        return driver
+
+
+def test_released_drivers_are_reused():
+    factory = FakeDriverFactory()
+    pool = DriverPool(size=2, driverFactory=factory)
+    with pool.driver() as first:
+        pass
+    with pool.driver() as second:
+        assert second is first
+    assert len(factory.built) == 1
+
+
+def test_checkout_waits_for_a_free_slot():
+    factory = FakeDriverFactory()
+    pool = DriverPool(size=1, driverFactory=factory)
+    held = pool.checkout()
+    gotOne = threading.Event()
+
+    def take():
+        with pool.driver():
+            gotOne.set()
+
+    thread = threading.Thread(target=take)
+    thread.start()
+    assert not gotOne.wait(0.2)
+    pool.checkin(held)
+    assert gotOne.wait(5)
+    thread.join()
+    assert len(factory.built) == 1
+
+
+def test_crashed_driver_is_replaced():
+    factory = FakeDriverFactory()
+    pool = DriverPool(size=1, driverFactory=factory)
+    with pool.driver() as driver:
+        pass
+    driver.crashed = True
+    with pool.driver() as replacement:
+        assert replacement is not driver
+    assert driver.quit_called
+    assert len(factory.built) == 2
+
+
+def test_worn_out_drivers_are_recycled_on_checkin():
+    factory = FakeDriverFactory()
+    pool = DriverPool(size=1, maxPagesPerDriver=2, maxMemoryMb=1, driverFactory=factory)
+    with pool.driver() as driver:
+        pass
+    with pool.driver():
+        pass
+    # two pages rendered, quit instead of going back to the pool
+    assert driver.quit_called
+    with pool.driver() as bloated:
+        bloated.usedBytes = 2 * 1024 * 1024
+    assert bloated.quit_called
+    assert len(factory.built) == 2
+
+
+def test_close_quits_idle_and_later_returned_drivers():
+    factory = FakeDriverFactory()
+    pool = DriverPool(size=2, driverFactory=factory)
+    idle = pool.checkout()
+    busy = pool.checkout()
+    pool.checkin(idle)
+    pool.close()
+    assert idle.quit_called
+    assert not busy.quit_called
+    pool.checkin(busy)
+    assert busy.quit_called
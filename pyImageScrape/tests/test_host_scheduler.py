@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from producer.host_scheduler import HostScheduler
+from producer.scrape_job_producer import SimpleScrapeJobProducer
+from datasource.sqllite_datasource import get_sqllite_datastore
+
+
+class SlowPicScraper:
+    """stands in for the pic consumer, marks every pic visited after a short wait"""
+
+    def __init__(self, dataStore):
+        self.dataStore = dataStore
+        self.scraped = []
+
+    def scrape_url(self, url):
+        time.sleep(0.01)
+        self.scraped.append(url)
+        self.dataStore.add_visited_pic_url(url)
+
+
+class OnePageScraper:
+    """the single content page links a pile of pics on one host"""
+
+    def __init__(self, dataStore, picCount):
+        self.dataStore = dataStore
+        self.picCount = picCount
+
+    def scrape_url(self, url):
+        self.dataStore.add_to_visit_pic_urls(
+            [f"http://h/{i}.png" for i in range(self.picCount)], url
+        )
+        self.dataStore.add_visited_content_url(url)
+
+
+def test_expired_urls_are_dropped_not_handed_out():
+    dropped = []
+    scheduler = HostScheduler(ratePerHost=1, burst=1, expiredListener=dropped.append)
+    expiresAt = time.monotonic() + 0.5
+    for i in range(3):
+        scheduler.put(f"http://a/{i}", expiresAt)
+    scheduler.put("http://b/0")
+    scheduler.put(None)
+
+    handedOut = []
+    url = scheduler.get()
+    while url is not None:
+        handedOut.append(url)
+        scheduler.task_done(url)
+        url = scheduler.get()
+
+    assert handedOut == ["http://a/0", "http://b/0"]
+    assert dropped == ["http://a/1", "http://a/2"]
+
+
+def test_wait_until_queued_below():
+    scheduler = HostScheduler()
+    scheduler.put("http://a/0")
+    scheduler.put("http://a/1")
+
+    assert not scheduler.wait_until_queued_below(2, 0.01)
+    threading.Timer(0.05, scheduler.get).start()
+    assert scheduler.wait_until_queued_below(2, 5)
+
+
+def test_producer_only_leases_what_the_scheduler_can_serve(tmp_path):
+    dataStore = get_sqllite_datastore(str(tmp_path))
+    scheduler = HostScheduler(ratePerHost=20, burst=1, maxRate=20)
+    producer = SimpleScrapeJobProducer(
+        "http://h/",
+        dataStore,
+        OnePageScraper(dataStore, 200),
+        SlowPicScraper(dataStore),
+        maxPicScrapeThreads=2,
+        idleWaitSeconds=0.05,
+        hostScheduler=scheduler,
+        leaseOwner="a",
+    )
+    thread = threading.Thread(target=producer.run_producer)
+    thread.start()
+    time.sleep(0.5)
+    leased = dataStore.dbConn.execute(
+        "SELECT COUNT(*) AS leased FROM picUrls WHERE visited = 0 AND leaseOwner = 'a' "
+        "AND leaseExpires IS NOT NULL;",
+        (),
+    )[0]["leased"]
+    producer.stop()
+    thread.join()
+    dataStore.close()
+
+    # picPrefetchSize is 4, one claim may land just before the queue drains under it
+    assert leased <= 2 * 4 + 2
+
+
+def test_restart_reconciles_pics_stored_under_its_old_leases(tmp_path):
+    dataStore = get_sqllite_datastore(str(tmp_path))
+    dataStore.add_to_visit_pic_urls(["http://h/0.png", "http://h/1.png"])
+    # the last run stored 0.png but died before marking it visited
+    dataStore.claim_pics_to_visit(2, 300, "a")
+    dataStore.add_stored_pic_url("http://h/0.png", "ab/cd/ef/abcdef.png", "abcdef")
+    picScraper = SlowPicScraper(dataStore)
+    producer = SimpleScrapeJobProducer(
+        "http://h/",
+        dataStore,
+        OnePageScraper(dataStore, 0),
+        picScraper,
+        idleWaitSeconds=0.05,
+        leaseOwner="a",
+    )
+    producer.run_producer()
+    dataStore.close()
+
+    assert picScraper.scraped == ["http://h/1.png"]
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+
+import pytest
+from PIL import Image
+
+from data_scraper.image_processing import OUTPUT_PASSTHROUGH, process_image
+
+
+def png_bytes(size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize(size).convert("RGB").save(buffer, format="png")
+    return buffer.getvalue()
+
+
+def test_passthrough_keeps_the_original_bytes():
+    content = png_bytes()
+    processed = process_image(content, 10, 10, "jpg", outputPolicy=OUTPUT_PASSTHROUGH)
+    assert processed.imageBytes == content
+    assert processed.fileType == "png"
+
+
+def test_passthrough_refuses_a_truncated_pic():
+    content = png_bytes()
+    # the header still gives the size, the pixel data is cut short
+    with pytest.raises(OSError):
+        process_image(content[: len(content) // 2], 10, 10, "jpg", outputPolicy=OUTPUT_PASSTHROUGH)
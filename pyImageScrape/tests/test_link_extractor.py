@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from data_scraper.link_extractor import BeautifulSoupLinkExtractor, parse_srcset
+
+
+def test_srcset_keeps_commas_inside_urls():
+    srcset = (
+        "https://cdn.test/img/w_400,h_300,c_fill/a.jpg 400w, "
+        "https://cdn.test/img/w_800,h_600,c_fill/a.jpg 800w"
+    )
+    assert parse_srcset(srcset) == [
+        "https://cdn.test/img/w_400,h_300,c_fill/a.jpg",
+        "https://cdn.test/img/w_800,h_600,c_fill/a.jpg",
+    ]
+
+
+def test_srcset_candidates_without_spaces_or_descriptors():
+    assert parse_srcset("a.jpg 1x,b.jpg 2x") == ["a.jpg", "b.jpg"]
+    assert parse_srcset("a.jpg, b.jpg,") == ["a.jpg", "b.jpg"]
+    assert parse_srcset(" , ") == []
+
+
+def test_extractor_resolves_srcset_urls():
+    html = '<img srcset="/w_1,h_2/a.png 1x, /b.png 2x"><a href="/next">next</a>'
+    links = BeautifulSoupLinkExtractor("html.parser").extract(html, "http://h/page")
+    assert links.picUrls == {"http://h/w_1,h_2/a.png", "http://h/b.png"}
+    assert links.contentUrls == {"http://h/next"}
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# runs against a throwaway opensearch container, and wipes the crawl indices on it:
+#   docker run -d -p 9200:9200 -e discovery.type=single-node \
+#       -e DISABLE_SECURITY_PLUGIN=true opensearchproject/opensearch:2
+#   OPENSEARCH_TEST_URL=http://localhost:9200 python -m pytest pyImageScrape/tests
+
+import os
+
+import pytest
+
+opensearchpy = pytest.importorskip("opensearchpy")
+
+from datasource import opensearch_datasource
+from datasource.opensearch_datasource import SimpleOpenSearchDataStore
+
+OPENSEARCH_TEST_URL = os.environ.get("OPENSEARCH_TEST_URL")
+
+pytestmark = pytest.mark.skipif(
+    OPENSEARCH_TEST_URL is None, reason="set OPENSEARCH_TEST_URL to an opensearch container"
+)
+
+CRAWL_INDICES = [
+    opensearch_datasource.URL_INDEX,
+    opensearch_datasource.PIC_URL_INDEX,
+    opensearch_datasource.STORED_PIC_INDEX,
+    opensearch_datasource.PIC_URL_HASH_INDEX,
+    opensearch_datasource.PIC_PERCEPTUAL_HASH_INDEX,
+    opensearch_datasource.CANONICALIZATION_STATS_INDEX,
+    opensearch_datasource.WORKER_INDEX,
+    opensearch_datasource.FRONTIER_INFO_INDEX,
+]
+
+
+def build_datastore(**dataStoreArgs):
+    return SimpleOpenSearchDataStore(
+        opensearchpy.OpenSearch(hosts=[OPENSEARCH_TEST_URL]), **dataStoreArgs
+    )
+
+
+@pytest.fixture(autouse=True)
+def emptyIndices():
+    conn = opensearchpy.OpenSearch(hosts=[OPENSEARCH_TEST_URL])
+    for index in CRAWL_INDICES:
+        conn.indices.delete(index=index, ignore=404)
+    yield
+    conn.close()
+
+
+@pytest.fixture(params=[False, True], ids=["refreshEveryWrite", "highThroughput"])
+def dataStore(request):
+    # an interval far longer than any test, only the datastore's own refreshes count
+    dataStore = build_datastore(highThroughput=request.param, refreshInterval="60s", pageSize=2)
+    yield dataStore
+    dataStore.close()
+
+
+def test_claim_sees_urls_added_since_the_last_refresh(dataStore):
+    urls = ["http://h/1.png", "http://h/2.png", "http://h/3.png"]
+    dataStore.add_to_visit_pic_urls(urls)
+
+    assert sorted(dataStore.claim_pics_to_visit(10, 300, "a")) == urls
+    assert dataStore.claim_pics_to_visit(10, 300, "b") == []
+
+
+def test_get_all_sees_urls_added_since_the_last_refresh(dataStore):
+    dataStore.add_to_visit_content_urls(["http://h/", "http://h/page"])
+
+    assert sorted(dataStore.get_all_content_to_visit(10)) == ["http://h/", "http://h/page"]
+
+
+def test_visited_and_released_urls(dataStore):
+    dataStore.add_to_visit_pic_urls(["http://h/1.png", "http://h/2.png"])
+    dataStore.claim_pics_to_visit(10, 300, "a")
+    dataStore.add_visited_pic_url("http://h/1.png")
+
+    assert dataStore.release_leases("a") == 1
+    assert dataStore.claim_pics_to_visit(10, 300, "b") == ["http://h/2.png"]
+
+
+def test_restored_pic_replaces_the_old_doc(dataStore):
+    dataStore.add_stored_pic_url("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef")
+    dataStore.add_stored_pic_urls([("http://h/1.png", "ab/cd/ef/abcdef.jpg", "abcdef")])
+
+    assert dataStore.get_stored_pic_path("abcdef") == "ab/cd/ef/abcdef.jpg"
+
+
+def test_url_whose_stored_pic_was_replaced_keeps_an_alias(dataStore):
+    dataStore.add_stored_pic_url("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef")
+    dataStore.add_stored_pic_urls([("http://h/2.png", "ab/cd/ef/abcdef.png", "abcdef")])
+    dataStore.flush()
+
+    for url in ["http://h/1.png", "http://h/2.png"]:
+        alias = opensearch_datasource.PicUrlHash.get(id=url, using=dataStore.conn)
+        assert alias.shaPicHash == "abcdef"
+
+
+def test_frontier_id_is_renewed_by_a_recrawl(dataStore):
+    frontierId = dataStore.get_frontier_id()
+
+    assert dataStore.get_frontier_id() == frontierId
+    dataStore.start_recrawl()
+    assert dataStore.get_frontier_id() != frontierId
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import tarfile
+
+from PIL import Image
+
+from data_scraper.pic_scraper import ImageScraper
+from datasource.sqllite_datasource import get_sqllite_datastore
+from file_storage.pack_filestorage import PackFileStorage
+
+
+def build_storage(path, **storageArgs):
+    # batches only flush when full or closed unless a test says otherwise
+    storageArgs.setdefault("maxBatchAge", 600)
+    return PackFileStorage(str(path), **storageArgs)
+
+
+def test_round_trip_through_reopen(tmp_path):
+    storage = build_storage(tmp_path, maxBatchFiles=2)
+    storage.store_file(b"first pic", "ab/cd/ef/abcdef.png")
+    storage.store_file(b"second pic", "12/34/56/123456.jpg")
+    storage.store_file(b"third pic", "98/76/54/987654.png")
+
+    assert storage.read_file("abcdef") == b"first pic"
+    assert storage.read_file("987654") == b"third pic"
+    storage.close()
+
+    reopened = build_storage(tmp_path)
+    assert len(reopened) == 3
+    assert reopened.read_file("123456") == b"second pic"
+    assert reopened.read_file("missing") is None
+    reopened.close()
+
+
+def test_shards_are_plain_tar_files(tmp_path):
+    storage = build_storage(tmp_path)
+    storage.store_file(b"first pic", "ab/cd/ef/abcdef.png")
+    storage.close()
+
+    with tarfile.open(tmp_path / "shard-000000.tar") as tar:
+        assert tar.getnames() == ["abcdef.png"]
+        assert tar.extractfile("abcdef.png").read() == b"first pic"
+
+
+def test_on_stored_waits_for_the_batch(tmp_path):
+    stored = []
+    storage = build_storage(tmp_path, maxBatchFiles=2)
+    storage.store_file(b"first pic", "ab/cd/ef/abcdef.png", onStored=lambda: stored.append("a"))
+    storage.store_file(b"first pic", "ab/cd/ef/abcdef.png", onStored=lambda: stored.append("a again"))
+    assert stored == []
+
+    storage.store_file(b"second pic", "12/34/56/123456.png", onStored=lambda: stored.append("b"))
+    assert stored == ["a", "a again", "b"]
+    storage.close()
+
+
+def test_on_stored_waits_for_the_fsync(tmp_path):
+    stored = []
+    storage = build_storage(tmp_path, maxBatchFiles=1, fsyncEvery=3)
+    storage.store_file(b"first pic", "ab/cd/ef/abcdef.png", onStored=lambda: stored.append("a"))
+    storage.store_file(b"second pic", "12/34/56/123456.png", onStored=lambda: stored.append("b"))
+    assert stored == []
+
+    storage.close()
+    assert stored == ["a", "b"]
+
+
+def test_failed_append_leaves_the_pic_retryable(tmp_path, monkeypatch):
+    dataStore = get_sqllite_datastore(str(tmp_path))
+    storage = build_storage(tmp_path / "packs", maxBatchFiles=1)
+    scraper = ImageScraper(dataStore, storage, imageMinWidth=10, imageMinHeight=10)
+    dataStore.add_to_visit_pic_urls(["http://h/1.png"])
+    dataStore.claim_pics_to_visit(1, 300, "a")
+
+    def failAppend(pending):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage, "_append", failAppend)
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (90, 140, 200)).save(buffer, format="png")
+    monkeypatch.setattr(scraper, "_get_image", lambda url: (buffer.getvalue(), None))
+    scraper.scrape_url("http://h/1.png")
+
+    # one failed attempt waiting out its backoff, not a visited UNKNOWN_FAILURE
+    assert dataStore.get_pic_attempts("http://h/1.png") == 1
+    assert dataStore.get_next_pic_retry_at() is not None
+    assert list(dataStore.get_stored_pic_hashes()) == []
+    storage.close()
+    dataStore.close()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from data_scraper.page_fetcher import HttpPageFetcher, PageNotHtml, PageTooLarge
+
+PAGE = b"<html><body><a href='/next'>next</a><img src='/a.png'></body></html>"
+
+# path -> (content type, body)
+ROUTES = {
+    "/page": ("text/html; charset=utf-8", PAGE),
+    "/xhtml": ("application/xhtml+xml", PAGE),
+    "/download.zip": ("application/zip", b"PK" + b"\0" * 1024),
+    "/big": ("text/html", b"<html>" + b"x" * 4096 + b"</html>"),
+}
+
+
+class RouteHandler(BaseHTTPRequestHandler):
+    """serves ROUTES, the big page without a length so only the read cap can stop it"""
+
+    def do_GET(self):
+        if self.path not in ROUTES:
+            self.send_error(404)
+            return
+        contentType, body = ROUTES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        if self.path != "/big":
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RouteHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_html_pages_are_read(server):
+    fetcher = HttpPageFetcher(timeout=5)
+    url, content, _ = fetcher.fetch(server + "/page")
+    assert url == server + "/page"
+    assert content == PAGE.decode()
+    _, content, _ = fetcher.fetch(server + "/xhtml")
+    assert content == PAGE.decode()
+
+
+def test_non_html_is_refused_before_the_body(server):
+    with pytest.raises(PageNotHtml) as e:
+        HttpPageFetcher(timeout=5).fetch(server + "/download.zip")
+    assert e.value.contentType == "application/zip"
+
+
+def test_reads_stop_at_the_cap(server):
+    fetcher = HttpPageFetcher(timeout=5, maxContentLength=1024, chunkSize=256)
+    with pytest.raises(PageTooLarge) as e:
+        fetcher.fetch(server + "/big")
+    # cut off within a chunk of the cap, not after the whole page
+    assert e.value.contentLength <= 1024 + 256
+    # an announced length past the cap is refused from the headers alone
+    with pytest.raises(PageTooLarge):
+        HttpPageFetcher(timeout=5, maxContentLength=len(PAGE) - 1).fetch(server + "/page")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from file_storage.s3_filestorage import S3FileStorage
+
+BUCKET = "pics"
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+class Results:
+    """collects the store callbacks, they run on the upload threads"""
+
+    def __init__(self):
+        self.stored = []
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def on_stored(self, path):
+        return lambda: self._add(self.stored, path)
+
+    def on_failed(self, path):
+        return lambda e: self._add(self.failed, (path, e))
+
+    def _add(self, results, item):
+        with self._lock:
+            results.append(item)
+
+
+def test_big_objects_go_up_as_multipart(client):
+    storage = S3FileStorage(
+        BUCKET, client=client, uploadThreads=1, multipartThreshold=5 * MB, multipartChunkSize=5 * MB
+    )
+    results = Results()
+    data = b"\1" * (6 * MB)
+    storage.store_file(data, "big.png", results.on_stored("big.png"))
+    storage.close()
+
+    assert results.stored == ["big.png"]
+    head = client.head_object(Bucket=BUCKET, Key="big.png")
+    assert head["ContentLength"] == len(data)
+    assert head["ContentType"] == "image/png"
+    # multipart etags end in the part count
+    assert head["ETag"].strip('"').endswith("-2")
+
+
+def test_missing_bucket_runs_on_failed(client):
+    storage = S3FileStorage("no-such-bucket", client=client, uploadThreads=1)
+    results = Results()
+    storage.store_file(b"pic", "a.png", results.on_stored("a.png"), results.on_failed("a.png"))
+    storage.close()
+
+    assert results.stored == []
+    assert [path for path, _ in results.failed] == ["a.png"]
+    assert storage.failed == 1
+
+
+def test_concurrent_stores_of_one_key_upload_once(client):
+    storage = S3FileStorage(BUCKET, client=client, uploadThreads=4)
+    uploads = []
+    upload_fileobj = client.upload_fileobj
+
+    def slow_upload(*args, **kwargs):
+        uploads.append(args[2])
+        time.sleep(0.2)
+        return upload_fileobj(*args, **kwargs)
+
+    client.upload_fileobj = slow_upload
+    results = Results()
+    for _ in range(3):
+        storage.store_file(b"pic", "same.png", results.on_stored("same.png"))
+    storage.store_file(b"other", "other.png", results.on_stored("other.png"))
+    storage.close()
+
+    assert sorted(uploads) == ["other.png", "same.png"]
+    # every store still hears the object landed
+    assert sorted(results.stored) == ["other.png", "same.png", "same.png", "same.png"]
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from datasource.sqllite_datasource import get_sqllite_datastore
+
+
+@pytest.fixture
+def dataStore(tmp_path):
+    dataStore = get_sqllite_datastore(str(tmp_path))
+    yield dataStore
+    dataStore.close()
+
+
+def test_claim_leases_urls_to_one_owner(dataStore):
+    urls = ["http://h/1.png", "http://h/2.png", "http://h/3.png"]
+    dataStore.add_to_visit_pic_urls(urls)
+
+    first = dataStore.claim_pics_to_visit(2, 300, "a")
+    second = dataStore.claim_pics_to_visit(10, 300, "b")
+
+    assert len(first) == 2
+    assert sorted(first + second) == urls
+    assert dataStore.claim_pics_to_visit(10, 300, "c") == []
+
+
+def test_expired_lease_is_claimable_again(dataStore):
+    dataStore.add_to_visit_pic_urls(["http://h/1.png"])
+
+    assert dataStore.claim_pics_to_visit(1, -1, "a") == ["http://h/1.png"]
+    assert dataStore.claim_pics_to_visit(1, 300, "b") == ["http://h/1.png"]
+
+
+def test_visited_urls_are_not_claimed(dataStore):
+    dataStore.add_to_visit_pic_urls(["http://h/1.png", "http://h/2.png"])
+    dataStore.add_visited_pic_url("http://h/1.png")
+
+    assert dataStore.claim_pics_to_visit(10, 300, "a") == ["http://h/2.png"]
+
+
+def test_release_leases_only_hands_back_the_owners_unvisited_urls(dataStore):
+    dataStore.add_to_visit_pic_urls(["http://h/1.png", "http://h/2.png", "http://h/3.png"])
+    dataStore.claim_pics_to_visit(2, 300, "a")
+    dataStore.claim_pics_to_visit(1, 300, "b")
+    dataStore.add_visited_pic_url("http://h/1.png")
+
+    assert dataStore.release_leases("a") == 1
+    assert dataStore.claim_pics_to_visit(10, 300, "c") == ["http://h/2.png"]
+
+
+def test_failed_url_waits_out_its_backoff(dataStore):
+    dataStore.add_to_visit_pic_urls(["http://h/1.png"])
+    dataStore.claim_pics_to_visit(1, 300, "a")
+    dataStore.add_failed_pic_url("http://h/1.png", "TIMEOUT", "TIMEOUT", 1, time.time() + 60)
+
+    assert dataStore.claim_pics_to_visit(1, 300, "a") == []
+    assert dataStore.get_pic_attempts("http://h/1.png") == 1
+    assert dataStore.get_next_pic_retry_at() > time.time()
+
+
+def test_reconcile_marks_stored_and_aliased_pics_visited(dataStore):
+    urls = ["http://h/1.png", "http://h/2.png", "http://h/3.png"]
+    dataStore.add_to_visit_pic_urls(urls)
+    dataStore.claim_pics_to_visit(3, 300, "a")
+    dataStore.add_stored_pic_url("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef")
+    dataStore.add_pic_url_alias("http://h/2.png", "abcdef")
+
+    assert dataStore.reconcile_stored_pics() == 2
+    assert dataStore.release_leases("a") == 1
+    assert dataStore.claim_pics_to_visit(10, 300, "b") == ["http://h/3.png"]
+
+
+def test_restored_pic_replaces_its_row(dataStore):
+    dataStore.add_stored_pic_url("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef")
+    dataStore.add_stored_pic_url("http://h/1.png", "12/34/56/123456.png", "123456")
+
+    assert dataStore.get_stored_pic_path("abcdef") is None
+    assert dataStore.get_stored_pic_path("123456") == "12/34/56/123456.png"
+
+
+def test_url_losing_the_store_race_keeps_an_alias(dataStore):
+    urls = ["http://h/1.png", "http://h/2.png"]
+    dataStore.add_to_visit_pic_urls(urls)
+    dataStore.claim_pics_to_visit(2, 300, "a")
+    # two workers stored the same bytes before either saw the other's row
+    dataStore.add_stored_pic_urls(
+        [
+            ("http://h/1.png", "ab/cd/ef/abcdef.png", "abcdef"),
+            ("http://h/2.png", "ab/cd/ef/abcdef.png", "abcdef"),
+        ]
+    )
+
+    assert dataStore.get_stored_pic_path("abcdef") == "ab/cd/ef/abcdef.png"
+    assert dataStore.reconcile_stored_pics() == 2
+    assert dataStore.release_leases("a") == 0
+
+
+def test_start_recrawl_renews_the_frontier_id(dataStore):
+    frontierId = dataStore.get_frontier_id()
+
+    assert dataStore.get_frontier_id() == frontierId
+    dataStore.start_recrawl()
+    assert dataStore.get_frontier_id() != frontierId
+
+
+def test_conns_of_exited_threads_are_closed(dataStore, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def recording_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", recording_connect)
+
+    def read():
+        dataStore.get_next_pic_to_visit()
+
+    for _ in range(3):
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+
+    # each thread opened its own conn, a new thread closes the ones left by exited threads
+    assert len(opened) == 3
+    for conn in opened[:-1]:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1;")
+    # the last thread's stays open until another thread opens one, or close()
+    opened[-1].execute("SELECT 1;")
+    dataStore.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        opened[-1].execute("SELECT 1;")